@@ -49,10 +49,41 @@ const int DARK_ANGLE   = 128; // Position for dark-colored coffee
 unsigned long lastReadyTime = 0;
 const unsigned long READY_INTERVAL = 3000; // milliseconds
 
+//-------------------------------------------------------------------
+// Sequence tags
+//-------------------------------------------------------------------
+// A command may be prefixed with "#<seq> " (e.g. "#12 STEP"). Every reply to
+// that command is then prefixed with the same tag, so the host can match
+// acknowledgements to commands. Untagged commands get untagged replies.
+String replyTag = "";
+
 //-------------------------------------------------------------------
 // Helper Functions
 //-------------------------------------------------------------------
 
+/**
+* @brief Prints one reply line, tagged with the sequence tag of the current command.
+*/
+void reply(const String &msg) {
+  Serial.print(replyTag);
+  Serial.println(msg);
+}
+
+/**
+* @brief Splits an optional "#<seq> " tag off a command and remembers it for the replies.
+*/
+String stripTag(const String &input) {
+  replyTag = "";
+  if (input.startsWith("#")) {
+    int space = input.indexOf(' ');
+    if (space > 0) {
+      replyTag = input.substring(0, space + 1);
+      return input.substring(space + 1);
+    }
+  }
+  return input;
+}
+
 /**
 * @brief Disables the motor driver outputs to reduce heating.
 */
@@ -83,44 +114,48 @@ return input.toInt();
 */
 void processCommand(const String &cmd) {
   if (cmd == CMD_STOP) {
-    Serial.println("Stopping process...");
+    reply("Stopping process...");
     disableMotorDriver();
     systemState = STOPPED;
   }
   else if (cmd == CMD_LOW) {
     sorterServo.write(LOW_ANGLE);
-    Serial.println("Servo set to LOW position.");
+    reply("Servo set to LOW position.");
   }
   else if (cmd == CMD_MEDIUM) {
     sorterServo.write(MEDIUM_ANGLE);
-    Serial.println("Servo set to MEDIUM position.");
+    reply("Servo set to MEDIUM position.");
   }
   else if (cmd == CMD_DARK) {
     sorterServo.write(DARK_ANGLE);
-    Serial.println("Servo set to DARK position.");
+    reply("Servo set to DARK position.");
   }
   else if (cmd == CMD_STEP) {
-    Serial.println("Rotating stepper motor 60° clockwise...");
+    reply("Rotating stepper motor 60° clockwise...");
     stepper.step(stepsPerRevolution / 6);
-    Serial.println("READY");
+    reply("READY");
+  }
+  else if (cmd == CMD_START) {
+    // Already running: confirm readiness so the host can redo its handshake
+    reply("READY");
   }
   else if (cmd == "+") {
     stepper.step(stepsPerRevolution / 18);
+    reply("Rotated +");
   }
   else if (cmd == "-") {
     stepper.step(-1 * stepsPerRevolution / 18);
+    reply("Rotated -");
   }
   else {
     int angle = safeStringToInt(cmd);
     if (angle == -1){
-      Serial.print("Unrecognized command: ");
-      Serial.println(cmd);
+      reply("Unrecognized command: " + cmd);
     }
     else{
       stepper.step(5.75 * angle);
-      Serial.print("Rotating angle : ");
-      Serial.print(angle);
-      
+      // Sent after the move has finished, so it doubles as the completion acknowledgement
+      reply("Rotating angle : " + String(angle));
     }
     
   }
@@ -156,15 +191,16 @@ void setup() {
     if (Serial.available() > 0) {
       String input = Serial.readStringUntil('\n');
       input.trim(); // Remove extraneous whitespace
+      input = stripTag(input);
       if (input == CMD_START) {
         systemState = RUNNING;
-        Serial.println("START command received. System is now running.");
+        reply("START command received. System is now running.");
         // Signal readiness for the first cycle.
-        Serial.println("READY");
+        reply("READY");
         lastReadyTime = millis();
       }
       else if (input == CMD_STOP) {
-        Serial.println("STOP command received during startup. Halting.");
+        reply("STOP command received during startup. Halting.");
         disableMotorDriver();
         systemState = STOPPED;
       }
@@ -181,7 +217,7 @@ void loop() {
   if (Serial.available() > 0) {
     String command = Serial.readStringUntil('\n');
     command.trim();  // Clean up the command string
-    processCommand(command);
+    processCommand(stripTag(command));
   }
   // Serial.println("READY");
   // Minimal delay to yield processor time
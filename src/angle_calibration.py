@@ -0,0 +1,226 @@
+"""
+Calibrated bean alignment: a lookup table from bean position (x in the ROI) to the angle command.
+
+The hand-tuned rule in final.get_adjusted_angle() assumes 6 pixels per command degree everywhere
+in the ROI. The real shift depends on the carousel radius and the camera's perspective, so a
+correction often over- or undershoots. The calibration fits the shift from logged alignment moves:
+with ALIGN_VERIFY_EVERY set, final.py captures the slot again after every n-th angle correction
+and stores where the bean ended up (x_after). The model is
+
+    x_after - x = angle * (gain + gain_slope * (x - target_x))
+
+fitted by least squares with one round of outlier rejection. From it the table holds, for every
+pixel column, the whole-degree command that brings the bean closest to target_x (0 inside the
+dead band, clamped to max_angle, and passed through serial_client.sendable_angle(), so no entry
+is -1, 1 or 2, which the firmware would read as a parse error or a servo command). The dead band is the chute tolerance, widened to twice the
+landing error of a correction when the moves are less precise than that: a smaller correction
+costs a stepper move without reliably improving the position. The hot path is one list index.
+
+Fit from the result store and write models/angle_calibration.json (run from the src folder):
+    python angle_calibration.py bean_log.db
+    python angle_calibration.py bean_log.db --target 215 --tolerance 50 --since 2024-05-01
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+from serial_client import sendable_angle
+from utils.logger import logging
+
+FORMAT_VERSION = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", "angle_calibration.json")
+
+
+class AngleCalibration:
+    """
+    Parameters:
+        lut (list[int]): Angle command per pixel column of the ROI.
+        target_x (float): Column the corrections aim for.
+        dead_band (tuple): (low, high) columns that need no correction.
+        gain, gain_slope (float): Fitted pixels per degree at target_x and their change per pixel.
+        info (dict): Fit statistics, stored with the table for reference.
+    """
+
+    def __init__(self, lut, target_x, dead_band, gain, gain_slope=0.0, info=None):
+        self.lut = [sendable_angle(a) for a in lut]
+        self.target_x = target_x
+        self.dead_band = tuple(dead_band)
+        self.gain = gain
+        self.gain_slope = gain_slope
+        self.info = dict(info or {})
+
+    def angle_for(self, x):
+        """The angle command for a bean centred at column x (positions outside the ROI use the edge)."""
+        return self.lut[min(max(int(x), 0), len(self.lut) - 1)]
+
+    @classmethod
+    def build(cls, width, target_x, gain, gain_slope=0.0, half_band=60.0, max_angle=30, info=None):
+        """Precomputes the table for a fitted model."""
+        low, high = target_x - half_band, target_x + half_band
+        lut = []
+        for x in range(width):
+            g = gain + gain_slope * (x - target_x)
+            if low <= x <= high or abs(g) < 1e-6:
+                lut.append(0)
+                continue
+            angle = int(round((target_x - x) / g))
+            lut.append(sendable_angle(max(-max_angle, min(max_angle, angle))))
+        return cls(lut, target_x, (low, high), gain, gain_slope, info)
+
+    def save(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "target_x": self.target_x,
+                "dead_band": list(self.dead_band),
+                "gain": self.gain,
+                "gain_slope": self.gain_slope,
+                "info": self.info,
+                "lut": self.lut,
+            }, f)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: calibration format {data.get('version')}, expected {FORMAT_VERSION}")
+        return cls(data["lut"], data["target_x"], data["dead_band"], data["gain"], data.get("gain_slope", 0.0),
+                   data.get("info"))
+
+
+def load_moves(db_path, since=None):
+    """Returns (x, angle, x_after) arrays of the verified alignment moves in the result store."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(beans)")}
+        if "x_after" not in columns:
+            return np.empty(0), np.empty(0), np.empty(0)
+        query = "SELECT x, angle, x_after FROM beans WHERE x_after IS NOT NULL AND x IS NOT NULL AND angle != 0"
+        args = ()
+        if since is not None:
+            query += " AND ts >= ?"
+            args = (since,)
+        rows = conn.execute(query, args).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return np.empty(0), np.empty(0), np.empty(0)
+    x, angle, x_after = np.asarray(rows, dtype=float).T
+    return x, np.round(angle), x_after  # the firmware received whole degrees
+
+
+def load_positions(db_path, since=None):
+    """Returns the x of every located bean (for the before/after move counts)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        query, args = "SELECT x FROM beans WHERE x IS NOT NULL", ()
+        if since is not None:
+            query, args = query + " AND ts >= ?", (since,)
+        return np.asarray([r[0] for r in conn.execute(query, args)], dtype=float)
+    finally:
+        conn.close()
+
+
+def fit_gain(x, angle, x_after, target_x, fit_slope=True):
+    """
+    Least-squares fit of x_after - x = angle * (gain + gain_slope * (x - target_x)).
+
+    Moves with a residual above 3.5 robust standard deviations (missed detections, a bean that
+    slid) are dropped and the fit is repeated once.
+
+    Returns:
+        (gain, gain_slope, residual_std, used): used is the number of moves in the final fit.
+    """
+    shift = x_after - x
+    keep = np.ones(len(x), dtype=bool)
+    # The slope needs moves spread over the ROI, otherwise it only fits noise
+    fit_slope = fit_slope and len(x) >= 20 and np.ptp(x) > 100
+    for _ in range(2):
+        design = np.stack([angle, angle * (x - target_x)], axis=1) if fit_slope else angle[:, None]
+        coef, *_ = np.linalg.lstsq(design[keep], shift[keep], rcond=None)
+        residual = shift - design @ coef
+        mad = np.median(np.abs(residual[keep] - np.median(residual[keep])))
+        keep = np.abs(residual) <= max(3.5 * 1.4826 * mad, 1.0)
+    gain, gain_slope = (float(coef[0]), float(coef[1])) if fit_slope else (float(coef[0]), 0.0)
+    return gain, gain_slope, float(np.std(residual[keep])), int(keep.sum())
+
+
+def linear_rule(x, dead_band=(150, 270), center=220, pixels_per_degree=6, max_angle=30):
+    """The hand-tuned rule of final.get_adjusted_angle(), as sent to the firmware (whole degrees)."""
+    if dead_band[0] <= x <= dead_band[1]:
+        return 0
+    return sendable_angle(max(-max_angle, min(max_angle, -(x - center) / pixels_per_degree)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the bean alignment table from verified alignment moves")
+    parser.add_argument("db", nargs="?", default="bean_log.db", help="result store (default: %(default)s)")
+    parser.add_argument("--out", default=DEFAULT_PATH, help="calibration file (default: %(default)s)")
+    parser.add_argument("--width", type=int, help="ROI width in pixels (default: CROP_BOX x2 - x1 from sorter.yaml)")
+    parser.add_argument("--target", type=float, default=220, help="column the corrections aim for")
+    parser.add_argument("--tolerance", type=float, default=60,
+                        help="half-width of the chute's acceptance window in pixels")
+    parser.add_argument("--max-angle", type=int, default=30)
+    parser.add_argument("--min-moves", type=int, default=30, help="refuse to fit from fewer verified moves")
+    parser.add_argument("--since", help="only use beans logged on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--no-slope", action="store_true", help="fit one gain for the whole ROI")
+    args = parser.parse_args()
+
+    if args.width is None:
+        import final
+        final.load_config(watch=False)
+        args.width = final.CROP_BOX[3] - final.CROP_BOX[2]
+
+    since = time.mktime(time.strptime(args.since, "%Y-%m-%d")) if args.since else None
+    x, angle, x_after = load_moves(args.db, since)
+    if len(x) < args.min_moves:
+        raise SystemExit(f"Only {len(x)} verified alignment move(s) in {args.db}, need {args.min_moves}. "
+                         f"Run final.py with ALIGN_VERIFY_EVERY set (e.g. 1) for a while first.")
+
+    gain, gain_slope, residual_std, used = fit_gain(x, angle, x_after, args.target, not args.no_slope)
+    if gain <= 0:
+        raise SystemExit(f"Fitted gain {gain:.2f} px/degree: the moves do not shift beans towards the target")
+    landing = x_after - args.target
+    half_band = max(args.tolerance, 2 * residual_std)
+    info = {
+        "moves": len(x),
+        "used": used,
+        "residual_std": residual_std,
+        "old_landing_error": float(np.sqrt(np.mean(landing ** 2))),
+        "fitted": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "db": os.path.abspath(args.db),
+    }
+    calibration = AngleCalibration.build(args.width, args.target, gain, gain_slope, half_band, args.max_angle, info)
+
+    # What the table changes, on the positions actually seen
+    positions = load_positions(args.db, since)
+    old_moves = sum(1 for p in positions if linear_rule(p) != 0)
+    new_moves = sum(1 for p in positions if calibration.angle_for(p) != 0)
+    # Landing error of the beans the table still corrects: as logged, and as predicted by the fit
+    new_angle = np.asarray([calibration.angle_for(p) for p in x])
+    corrected = new_angle != 0
+    predicted = x + new_angle * (gain + gain_slope * (x - args.target))
+
+    print(f"Verified moves: {len(x)} ({used} after outlier rejection)")
+    print(f"Gain: {gain:.2f} px/degree at x={args.target:g}, {gain_slope:+.4f} per pixel "
+          f"(the old rule assumes 6.00); move residual {residual_std:.1f} px")
+    print(f"Dead band: {calibration.dead_band[0]:.0f}-{calibration.dead_band[1]:.0f} "
+          f"(old 150-270; tolerance {args.tolerance:g}, 2x residual {2 * residual_std:.1f})")
+    if corrected.any():
+        print(f"Landing error of {corrected.sum()} corrections: "
+              f"{np.sqrt(np.mean(landing[corrected] ** 2)):.1f} px RMS as logged, "
+              f"about {np.sqrt(np.mean((predicted[corrected] - args.target) ** 2)):.1f} px with the table")
+    if len(positions):
+        print(f"Alignment moves on {len(positions)} logged beans: {old_moves} with the old rule, "
+              f"{new_moves} with the table")
+    calibration.save(args.out)
+    print(f"Saved {args.out}")
+    logging.info(f"Angle calibration saved to {args.out}: gain {gain:.2f}, dead band {calibration.dead_band}")
+
+
+if __name__ == "__main__":
+    main()
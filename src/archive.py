@@ -0,0 +1,277 @@
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+from utils.logger import logging
+
+INDEX_FILE = "index.jsonl"
+# Evicted images whose index entries are tolerated before the index is rewritten without them
+INDEX_COMPACT_AFTER = 200
+
+
+class ArchiveWriter:
+    """
+    Writes processed images (crops, annotations) to disk on a worker thread.
+
+    The control loop only hands over a reference to the image; JPEG encoding, directory creation
+    and file writes happen in the background. The queue is bounded: when the disk cannot keep up,
+    new images are dropped instead of stalling the sort cycle.
+
+    Every written image gets a line in INDEX_FILE. With a quota the index counts against it, and the
+    entries of evicted images are removed from it (in batches of INDEX_COMPACT_AFTER). The quota can
+    be changed while the writer runs; switching it on rescans the archive before the next write.
+
+    Parameters:
+        root (str): Archive root folder (sub-folders such as "boxes" are created inside it).
+        max_queue (int): Maximum number of images waiting to be written.
+        sample_rates (dict): Fraction (0..1) of images to keep per bean class; classes not listed use default_rate.
+        default_rate (float): Sampling rate for classes missing from sample_rates (and for images without a class).
+        quota_bytes (int): Disk quota for the archive; the oldest files are deleted once it is exceeded (None = unlimited).
+        jpeg_quality (int): JPEG quality used for encoding.
+    """
+
+    def __init__(self, root="processed_images", max_queue=32, sample_rates=None, default_rate=1.0,
+                 quota_bytes=None, jpeg_quality=90):
+        self.root = os.path.abspath(root)
+        self.sample_rates = dict(sample_rates or {})
+        self.default_rate = default_rate
+        self.jpeg_quality = jpeg_quality
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._sample_acc = {}
+        self._lock = threading.Lock()  # sampling state, counters and the quota
+        self._quota_bytes = quota_bytes
+        self._rescan = False      # the quota was switched on: _files and bytes_used are out of date
+        self._stale = set()       # index paths of evicted images
+        self._files = []          # (mtime, path, size), oldest first
+        self._known_dirs = set()
+        self.bytes_used = 0
+        self.index_bytes = 0
+
+        # Counters
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0          # queue full
+        self.sampled_out = 0      # skipped by the per-class sampling rate
+        self.evicted = 0
+        self.index_compactions = 0
+        self.write_errors = 0
+
+    @property
+    def quota_bytes(self):
+        return self._quota_bytes
+
+    @quota_bytes.setter
+    def quota_bytes(self, quota_bytes):
+        with self._lock:
+            if self._quota_bytes is None and quota_bytes is not None and self._thread is not None:
+                self._rescan = True  # files written without a quota are not in _files yet
+            self._quota_bytes = quota_bytes
+
+    def start(self):
+        """Indexes the existing archive (for the quota) and starts the writer thread."""
+        if self._thread is not None:
+            return self
+        if self.quota_bytes is not None:
+            self._scan_existing()
+            self._compact_index(check_files=True)
+        self._thread = threading.Thread(target=self._run, name="archive-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Writes what is still queued (up to timeout seconds) and stops the writer thread."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def keep(self, bean_class):
+        """
+        Deterministic per-class sampling: a rate of 0.25 keeps every 4th bean of that class.
+
+        Call it once per bean and pass the result to submit() for each of the bean's images, so a
+        bean is archived completely (crop and annotated frame) or not at all.
+        """
+        rate = self.sample_rates.get(bean_class, self.default_rate)
+        if rate >= 1:
+            return True
+        with self._lock:
+            acc = self._sample_acc.get(bean_class, 0.0) + rate
+            if acc >= 1:
+                self._sample_acc[bean_class] = acc - 1
+                return True
+            self._sample_acc[bean_class] = acc
+            return False
+
+    def submit(self, folder, image, filename=None, bean_class=None, metadata=None, keep=None):
+        """
+        Queues an image for writing. Never blocks.
+
+        The image must not be modified after it has been submitted.
+
+        Parameters:
+            folder (str): Sub-folder of the archive root (e.g. "boxes").
+            image (numpy.ndarray): BGR image.
+            filename (str): File name; defaults to "<folder>_<ms timestamp>.jpg".
+            bean_class (int): Class used for sampling and recorded in the index.
+            metadata (dict): Extra JSON-serialisable fields for the archive index.
+            keep (bool): The sampling decision from keep() for the bean this image belongs to
+                         (None: sample this image on its own).
+
+        Returns:
+            True if the image was queued, False if it was sampled out or dropped.
+        """
+        if keep is None:
+            keep = self.keep(bean_class)
+        with self._lock:
+            self.submitted += 1
+            if not keep:
+                self.sampled_out += 1
+                return False
+        timestamp = time.time()
+        if filename is None:
+            filename = f"{folder}_{int(timestamp * 1000)}.jpg"
+        try:
+            self._queue.put_nowait((folder, filename, image, bean_class, metadata, timestamp))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                with self._lock:
+                    self.write_errors += 1
+                logging.error(f"Error writing archive image: {e}")
+
+    def _write(self, folder, filename, image, bean_class, metadata, timestamp):
+        folder_path = os.path.join(self.root, folder)
+        if folder_path not in self._known_dirs:
+            os.makedirs(folder_path, exist_ok=True)
+            self._known_dirs.add(folder_path)
+
+        ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError(f"could not encode {filename}")
+        path = os.path.join(folder_path, filename)
+        with open(path, "wb") as f:
+            f.write(buf.tobytes())
+
+        record = {"path": os.path.relpath(path, self.root), "timestamp": timestamp, "class": bean_class}
+        if metadata:
+            record.update(metadata)
+        line = json.dumps(record) + "\n"
+        with open(os.path.join(self.root, INDEX_FILE), "a") as f:
+            f.write(line)
+        self.index_bytes += len(line.encode("utf-8"))
+
+        with self._lock:
+            self.written += 1
+            quota_bytes, rescan, self._rescan = self._quota_bytes, self._rescan, False
+        if quota_bytes is None:
+            return
+        if rescan:
+            self._scan_existing()  # finds the image just written as well
+            self._compact_index(check_files=True)
+        else:
+            self._files.append((timestamp, path, len(buf)))
+            self.bytes_used += len(buf)
+        self._evict(quota_bytes)
+
+    def _scan_existing(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.lower().endswith(".jpg"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, path, st.st_size))
+        files.sort()
+        self._files = files
+        self.bytes_used = sum(size for _, _, size in files)
+
+    def _compact_index(self, check_files=False):
+        """Rewrites the index without the entries of evicted (or, with check_files, missing) images."""
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            self._stale.clear()
+            return
+        tmp = path + ".tmp"
+        with open(path) as src, open(tmp, "w") as dst:
+            for line in src:
+                try:
+                    rel = json.loads(line).get("path")
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if rel in self._stale or (check_files and not os.path.exists(os.path.join(self.root, rel))):
+                    continue
+                dst.write(line)
+        os.replace(tmp, path)
+        self._stale.clear()
+        self.index_bytes = os.path.getsize(path)
+        self.index_compactions += 1
+
+    def _evict(self, quota_bytes):
+        """
+        Deletes the oldest archived images until the archive (images and index) fits in the quota.
+        Images that cannot be deleted stay counted and are tried again on the next eviction.
+        """
+        i, failed = 0, []
+        while self.bytes_used + self.index_bytes > quota_bytes and i < len(self._files):
+            entry = self._files[i]
+            _, path, size = entry
+            i += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # already gone, so no longer on the disk either
+            except OSError as e:
+                logging.error(f"Could not evict archived image {path}: {e}")
+                failed.append(entry)
+                continue
+            self.bytes_used -= size
+            with self._lock:
+                self.evicted += 1
+            self._stale.add(os.path.relpath(path, self.root))
+        if i:
+            self._files[:i] = failed
+        if len(self._stale) >= INDEX_COMPACT_AFTER:
+            self._compact_index()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """Returns a snapshot of the writer counters."""
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth(),
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "sampled_out": self.sampled_out,
+                "evicted": self.evicted,
+                "write_errors": self.write_errors,
+                "bytes_used": self.bytes_used,
+                "index_bytes": self.index_bytes,
+                "index_compactions": self.index_compactions,
+            }
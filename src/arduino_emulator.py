@@ -0,0 +1,256 @@
+"""
+Software stand-in for hardware/enhanced_arduino.ino on a Linux pseudo-terminal.
+
+It accepts the same commands (START/STOP/STEP, servo classes 0/1/2, signed angles, +/-, optional
+"#<seq> " tags) and answers with the same strings. Stepper moves take as long as they would on the
+28BYJ-48 at the firmware's speed, so the host loop can be run and timed without the machine.
+
+Run from the src folder:
+    python arduino_emulator.py                # prints the pty path to use as SERIAL_PORT
+    python final.py --port /dev/pts/N --camera <video file>
+"""
+import argparse
+import errno
+import os
+import select
+import threading
+import time
+import tty
+from utils.logger import logging
+
+STEPS_PER_REVOLUTION = 2048
+STEPPER_RPM = 17
+SERVO_ANGLES = {"0": ("LOW", 55), "1": ("MEDIUM", 90), "2": ("DARK", 128)}
+
+
+def arduino_to_int(text):
+    """Mimics the firmware's safeStringToInt(): digits and '-' only, parsed like String.toInt()."""
+    if any(not (c.isdigit() or c == '-') for c in text):
+        return -1
+    sign, digits, i = 1, "", 0
+    if text.startswith('-'):
+        sign, i = -1, 1
+    while i < len(text) and text[i].isdigit():
+        digits += text[i]
+        i += 1
+    return sign * int(digits) if digits else 0
+
+
+class ArduinoEmulator:
+    """
+    Emulates the sorter firmware on a pty.
+
+    Parameters:
+        rpm (float): Stepper speed (stepper.setSpeed in the firmware).
+        steps_per_revolution (int): Stepper steps per revolution.
+        servo_time (float): Time the servo needs to reach a new position (seconds). The firmware does not
+                            wait for it, so neither does the emulator, but a STEP that starts while the servo
+                            is still moving is counted in servo_not_settled.
+        baudrate (int): Serial speed used to delay replies like the real link (0 disables it).
+        time_scale (float): Multiplies every delay (e.g. 0.1 runs ten times faster).
+        boot_time (float): Time before the firmware starts listening, like the reset after the port opens.
+        waiting_interval (float): How often "Waiting for 'START' signal..." is repeated before START.
+    """
+
+    def __init__(self, rpm=STEPPER_RPM, steps_per_revolution=STEPS_PER_REVOLUTION, servo_time=0.15,
+                 baudrate=9600, time_scale=1.0, boot_time=0.0, waiting_interval=1.0):
+        self.rpm = rpm
+        self.steps_per_revolution = steps_per_revolution
+        self.servo_time = servo_time
+        self.baudrate = baudrate
+        self.time_scale = time_scale
+        self.boot_time = boot_time
+        self.waiting_interval = waiting_interval
+
+        self.master_fd = None
+        self.slave_fd = None
+        self.port = None
+        self._thread = None
+        self._running = False
+        self._reply_tag = ""
+
+        self.state = "WAITING_FOR_START"
+        self.servo = "MEDIUM"
+        self._servo_busy_until = 0.0
+        self.position_steps = 0
+
+        # Counters
+        self.commands = 0
+        self.steps_moved = 0
+        self.busy_time = 0.0
+        self.servo_not_settled = 0
+        self.unrecognized = 0
+
+    def start(self):
+        """Creates the pty and starts the firmware thread. Returns the port path for the host."""
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        tty.setraw(self.master_fd)
+        os.set_blocking(self.master_fd, False)
+        self.port = os.ttyname(self.slave_fd)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="arduino-emulator", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master_fd = self.slave_fd = None
+
+    def _sleep(self, seconds):
+        if seconds > 0 and self.time_scale > 0:
+            time.sleep(seconds * self.time_scale)
+
+    def _println(self, text):
+        data = (self._reply_tag + text + "\r\n").encode('utf-8')
+        if self.baudrate:
+            self._sleep(len(data) * 10 / self.baudrate)
+        try:
+            os.write(self.master_fd, data)
+        except OSError as e:
+            # Nobody is reading and the pty buffer is full: drop the output like a real USB serial buffer
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EIO):
+                raise
+
+    def _step(self, steps):
+        """Blocks like Stepper.step() for the time the move takes at the configured speed."""
+        steps = int(steps)
+        if time.time() < self._servo_busy_until:
+            self.servo_not_settled += 1
+        duration = abs(steps) * 60.0 / (self.rpm * self.steps_per_revolution)
+        self._sleep(duration)
+        self.busy_time += duration
+        self.steps_moved += abs(steps)
+        self.position_steps += steps
+
+    def _strip_tag(self, text):
+        self._reply_tag = ""
+        if text.startswith("#"):
+            space = text.find(" ")
+            if space > 0:
+                self._reply_tag = text[:space + 1]
+                return text[space + 1:]
+        return text
+
+    def _lines(self):
+        """Yields complete command lines from the host (None every poll interval while idle)."""
+        buf = b""
+        while self._running:
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                yield None
+                continue
+            try:
+                chunk = os.read(self.master_fd, 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    continue
+                if e.errno == errno.EIO:  # host side closed; wait for it to reopen
+                    time.sleep(0.05)
+                    continue
+                raise
+            buf += chunk
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                yield line.decode('utf-8', errors='replace').strip()
+
+    def _run(self):
+        self._sleep(self.boot_time)
+        self._println("Servo to neutral postion")
+        self._println("Waiting for 'START' signal...")
+        last_waiting = time.time()
+        for line in self._lines():
+            if self.state == "WAITING_FOR_START":
+                if line is None:
+                    if time.time() - last_waiting >= self.waiting_interval:
+                        self._reply_tag = ""
+                        self._println("Waiting for 'START' signal...")
+                        last_waiting = time.time()
+                    continue
+                command = self._strip_tag(line)
+                if command == "START":
+                    self.state = "RUNNING"
+                    self._println("START command received. System is now running.")
+                    self._println("READY")
+                elif command == "STOP":
+                    self._println("STOP command received during startup. Halting.")
+                    self.state = "STOPPED"
+                continue
+            if line is not None:
+                self.process_command(self._strip_tag(line))
+
+    def process_command(self, cmd):
+        """Handles one command exactly like processCommand() in enhanced_arduino.ino."""
+        self.commands += 1
+        if cmd == "STOP":
+            self._println("Stopping process...")
+            self.state = "STOPPED"
+        elif cmd in SERVO_ANGLES:
+            name, _ = SERVO_ANGLES[cmd]
+            if name != self.servo:
+                self._servo_busy_until = time.time() + self.servo_time * self.time_scale
+            self.servo = name
+            self._println(f"Servo set to {name} position.")
+        elif cmd == "STEP":
+            self._println("Rotating stepper motor 60° clockwise...")
+            self._step(self.steps_per_revolution // 6)
+            self._println("READY")
+        elif cmd == "START":
+            self._println("READY")
+        elif cmd == "+":
+            self._step(self.steps_per_revolution // 18)
+            self._println("Rotated +")
+        elif cmd == "-":
+            self._step(-(self.steps_per_revolution // 18))
+            self._println("Rotated -")
+        else:
+            angle = arduino_to_int(cmd)
+            if angle == -1:
+                self.unrecognized += 1
+                self._println(f"Unrecognized command: {cmd}")
+            else:
+                self._step(5.75 * angle)
+                self._println(f"Rotating angle : {angle}")
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "commands": self.commands,
+            "steps_moved": self.steps_moved,
+            "position_steps": self.position_steps,
+            "busy_time": self.busy_time,
+            "servo": self.servo,
+            "servo_not_settled": self.servo_not_settled,
+            "unrecognized": self.unrecognized,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arduino sorter firmware emulator on a pty")
+    parser.add_argument("--rpm", type=float, default=STEPPER_RPM)
+    parser.add_argument("--servo-time", type=float, default=0.15)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--boot-time", type=float, default=0.0)
+    args = parser.parse_args()
+
+    emulator = ArduinoEmulator(rpm=args.rpm, servo_time=args.servo_time, time_scale=args.time_scale,
+                               boot_time=args.boot_time)
+    port = emulator.start()
+    print(f"Arduino emulator listening on {port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            logging.info(f"Emulator stats: {emulator.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+        print(emulator.stats())
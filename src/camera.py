@@ -0,0 +1,450 @@
+"""
+Camera capture backends.
+
+Every backend returns the bean ROI (roi = (y1, y2, x1, x2) of the full frame) from
+read(timeout, newer_than, same_slot) -> (ret, frame) and reports its decode time in stats().
+same_slot marks a second look at the slot of the previous read (burst votes, alignment checks);
+only the file backend needs it, the live cameras see the same slot until the carousel moves.
+
+
+    stream    FrameGrabber: keeps the MJPEG/video stream open and holds the newest frame.
+    snapshot  SnapshotCamera: fetches one JPEG from the still endpoint per read, optionally
+              decoded at reduced resolution.
+    file      FileCamera: images from a folder or frames from a video file, for testing.
+
+miscellaneous/fake_ipcam.py serves both phone endpoints locally, so the backends can be compared
+without the phone (python -m miscellaneous.bench_capture).
+"""
+import glob
+import http.client
+import os
+import threading
+import time
+import urllib.parse
+import cv2
+import numpy as np
+from utils.logger import logging
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# cv2.imdecode flags for decoding a JPEG at 1/n resolution (libjpeg DCT scaling)
+REDUCED_DECODE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                        4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def crop(frame, roi):
+    """Returns a view of frame cut to roi = (y1, y2, x1, x2), or frame itself if roi is None."""
+    if roi is None:
+        return frame
+    y1, y2, x1, x2 = roi
+    return frame[y1:y2, x1:x2]
+
+
+class FrameGrabber:
+    """
+    Keeps a single camera stream open and holds on to the newest decoded frame.
+
+    A daemon thread reads the stream continuously, so the network/decoder buffer never
+    fills up with old frames and callers always get the most recent image without paying
+    the connect/probe/keyframe cost of opening a new VideoCapture.
+
+    Parameters:
+        url (str): Stream URL (e.g. the IP Webcam MJPEG endpoint).
+        roi (tuple): (y1, y2, x1, x2) region returned by read(); None returns the full frame.
+        api_preference (int): OpenCV capture backend.
+        stale_after (float): A frame older than this (seconds) is treated as stale.
+        reconnect_after (float): Reopen the stream if no frame arrived for this long (seconds).
+        reconnect_delay (float): Pause between failed reconnect attempts (seconds).
+    """
+
+    def __init__(self, url, roi=None, api_preference=cv2.CAP_FFMPEG, stale_after=0.5,
+                 reconnect_after=3.0, reconnect_delay=1.0):
+        self.url = url
+        self.roi = roi
+        self.api_preference = api_preference
+        self.stale_after = stale_after
+        self.reconnect_after = reconnect_after
+        self.reconnect_delay = reconnect_delay
+
+        self._cap = None
+        self._thread = None
+        self._running = False
+        self._reconnect_requested = False
+        self._cond = threading.Condition()
+
+        self._frame = None
+        self._frame_time = 0.0
+        self._frame_id = 0
+        self._consumed_id = 0
+
+        # Counters
+        self.frames_grabbed = 0
+        self.frames_dropped = 0      # decoded but replaced before anyone read them
+        self.stale_reads = 0         # read() calls that could not get a fresh frame
+        self.read_failures = 0       # cap.read() returned no frame
+        self.reconnects = 0
+        self.last_decode_time = 0.0
+        self._total_decode_time = 0.0
+        self.last_capture_latency = 0.0
+        self.max_capture_latency = 0.0
+        self._total_capture_latency = 0.0
+        self._captures = 0
+
+    def start(self):
+        """Starts the background grabber thread (idempotent)."""
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the grabber thread and releases the stream."""
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._release()
+
+    def request_reconnect(self):
+        """Asks the grabber thread to reopen the stream on its next iteration."""
+        self._reconnect_requested = True
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.url, self.api_preference)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        # Ask the backend to keep as few frames buffered as possible (ignored by some backends)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _release(self):
+        if self._cap is not None:
+            try:
+                self._cap.release()
+            except Exception:
+                pass
+            self._cap = None
+
+    def _run(self):
+        while self._running:
+            if self._cap is None or self._reconnect_requested:
+                self._reconnect_requested = False
+                self._release()
+                self._cap = self._open()
+                if self._cap is None:
+                    logging.error(f"Could not open camera stream {self.url}, retrying in {self.reconnect_delay}s")
+                    time.sleep(self.reconnect_delay)
+                    continue
+                self.reconnects += 1
+                logging.info(f"Camera stream opened: {self.url}")
+
+            start = time.perf_counter()
+            ret, frame = self._cap.read()
+            decode_time = time.perf_counter() - start
+            if not ret or frame is None:
+                self.read_failures += 1
+                logging.error("Camera stream returned no frame, reconnecting...")
+                self._release()
+                time.sleep(self.reconnect_delay)
+                continue
+
+            with self._cond:
+                if self._frame_id > self._consumed_id:
+                    self.frames_dropped += 1
+                self._frame = frame
+                self._frame_time = time.time()
+                self._frame_id += 1
+                self.frames_grabbed += 1
+                self.last_decode_time = decode_time
+                self._total_decode_time += decode_time
+                self._cond.notify_all()
+        self._release()
+
+    def read(self, timeout=2.0, newer_than=None, same_slot=False):
+        """
+        Returns the newest frame.
+
+        Parameters:
+            timeout (float): How long to wait for a fresh frame (seconds).
+            newer_than (float): Optional wall-clock timestamp; only frames captured after it are accepted
+                                (e.g. the moment the carousel stopped).
+
+        Returns:
+            (ret, frame): ret is False if no fresh frame arrived within the timeout.
+        """
+        start = time.perf_counter()
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                now = time.time()
+                fresh = (self._frame is not None
+                         and now - self._frame_time <= self.stale_after
+                         and (newer_than is None or self._frame_time > newer_than))
+                if fresh or now >= deadline or not self._running:
+                    break
+                self._cond.wait(deadline - now)
+            if fresh:
+                frame = self._frame
+                self._consumed_id = self._frame_id
+            else:
+                frame = None
+            frame_age = time.time() - self._frame_time if self._frame is not None else None
+
+        latency = time.perf_counter() - start
+        self.last_capture_latency = latency
+        self.max_capture_latency = max(self.max_capture_latency, latency)
+        self._total_capture_latency += latency
+        self._captures += 1
+
+        if frame is None:
+            self.stale_reads += 1
+            logging.error(f"No fresh camera frame within {timeout}s (last frame age: {frame_age})")
+            if frame_age is None or frame_age > self.reconnect_after:
+                self.request_reconnect()
+            return False, None
+        return True, crop(frame, self.roi)
+
+    def stats(self):
+        """Returns a snapshot of the grabber counters."""
+        return {
+            "backend": "stream",
+            "frames_grabbed": self.frames_grabbed,
+            "frames_dropped": self.frames_dropped,
+            "stale_reads": self.stale_reads,
+            "read_failures": self.read_failures,
+            "reconnects": self.reconnects,
+            "last_decode_time": self.last_decode_time,
+            "avg_decode_time": self._total_decode_time / self.frames_grabbed if self.frames_grabbed else 0.0,
+            "last_capture_latency": self.last_capture_latency,
+            "max_capture_latency": self.max_capture_latency,
+            "avg_capture_latency": self._total_capture_latency / self._captures if self._captures else 0.0,
+        }
+
+
+class SnapshotCamera:
+    """
+    Fetches a single JPEG from the camera's still endpoint on every read (IP Webcam: /shot.jpg).
+
+    Nothing is transferred or decoded between captures, and the HTTP connection is kept alive.
+    With decode_scale > 1 the JPEG is decoded at 1/decode_scale resolution, which skips most of
+    the IDCT work; the ROI is cut from the reduced image and scaled back up to its full size, so
+    callers get the same shape and pixel coordinates (with less detail) either way.
+
+    Parameters:
+        url (str): Snapshot URL, e.g. http://192.168.1.11:8080/shot.jpg
+        roi (tuple): (y1, y2, x1, x2) region of the full-resolution frame; None returns the full frame.
+        decode_scale (int): 1, 2, 4 or 8.
+        retries (int): Extra attempts (with a fresh connection) when a request fails.
+    """
+
+    def __init__(self, url, roi=None, decode_scale=1, retries=1):
+        if decode_scale not in REDUCED_DECODE_FLAGS:
+            raise ValueError(f"decode_scale must be one of {sorted(REDUCED_DECODE_FLAGS)}, got {decode_scale}")
+        self.url = url
+        self.roi = roi
+        self.decode_scale = decode_scale
+        self.retries = retries
+        parts = urllib.parse.urlsplit(url)
+        self._https = parts.scheme == "https"
+        self._host = parts.netloc
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self._conn = None
+
+        # Counters
+        self.frames_grabbed = 0
+        self.read_failures = 0
+        self.reconnects = 0
+        self.bytes_received = 0
+        self.last_fetch_time = 0.0
+        self.last_decode_time = 0.0
+        self._total_fetch_time = 0.0
+        self._total_decode_time = 0.0
+
+    def start(self):
+        return self
+
+    def stop(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _fetch(self, timeout):
+        if self._conn is None:
+            connection = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            self._conn = connection(self._host, timeout=timeout)
+            self.reconnects += 1
+        self._conn.timeout = timeout
+        self._conn.request("GET", self._path)
+        response = self._conn.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise IOError(f"HTTP {response.status} from {self.url}")
+        return data
+
+    def decode(self, data):
+        """Decodes a JPEG buffer to the ROI at full-resolution coordinates."""
+        s = self.decode_scale
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_DECODE_FLAGS[s])
+        if image is None or s == 1:
+            return image if image is None else crop(image, self.roi)
+        if self.roi is None:
+            return cv2.resize(image, (image.shape[1] * s, image.shape[0] * s), interpolation=cv2.INTER_LINEAR)
+        y1, y2, x1, x2 = self.roi
+        reduced = image[y1 // s:-(-y2 // s), x1 // s:-(-x2 // s)]
+        scaled = cv2.resize(reduced, (reduced.shape[1] * s, reduced.shape[0] * s), interpolation=cv2.INTER_LINEAR)
+        oy, ox = y1 - y1 // s * s, x1 - x1 // s * s
+        return scaled[oy:oy + y2 - y1, ox:ox + x2 - x1]
+
+    def read(self, timeout=2.0, newer_than=None, same_slot=False):
+        """
+        Requests a new snapshot. The picture is taken after the request is sent, so it is always
+        newer than newer_than (a time.time() value in the past).
+
+        Returns:
+            (ret, frame): ret is False if the camera did not answer or the image could not be decoded.
+        """
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                data = self._fetch(timeout)
+            except (OSError, http.client.HTTPException) as e:
+                logging.error(f"Snapshot request to {self.url} failed (attempt {attempt + 1}): {e}")
+                self.stop()  # reconnect on the next attempt
+                continue
+            self.last_fetch_time = time.perf_counter() - start
+            self._total_fetch_time += self.last_fetch_time
+            self.bytes_received += len(data)
+
+            start = time.perf_counter()
+            frame = self.decode(data)
+            self.last_decode_time = time.perf_counter() - start
+            if frame is None:
+                logging.error(f"Could not decode snapshot from {self.url} ({len(data)} bytes)")
+                continue
+            self._total_decode_time += self.last_decode_time
+            self.frames_grabbed += 1
+            return True, frame
+        self.read_failures += 1
+        return False, None
+
+    def stats(self):
+        n = self.frames_grabbed
+        return {
+            "backend": "snapshot",
+            "decode_scale": self.decode_scale,
+            "frames_grabbed": n,
+            "read_failures": self.read_failures,
+            "reconnects": self.reconnects,
+            "bytes_received": self.bytes_received,
+            "last_fetch_time": self.last_fetch_time,
+            "avg_fetch_time": self._total_fetch_time / n if n else 0.0,
+            "last_decode_time": self.last_decode_time,
+            "avg_decode_time": self._total_decode_time / n if n else 0.0,
+        }
+
+
+class FileCamera:
+    """
+    Plays back a folder of images or a video file, one frame per read (for tests and bench runs).
+    Every image is a different slot, so a same_slot read serves the previous frame again instead of
+    the next bean.
+
+    Parameters:
+        source (str): Folder of images or a video file.
+        roi (tuple): (y1, y2, x1, x2) region to return; None if the files already are ROI crops.
+        loop (bool): Start over at the end instead of failing.
+    """
+
+    def __init__(self, source, roi=None, loop=True):
+        self.source = source
+        self.roi = roi
+        self.loop = loop
+        self._paths = None
+        self._index = 0
+        self._cap = None
+        self._frame = None
+
+        # Counters
+        self.frames_grabbed = 0
+        self.read_failures = 0
+        self.last_decode_time = 0.0
+        self._total_decode_time = 0.0
+
+    def start(self):
+        if os.path.isdir(self.source):
+            self._paths = sorted(p for p in glob.glob(os.path.join(self.source, "**", "*"), recursive=True)
+                                 if p.lower().endswith(IMAGE_EXTENSIONS))
+            if not self._paths:
+                raise FileNotFoundError(f"No images in {self.source}")
+        else:
+            self._cap = cv2.VideoCapture(self.source)
+            if not self._cap.isOpened():
+                raise FileNotFoundError(f"Could not open video {self.source}")
+        return self
+
+    def stop(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def _next_frame(self):
+        if self._paths is not None:
+            if self._index >= len(self._paths):
+                if not self.loop:
+                    return None
+                self._index = 0
+            frame = cv2.imread(self._paths[self._index])
+            self._index += 1
+            return frame
+        ret, frame = self._cap.read()
+        if not ret and self.loop:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._cap.read()
+        return frame if ret else None
+
+    def read(self, timeout=2.0, newer_than=None, same_slot=False):
+        if same_slot and self._frame is not None:
+            return True, crop(self._frame, self.roi)
+        start = time.perf_counter()
+        frame = self._next_frame()
+        self.last_decode_time = time.perf_counter() - start
+        if frame is None:
+            self.read_failures += 1
+            return False, None
+        self._frame = frame
+        self._total_decode_time += self.last_decode_time
+        self.frames_grabbed += 1
+        return True, crop(frame, self.roi)
+
+    def stats(self):
+        n = self.frames_grabbed
+        return {
+            "backend": "file",
+            "frames_grabbed": n,
+            "read_failures": self.read_failures,
+            "last_decode_time": self.last_decode_time,
+            "avg_decode_time": self._total_decode_time / n if n else 0.0,
+        }
+
+
+CAMERA_BACKENDS = {"stream": FrameGrabber, "snapshot": SnapshotCamera, "file": FileCamera}
+
+
+def create_camera(backend, source, roi=None, **options):
+    """
+    Creates and starts a capture backend.
+
+    Parameters:
+        backend (str): "stream", "snapshot" or "file".
+        source (str): Stream URL, snapshot URL, or file/folder path.
+        roi (tuple): (y1, y2, x1, x2) region every read() returns.
+        options: Backend-specific keyword arguments (e.g. decode_scale for "snapshot").
+    """
+    if backend not in CAMERA_BACKENDS:
+        raise ValueError(f"Unknown camera backend {backend!r}, expected one of {sorted(CAMERA_BACKENDS)}")
+    camera = CAMERA_BACKENDS[backend](source, roi=roi, **options).start()
+    logging.info(f"Camera backend {backend} started on {source} (roi {roi})")
+    return camera
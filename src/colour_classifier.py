@@ -0,0 +1,329 @@
+"""
+Fast roast-colour classifier, the first stage of a cascade in front of YOLO.
+
+The three classes are roast grades, so colour alone separates most beans. A bean is located in the ROI
+by an Otsu threshold (beans are darker than the carousel), its pixels are summarised as Lab/HSV
+statistics plus a brightness histogram, and a nearest-centroid model on standardised features gives
+class probabilities. Beans the model is sure about are answered directly (about 0.3 ms for features and
+model, under 1 ms including locating the bean); anything ambiguous (low probability, no bean or
+several blobs found) goes to YOLO.
+
+The model is fitted on exactly the crop it sees at runtime (bean_crop(): the padded blob box found by
+locate_beans). final.py archives that crop to processed_images/colour_crops for every archived bean that
+YOLO classified, with "source": "yolo" in the index; beans the colour stage answered itself are never
+used for fitting, so a refit does not learn the classifier's own mistakes.
+
+Fit the model from archived crops (processed_images/index.jsonl, or one sub-folder per class):
+    python colour_classifier.py processed_images -o ../models/colour_classifier.json
+    python colour_classifier.py labelled_beans/ --max-loss 0.005
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import cv2
+import numpy as np
+from utils.logger import logging
+
+FEATURE_VERSION = 1
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def bean_mask(crop):
+    """Foreground mask of a bean crop (beans are darker than the background)."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return mask
+
+
+def bean_features(crop, mask=None):
+    """
+    Colour features of the bean pixels in a BGR crop (OpenCV reductions only, no per-pixel Python or fancy indexing).
+
+    Returns:
+        numpy.ndarray: float32 vector: Lab mean (3) and std (3), HSV saturation/value means (2)
+                       and an 8-bin value histogram (8).
+    """
+    if mask is None:
+        mask = bean_mask(crop)
+    if cv2.countNonZero(mask) < 20:
+        mask = None
+    lab_mean, lab_std = cv2.meanStdDev(cv2.cvtColor(crop, cv2.COLOR_BGR2LAB), mask=mask)
+    hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+    hsv_mean = cv2.mean(hsv, mask=mask)
+    value_hist = cv2.calcHist([hsv], [2], mask, [8], [0, 256]).ravel()
+    return np.concatenate([
+        lab_mean.ravel(), lab_std.ravel(),
+        hsv_mean[1:3],
+        value_hist / max(value_hist.sum(), 1.0),
+    ]).astype(np.float32)
+
+
+def locate_beans(roi, scale=4, min_area=400, max_area_fraction=0.25, min_contrast=25.0):
+    """
+    Finds dark blobs in the ROI at 1/scale resolution (scale is a power of two).
+
+    Returns:
+        list of (x1, y1, x2, y2) boxes in ROI coordinates, padded like a detector box.
+        Empty if there is no blob with enough contrast to the background.
+    """
+    small = roi
+    for _ in range(scale.bit_length() - 1):
+        # Halving repeatedly takes OpenCV's fast 2x2 area path; a single 1/4 INTER_AREA resize is 3-4x slower
+        small = cv2.resize(small, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (3, 3), 0)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    foreground = cv2.countNonZero(mask)
+    if foreground == 0 or foreground == mask.size:
+        return []
+    if cv2.mean(gray, mask=cv2.bitwise_not(mask))[0] - cv2.mean(gray, mask=mask)[0] < min_contrast:
+        return []
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    boxes = []
+    max_area = max_area_fraction * gray.size
+    h, w = roi.shape[:2]
+    for x, y, bw, bh, area in stats[1:count]:
+        if min_area / scale ** 2 <= area <= max_area:
+            pad_x, pad_y = bw / 4 + 1, bh / 4 + 1
+            boxes.append((max(0, int(scale * (x - pad_x))), max(0, int(scale * (y - pad_y))),
+                          min(w, int(scale * (x + bw + pad_x))), min(h, int(scale * (y + bh + pad_y)))))
+    return boxes
+
+
+def bean_crop(roi):
+    """
+    The crop the colour stage classifies: the padded blob box, if the ROI shows exactly one bean.
+
+    Returns:
+        (crop, box), or (None, None) if there is no bean or several.
+    """
+    boxes = locate_beans(roi)
+    if len(boxes) != 1:
+        return None, None
+    x1, y1, x2, y2 = boxes[0]
+    return roi[y1:y2, x1:x2], boxes[0]
+
+
+class ColourClassifier:
+    """
+    Nearest-centroid model on standardised colour features.
+
+    Parameters:
+        centroids (array): One row per class, in standardised feature space.
+        classes (list[int]): Class id of each centroid row.
+        mean, scale (array): Feature standardisation.
+        threshold (float): Minimum class probability for an answer without YOLO.
+        audit_every (int): Also run YOLO on every n-th confident bean to measure agreement (0 disables).
+    """
+
+    def __init__(self, centroids, classes, mean, scale, threshold=0.9, audit_every=50, report=None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.classes = list(classes)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.threshold = threshold
+        self.audit_every = audit_every
+        self.report = report or {}
+
+        # Counters
+        self.answered = 0
+        self.fallbacks = 0
+        self.audits = 0
+        self.audit_agreements = 0
+        self.last_time = 0.0
+
+    @classmethod
+    def fit(cls, features, labels, threshold=0.9):
+        features = np.asarray(features, dtype=np.float32)
+        labels = np.asarray(labels)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0) + 1e-6
+        z = (features - mean) / scale
+        classes = sorted(set(labels.tolist()))
+        centroids = np.stack([z[labels == c].mean(axis=0) for c in classes])
+        return cls(centroids, classes, mean, scale, threshold)
+
+    def probabilities(self, features):
+        """Class probabilities (softmax of -d^2/2) for one feature vector or a batch of them."""
+        z = (np.atleast_2d(features) - self.mean) / self.scale
+        d2 = ((z[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        logits = -0.5 * (d2 - d2.min(axis=1, keepdims=True))
+        p = np.exp(logits)
+        return p / p.sum(axis=1, keepdims=True)
+
+    def predict_crop(self, crop):
+        """Returns (class, probability) for one bean crop."""
+        p = self.probabilities(bean_features(crop))[0]
+        i = int(p.argmax())
+        return self.classes[i], float(p[i])
+
+    def classify_roi(self, roi):
+        """
+        First cascade stage on the bean ROI.
+
+        Returns:
+            (class, probability, box) if exactly one bean was found and classified with at least
+            `threshold` probability, otherwise None (use YOLO).
+        """
+        start = time.perf_counter()
+        crop, box = bean_crop(roi)
+        answer = None
+        if crop is not None:
+            bean_class, probability = self.predict_crop(crop)
+            if probability >= self.threshold:
+                answer = (bean_class, probability, box)
+        self.last_time = time.perf_counter() - start
+        if answer is None:
+            self.fallbacks += 1
+        else:
+            self.answered += 1
+        return answer
+
+    def should_audit(self):
+        return bool(self.audit_every) and self.answered % self.audit_every == 0
+
+    def record_audit(self, fast_class, yolo_class):
+        self.audits += 1
+        if fast_class == yolo_class:
+            self.audit_agreements += 1
+        else:
+            logging.warning(f"Colour classifier said {fast_class}, YOLO said {yolo_class}")
+
+    def stats(self):
+        total = self.answered + self.fallbacks
+        return {
+            "answered": self.answered,
+            "fallbacks": self.fallbacks,
+            "fallback_rate": self.fallbacks / total if total else 0.0,
+            "audits": self.audits,
+            "audit_agreement": self.audit_agreements / self.audits if self.audits else None,
+            "last_time": self.last_time,
+            "threshold": self.threshold,
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                "feature_version": FEATURE_VERSION,
+                "classes": self.classes,
+                "centroids": self.centroids.tolist(),
+                "mean": self.mean.tolist(),
+                "scale": self.scale.tolist(),
+                "threshold": self.threshold,
+                "report": self.report,
+            }, f, indent=1)
+
+    @classmethod
+    def load(cls, path, audit_every=50):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("feature_version") != FEATURE_VERSION:
+            raise ValueError(f"{path} was fitted with feature version {data.get('feature_version')}, "
+                             f"expected {FEATURE_VERSION}; refit it")
+        return cls(data["centroids"], data["classes"], data["mean"], data["scale"], data["threshold"],
+                   audit_every=audit_every, report=data.get("report"))
+
+
+def labelled_crops(root, class_names):
+    """
+    Yields (path, class) for labelled crops: from root/index.jsonl (the colour_crops/ entries labelled
+    by YOLO), or from one sub-folder per class named by id or name (e.g. root/dark/*.jpg).
+    """
+    index = os.path.join(root, "index.jsonl")
+    if os.path.exists(index):
+        with open(index) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("class") is not None and entry.get("source") == "yolo" \
+                        and entry["path"].replace("\\", "/").startswith("colour_crops/"):
+                    yield os.path.join(root, entry["path"]), int(entry["class"])
+        return
+    by_name = {name: cls for cls, name in class_names.items()}
+    for folder in sorted(os.listdir(root)):
+        cls = by_name.get(folder, int(folder) if folder.isdigit() else None)
+        if cls is None or not os.path.isdir(os.path.join(root, folder)):
+            continue
+        for path in sorted(glob.glob(os.path.join(root, folder, "*"))):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                yield path, cls
+
+
+def evaluate(model, features, labels, thresholds):
+    """Fallback rate and accuracy for each threshold, counting fallbacks as answered correctly by YOLO."""
+    p = model.probabilities(features)
+    predicted = np.asarray(model.classes)[p.argmax(axis=1)]
+    best = p.max(axis=1)
+    correct = predicted == labels
+    rows = []
+    for t in thresholds:
+        accepted = best >= t
+        n = len(labels)
+        rows.append({
+            "threshold": float(t),
+            "fallback_rate": float(1 - accepted.mean()),
+            "fast_accuracy": float(correct[accepted].mean()) if accepted.any() else None,
+            "accuracy_loss": float((accepted & ~correct).sum() / n),
+        })
+    return rows, float(correct.mean())
+
+
+def main():
+    from final import coffee_beans_class, MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Fit the colour classifier from archived labelled crops")
+    parser.add_argument("root", nargs="?", default="processed_images",
+                        help="archive root with index.jsonl, or a folder with one sub-folder per class")
+    parser.add_argument("-o", "--output", default=os.path.join(os.path.dirname(MODEL_PATH), "colour_classifier.json"))
+    parser.add_argument("--max-loss", type=float, default=0.01,
+                        help="largest accepted accuracy loss against the labels (fraction of all beans)")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    features, labels = [], []
+    for path, cls in labelled_crops(args.root, coffee_beans_class):
+        crop = cv2.imread(path)
+        if crop is not None:
+            features.append(bean_features(crop))
+            labels.append(cls)
+    if len(set(labels)) < 2:
+        raise SystemExit(f"Need crops of at least two classes in {args.root}, found {len(labels)} crop(s)")
+    features, labels = np.stack(features), np.asarray(labels)
+    print(f"{len(labels)} crops: " + ", ".join(f"{coffee_beans_class.get(c, c)} {int((labels == c).sum())}"
+                                              for c in sorted(set(labels.tolist()))))
+
+    order = np.random.default_rng(args.seed).permutation(len(labels))
+    n_test = max(1, int(len(labels) * args.test_fraction))
+    test, train = order[:n_test], order[n_test:]
+    model = ColourClassifier.fit(features[train], labels[train])
+    thresholds = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99, 0.995]
+    rows, raw_accuracy = evaluate(model, features[test], labels[test], thresholds)
+    print(f"Held-out accuracy of the colour stage alone: {100 * raw_accuracy:.1f}% ({n_test} crops)")
+    print(f"{'threshold':>9} {'fallback':>9} {'fast acc':>9} {'acc loss':>9}")
+    for r in rows:
+        fast = f"{100 * r['fast_accuracy']:.1f}%" if r["fast_accuracy"] is not None else "-"
+        print(f"{r['threshold']:>9.3f} {100 * r['fallback_rate']:>8.1f}% {fast:>9} {100 * r['accuracy_loss']:>8.2f}%")
+    chosen = next((r for r in rows if r["accuracy_loss"] <= args.max_loss), rows[-1])
+
+    crops = [cv2.imread(p) for p, _ in list(labelled_crops(args.root, coffee_beans_class))[:200]]
+    crops = [c for c in crops if c is not None]
+    start = time.perf_counter()
+    for crop in crops:
+        model.predict_crop(crop)
+    per_crop = (time.perf_counter() - start) / len(crops)
+
+    final_model = ColourClassifier.fit(features, labels, threshold=chosen["threshold"])
+    final_model.report = {"crops": len(labels), "held_out_accuracy": raw_accuracy, "chosen": chosen,
+                          "thresholds": rows, "predict_ms": per_crop * 1e3, "root": os.path.abspath(args.root)}
+    final_model.save(args.output)
+    print(f"Threshold {chosen['threshold']}: {100 * chosen['fallback_rate']:.1f}% of beans fall back to YOLO, "
+          f"{100 * chosen['accuracy_loss']:.2f}% accuracy lost; {per_crop * 1e3:.3f} ms per crop -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Typed runtime configuration (sorter.yaml) with hot reload.
+
+The file sets any of the fields in FIELDS; fields it leaves out keep the built-in value of the
+script (the upper-case constants at the top of final.py). Every value is type-checked and
+range-checked, and unknown keys are rejected, so a typo fails loudly instead of being ignored.
+
+Fields marked hot are applied while the machine runs: ConfigWatcher notices the file changed,
+validates it in the background and hands the new config to the sort loop, which applies it
+between two beans. With several sort threads (pipelined mode, lanes) a ReloadGate makes sure no
+thread is in the middle of a bean while the settings change. Other fields (serial port, camera, model, ...) only take effect on restart;
+a reload that changes them logs a warning and leaves them alone. An invalid file is logged and
+the running config stays active. Removing a field from the file keeps its current value until
+the next restart.
+
+Each loaded file gets a version (a hash of its contents) that is stored with every bean record.
+"""
+import contextlib
+import hashlib
+import os
+import threading
+import time
+import yaml
+from utils.logger import logging
+
+DEFAULT_VERSION = "builtin"
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class Field:
+    """
+    Parameters:
+        kind (type): int, float, str, bool, tuple (a fixed-length list of numbers) or dict.
+        hot (bool): Can be applied between beans without a restart.
+        minimum, maximum: Inclusive range for numbers (and for every element of a tuple).
+        choices (tuple): Allowed values.
+        length (int): Required length of a tuple.
+        item (type): int or float, the element type of a tuple.
+        optional (bool): null is allowed (e.g. to disable a feature).
+    """
+
+    def __init__(self, kind, hot=False, minimum=None, maximum=None, choices=None, length=None, item=float,
+                 optional=False):
+        self.kind = kind
+        self.hot = hot
+        self.minimum = minimum
+        self.maximum = maximum
+        self.choices = choices
+        self.length = length
+        self.item = item
+        self.optional = optional
+
+    def _check_range(self, name, value):
+        if self.minimum is not None and value < self.minimum:
+            raise ConfigError(f"{name}: {value} is below the minimum {self.minimum}")
+        if self.maximum is not None and value > self.maximum:
+            raise ConfigError(f"{name}: {value} is above the maximum {self.maximum}")
+
+    def validate(self, name, value):
+        """Returns the value converted to the field type, or raises ConfigError."""
+        if value is None:
+            if self.optional:
+                return None
+            raise ConfigError(f"{name} may not be empty")
+        if self.kind is bool:
+            if not isinstance(value, bool):
+                raise ConfigError(f"{name}: expected true or false, got {value!r}")
+        elif self.kind in (int, float):
+            # bool is an int subclass; "yes" for a number is a mistake
+            if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                    or (self.kind is int and not float(value).is_integer()):
+                raise ConfigError(f"{name}: expected {self.kind.__name__}, got {value!r}")
+            value = self.kind(value)
+            self._check_range(name, value)
+        elif self.kind is str:
+            if not isinstance(value, str):
+                raise ConfigError(f"{name}: expected a string, got {value!r}")
+        elif self.kind is tuple:
+            if not isinstance(value, (list, tuple)) or (self.length is not None and len(value) != self.length):
+                raise ConfigError(f"{name}: expected a list of {self.length} numbers, got {value!r}")
+            for item in value:
+                if isinstance(item, bool) or not isinstance(item, (int, float)) \
+                        or (self.item is int and not float(item).is_integer()):
+                    raise ConfigError(f"{name}: expected {self.item.__name__} values, got {item!r}")
+                self._check_range(name, item)
+            value = tuple(self.item(item) for item in value)
+        elif self.kind is dict:
+            if not isinstance(value, dict):
+                raise ConfigError(f"{name}: expected a mapping, got {value!r}")
+            value = dict(value)
+        if self.choices is not None and value not in self.choices:
+            raise ConfigError(f"{name}: {value!r} is not one of {list(self.choices)}")
+        return value
+
+
+FIELDS = {
+    # Applied on restart
+    "serial_port": Field(str),
+    "baud_rate": Field(int, choices=(9600, 19200, 38400, 57600, 115200)),
+    "use_serial_acks": Field(bool),
+    "camera_backend": Field(str, choices=("stream", "snapshot", "file")),
+    "camera_url": Field(str),
+    "snapshot_url": Field(str),
+    "snapshot_decode_scale": Field(int, choices=(1, 2, 4, 8)),
+    "crop_box": Field(tuple, length=4, item=int, minimum=0),
+    "model_path": Field(str),
+    "colour_model_path": Field(str),
+    "inference_engine": Field(str, choices=("torch", "onnx", "openvino")),
+    "sort_mode": Field(str, choices=("sequential", "pipelined")),
+    "result_db": Field(str),
+    "result_flush_interval": Field(float, minimum=0.1, maximum=60),
+    "metrics_port": Field(int, minimum=1, maximum=65535, optional=True),
+    "stats_file": Field(str, optional=True),
+    "presence_gate": Field(bool),
+    "fast_classifier": Field(bool),
+    "frame_cache": Field(bool),
+    # Applied between beans
+    "confidence_threshold": Field(float, hot=True, minimum=0.01, maximum=1.0),
+    "burst_frames": Field(int, hot=True, minimum=1, maximum=8),
+    "burst_below_confidence": Field(float, hot=True, minimum=0, maximum=1.0),
+    "darkness_threshold": Field(float, hot=True, minimum=0, maximum=255),
+    "darkest_box_size": Field(tuple, hot=True, length=2, item=int, minimum=4),
+    "angle_dead_band": Field(tuple, hot=True, length=2, minimum=0),
+    "angle_center_x": Field(float, hot=True, minimum=0),
+    "angle_pixels_per_degree": Field(float, hot=True, minimum=0.1),
+    "max_angle": Field(float, hot=True, minimum=0, maximum=90),
+    "angle_calibration_path": Field(str, hot=True, optional=True),
+    "align_verify_every": Field(int, hot=True, minimum=0),
+    "angle_settle_time": Field(float, hot=True, minimum=0, maximum=10),
+    "step_settle_time": Field(float, hot=True, minimum=0, maximum=10),
+    "archive_sample_rates": Field(dict, hot=True),
+    "archive_quota_bytes": Field(int, hot=True, minimum=0, optional=True),
+    "save_darkest_images": Field(bool, hot=True),
+    "debug_image_path": Field(str, hot=True, optional=True),
+    "log_level": Field(str, hot=True, choices=("DEBUG", "INFO", "WARNING", "ERROR")),
+    "console_level": Field(str, hot=True, choices=("DEBUG", "INFO", "WARNING", "ERROR")),
+}
+
+
+class Config:
+    """A validated config file: values (only the fields the file sets) and its version."""
+
+    def __init__(self, values, version=DEFAULT_VERSION, path=None):
+        self.values = values
+        self.version = version
+        self.path = path
+
+    @classmethod
+    def parse(cls, text, path=None):
+        """Validates YAML text; raises ConfigError on any problem."""
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ConfigError(f"Invalid YAML: {e}")
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise ConfigError("The config file must be a mapping of field: value")
+        unknown = sorted(set(data) - set(FIELDS))
+        if unknown:
+            raise ConfigError(f"Unknown field(s): {', '.join(map(str, unknown))}")
+        values = {name: FIELDS[name].validate(name, value) for name, value in data.items()}
+        if "angle_dead_band" in values and values["angle_dead_band"][0] > values["angle_dead_band"][1]:
+            raise ConfigError(f"angle_dead_band: {list(values['angle_dead_band'])} is not a (low, high) pair")
+        for bean_class, rate in values.get("archive_sample_rates", {}).items():
+            if not isinstance(bean_class, int) or isinstance(rate, bool) or not isinstance(rate, (int, float)) \
+                    or not 0 <= rate <= 1:
+                raise ConfigError(f"archive_sample_rates: expected class: rate (0..1), got {bean_class!r}: {rate!r}")
+        crop_box = values.get("crop_box")
+        if crop_box is not None and (crop_box[0] >= crop_box[1] or crop_box[2] >= crop_box[3]):
+            raise ConfigError(f"crop_box: {list(crop_box)} is not (y1, y2, x1, x2) with y1 < y2 and x1 < x2")
+        version = hashlib.sha1(text.encode("utf-8")).hexdigest()[:10]
+        return cls(values, version, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.parse(f.read(), path)
+
+    def changed(self, other):
+        """Names of the fields whose value differs from another Config."""
+        return sorted(name for name in set(self.values) | set(other.values)
+                      if self.values.get(name) != other.values.get(name))
+
+
+def apply_config(config, namespace, hot_only=False):
+    """
+    Writes config values into a module namespace (globals()) as upper-case constants.
+
+    Only names the module defines are set, so a script picks up exactly the fields it uses.
+
+    Parameters:
+        config (Config): The validated config.
+        namespace (dict): The module globals to update.
+        hot_only (bool): Skip fields that need a restart (used for reloads).
+
+    Returns:
+        list[str]: The field names whose value changed.
+    """
+    changed = []
+    for name, value in config.values.items():
+        constant = name.upper()
+        if constant not in namespace or (hot_only and not FIELDS[name].hot):
+            continue
+        if namespace[constant] != value:
+            namespace[constant] = value
+            changed.append(name)
+    return changed
+
+
+class ReloadGate:
+    """
+    Keeps config reloads between beans when several threads sort at once.
+
+    Every sort thread holds bean() while it works on one bean; any number of them can. exclusive()
+    waits until no thread is inside a bean and keeps new beans from starting until the reload is
+    done, so a reload is never starved by lanes that overlap. A thread must not call exclusive()
+    while it holds bean().
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._active = 0
+        self._reloading = False
+        self._waiting = 0
+
+    @contextlib.contextmanager
+    def bean(self):
+        with self._cond:
+            while self._reloading or self._waiting:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                if self._active == 0:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._waiting += 1
+            while self._reloading or self._active:
+                self._cond.wait()
+            self._waiting -= 1
+            self._reloading = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._reloading = False
+                self._cond.notify_all()
+
+
+class ConfigWatcher:
+    """
+    Polls the config file and validates new versions in the background.
+
+    The sort loop calls take() between beans; it returns the new Config once per change (or None).
+
+    Parameters:
+        path (str): The config file.
+        active (Config): The config the process started with.
+        interval (float): Seconds between checks of the file's modification time.
+    """
+
+    def __init__(self, path, active=None, interval=1.0):
+        self.path = path
+        self.active = active
+        self.interval = interval
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stamp = self._file_stamp()
+        self._running = False
+        self._thread = None
+
+        # Counters
+        self.reloads = 0
+        self.errors = 0
+        self.last_error = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.interval)
+            self.check()
+
+    def check(self):
+        """Loads the file if it changed since the last check. Returns True if a new config is pending."""
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            config = Config.load(self.path)
+        except (OSError, ConfigError) as e:
+            self.errors += 1
+            self.last_error = str(e)
+            logging.error(f"Config {self.path} not applied, keeping version "
+                          f"{self.active.version if self.active else DEFAULT_VERSION}: {e}")
+            return False
+        if self.active is not None and config.version == self.active.version:
+            return False
+        restart = [name for name in (config.changed(self.active) if self.active else config.values)
+                   if not FIELDS[name].hot]
+        if restart:
+            logging.warning(f"Config {config.version}: {', '.join(restart)} changed, applied on the next restart")
+        with self._lock:
+            self._pending = config
+        return True
+
+    def take(self):
+        """Returns the config waiting to be applied (once), or None."""
+        with self._lock:
+            config, self._pending = self._pending, None
+        if config is not None:
+            self.active = config
+            self.reloads += 1
+        return config
+
+    def stats(self):
+        return {
+            "version": self.active.version if self.active else DEFAULT_VERSION,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
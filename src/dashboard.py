@@ -0,0 +1,211 @@
+"""
+Live dashboard for the sorting machine.
+
+Only the rows added to the result store since the last refresh are read (WHERE id > last id), and
+the totals are kept as running aggregates, so a refresh costs the same at the end of a 12-hour shift
+as at the start.
+
+Run from the src folder while final.py is sorting:
+    streamlit run dashboard.py
+    streamlit run dashboard.py -- --db bean_log.db --refresh 2
+"""
+import argparse
+import collections
+import json
+import os
+import sqlite3
+import time
+from metrics import Histogram
+
+# Upper bound on rows read per refresh; a backlog (e.g. opening the dashboard mid-shift) is read in chunks
+MAX_ROWS_PER_POLL = 5000
+RECENT_ROWS = 20
+RATE_WINDOW_MINUTES = 60
+
+
+class ResultTail:
+    """
+    Follows the beans table of a result store and keeps running totals.
+
+    Parameters:
+        path (str): SQLite database written by result_store.ResultStore.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last_id = 0
+        self.beans = 0
+        self.failed = 0
+        self.retried = 0
+        self.bursts = 0  # beans resolved by a burst of re-captured frames (BURST_FRAMES > 1)
+        self.from_queue = 0
+        self.class_counts = collections.Counter()
+        self.per_minute = collections.OrderedDict()  # minute start (epoch) -> beans, last RATE_WINDOW_MINUTES only
+        self.cycle = Histogram()
+        self.stages = {}  # stage name -> Histogram of its per-bean timings
+        self.recent = collections.deque(maxlen=RECENT_ROWS)
+        self.first_ts = None
+        self.last_ts = None
+        self.last_poll_rows = 0
+        self.last_poll_time = 0.0
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            if not os.path.exists(self.path):
+                return None
+            # Read-only: the sorter keeps writing through WAL while we read
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        return self._conn
+
+    def poll(self):
+        """Reads the rows added since the last call and folds them into the totals. Returns the number read."""
+        start = time.perf_counter()
+        conn = self._connect()
+        count = 0
+        if conn is not None:
+            while True:
+                rows = conn.execute(
+                    "SELECT id, ts, bean_id, class, class_name, confidence, angle, attempts, from_queue, "
+                    "time_taken, timings FROM beans WHERE id > ? ORDER BY id LIMIT ?",
+                    (self.last_id, MAX_ROWS_PER_POLL)).fetchall()
+                for row in rows:
+                    self._add(row)
+                count += len(rows)
+                if len(rows) < MAX_ROWS_PER_POLL:
+                    break
+        self.last_poll_rows = count
+        self.last_poll_time = time.perf_counter() - start
+        return count
+
+    def _add(self, row):
+        row_id, ts, bean_id, bean_class, class_name, confidence, angle, attempts, from_queue, time_taken, timings = row
+        self.last_id = row_id
+        self.beans += 1
+        if bean_class is None:
+            self.failed += 1
+            self.class_counts["not detected"] += 1
+        else:
+            self.class_counts[class_name or str(bean_class)] += 1
+        if attempts and attempts > 1:
+            self.retried += 1
+        if from_queue:
+            self.from_queue += 1
+        if time_taken is not None:
+            self.cycle.observe(time_taken)
+        if timings:
+            stages = _parse_timings(timings)
+            if "burst" in stages:
+                self.bursts += 1
+            for stage, seconds in stages.items():
+                if stage not in self.stages:
+                    self.stages[stage] = Histogram()
+                self.stages[stage].observe(seconds)
+
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        minute = int(ts // 60 * 60)
+        self.per_minute[minute] = self.per_minute.get(minute, 0) + 1
+        while len(self.per_minute) > RATE_WINDOW_MINUTES:
+            self.per_minute.popitem(last=False)
+        self.recent.append(row)
+
+    def beans_per_minute(self, window=5):
+        """Average rate over the last `window` whole minutes of data (the current minute is still filling)."""
+        if not self.per_minute:
+            return 0.0
+        minutes = list(self.per_minute.items())
+        complete = minutes[:-1][-window:]
+        if not complete:
+            return float(minutes[-1][1])
+        return sum(count for _, count in complete) / len(complete)
+
+    def summary(self):
+        elapsed = (self.last_ts - self.first_ts) if self.beans > 1 else 0.0
+        return {
+            "beans": self.beans,
+            "failed": self.failed,
+            "failure_rate": self.failed / self.beans if self.beans else 0.0,
+            "retry_rate": self.retried / self.beans if self.beans else 0.0,
+            "burst_rate": self.bursts / self.beans if self.beans else 0.0,
+            "from_queue": self.from_queue,
+            "beans_per_min": self.beans_per_minute(),
+            "beans_per_min_overall": self.beans / elapsed * 60 if elapsed else 0.0,
+        }
+
+    def latency_table(self):
+        """Rows of (stage, count, p50 ms, p95 ms, p99 ms) over the most recent beans."""
+        rows = []
+        for name, hist in [("cycle", self.cycle)] + sorted(self.stages.items()):
+            if hist.count:
+                p = hist.percentiles()
+                rows.append((name, hist.count, p[50] * 1e3, p[95] * 1e3, p[99] * 1e3))
+        return rows
+
+
+def _parse_timings(text):
+    try:
+        return {k: v for k, v in json.loads(text).items() if isinstance(v, (int, float))}
+    except (ValueError, AttributeError):
+        return {}
+
+
+def main():
+    import pandas as pd
+    import streamlit as st
+
+    parser = argparse.ArgumentParser(description="Live sorting dashboard")
+    parser.add_argument("--db", default="bean_log.db", help="result store written by final.py")
+    parser.add_argument("--refresh", type=float, default=2.0, help="seconds between refreshes")
+    args, _ = parser.parse_known_args()
+
+    st.set_page_config(page_title="Coffee bean sorter", layout="wide")
+    if "tail" not in st.session_state or st.session_state.tail.path != args.db:
+        st.session_state.tail = ResultTail(args.db)
+    tail = st.session_state.tail
+    tail.poll()
+
+    st.title("Coffee bean sorter")
+    if tail.beans == 0:
+        st.info(f"Waiting for beans in {os.path.abspath(args.db)} ...")
+    else:
+        summary = tail.summary()
+        cols = st.columns(5)
+        cols[0].metric("Beans", summary["beans"])
+        cols[1].metric("Beans/min (last 5 min)", f"{summary['beans_per_min']:.1f}")
+        cols[2].metric("Failure rate", f"{100 * summary['failure_rate']:.1f}%")
+        # With bursts (BURST_FRAMES > 1) a bean gets one attempt and its re-captures are the burst
+        cols[3].metric("Re-capture rate", f"{100 * (summary['retry_rate'] + summary['burst_rate']):.1f}%",
+                       help=f"Retried: {100 * summary['retry_rate']:.1f}%, "
+                            f"burst: {100 * summary['burst_rate']:.1f}% of the beans")
+        cols[4].metric("From sort queue", summary["from_queue"])
+
+        left, right = st.columns(2)
+        with left:
+            st.subheader("Beans per class")
+            st.bar_chart(pd.Series(dict(tail.class_counts), name="beans"))
+        with right:
+            st.subheader("Beans per minute")
+            st.line_chart(pd.Series(list(tail.per_minute.values()),
+                                    index=pd.to_datetime(list(tail.per_minute.keys()), unit="s"), name="beans"))
+
+        st.subheader("Latency (recent beans)")
+        st.dataframe(pd.DataFrame(tail.latency_table(), columns=["stage", "count", "p50 ms", "p95 ms", "p99 ms"]),
+                     hide_index=True)
+
+        st.subheader("Latest beans")
+        recent = pd.DataFrame(list(tail.recent)[::-1], columns=["id", "ts", "bean_id", "class", "class_name",
+                                                                "confidence", "angle", "attempts", "from_queue",
+                                                                "time_taken", "timings"])
+        recent["ts"] = pd.to_datetime(recent["ts"], unit="s")
+        st.dataframe(recent.drop(columns=["timings"]), hide_index=True)
+
+    st.caption(f"Read {tail.last_poll_rows} new row(s) in {tail.last_poll_time * 1e3:.1f} ms "
+               f"(last id {tail.last_id}); refreshing every {args.refresh:g}s")
+    time.sleep(args.refresh)
+    st.rerun()
+
+
+if __name__ == "__main__":
+    main()
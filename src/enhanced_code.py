@@ -5,26 +5,55 @@ from ultralytics import YOLO
 from utils.logger import logging
 import os
 from preprocess import detect_and_annotate_darkest_box
-import csv
-from datetime import datetime
+from camera import crop
+from metrics import registry, timed
+from result_store import ResultStore
+from serial_client import sendable_angle
+from config import DEFAULT_VERSION, Config, ConfigWatcher, apply_config
 
-CSV_FILE = "bean_log.csv"
+# Runtime configuration shared with final.py (see config.py); overrides the constants below
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sorter.yaml")
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", "best11.pt")
+RESULT_DB = "bean_log.db"
+METRICS_PORT = 9108  # Prometheus text on http://localhost:9108/metrics (None disables it)
+SERIAL_PORT = 'COM7'
+BAUD_RATE = 9600
+CAMERA_URL = 'http://192.168.1.11:8080/video'
+# Region of the camera frame that shows the bean slot: (y1, y2, x1, x2)
+CROP_BOX = (918, 1228, 1220, 1692)
+CONFIDENCE_THRESHOLD = 0.6
+DARKNESS_THRESHOLD = 120
+DARKEST_BOX_SIZE = (30, 30)
+ANGLE_DEAD_BAND = (150, 270)
+ANGLE_CENTER_X = 220
+ANGLE_PIXELS_PER_DEGREE = 6
+MAX_ANGLE = 30
+STEP_SETTLE_TIME = 0.9
 
-# Initialize CSV file with headers (only if not already exists)
-try:
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Timestamp", "Bean ID", "Detected Class", "Confidence", "Time Taken (s)"])
-except Exception as e:
-    print(f"Error initializing CSV file: {e}")
-    logging.error(f"Error initializing CSV file: {e}")
+config_watcher = None
+config_version = DEFAULT_VERSION
+# Per-bean results, buffered and written to SQLite in batches (started by main())
+bean_store = None
+# YOLO model, loaded by main() from MODEL_PATH
+model = None
 
-# Load YOLO model (replace 'best11.pt' with your trained model if needed)
-print("loading model...")
-model = YOLO("../models/best11.pt")
-print("model loaded successfully")
-logging.info("YOLO model loaded successfully.")
+
+def load_config():
+    """Applies sorter.yaml (if there is one) and starts watching it for changes."""
+    global config_watcher, config_version
+    if os.path.exists(CONFIG_PATH):
+        config = Config.load(CONFIG_PATH)
+        apply_config(config, globals())
+        config_version = config.version
+        config_watcher = ConfigWatcher(CONFIG_PATH, config).start()
+        logging.info(f"Config {config_version} loaded from {CONFIG_PATH}")
+
+def load_model():
+    global model
+    print("loading model...")
+    model = YOLO(MODEL_PATH)
+    print("model loaded successfully")
+    logging.info(f"YOLO model loaded successfully from {MODEL_PATH}.")
 
 
 coffee_beans_class = {
@@ -34,15 +63,25 @@ coffee_beans_class = {
 }
 
 def get_adjusted_angle(x, y):
-    if 150 <= x <= 270:
+    low, high = ANGLE_DEAD_BAND
+    if low <= x <= high:
         return 0
     else:
-        angle = -1 * (x - 220) / 6
+        angle = -1 * (x - ANGLE_CENTER_X) / ANGLE_PIXELS_PER_DEGREE
         logging.info(f"Calculated angle: {angle} for x: {x}, y: {y}")
         if angle < 0:
-            return max(-30, angle)  # Limit angle to a minimum of -30 degrees
+            return max(-MAX_ANGLE, angle)  # Limit angle to a minimum of -MAX_ANGLE degrees
         else:
-            return min(angle, 30)  # Limit angle to a maximum of 30 degrees
+            return min(angle, MAX_ANGLE)  # Limit angle to a maximum of MAX_ANGLE degrees
+
+def apply_pending_config():
+    """Applies the hot fields of a changed config file between beans."""
+    global config_version
+    config = config_watcher.take() if config_watcher is not None else None
+    if config is not None:
+        changed = apply_config(config, globals(), hot_only=True)
+        logging.info(f"Config {config_version} -> {config.version} applied: {', '.join(changed) or 'no changes'}")
+        config_version = config.version
 
 def retry_arduino_connection():
     """Retries Arduino connection in case of an error."""
@@ -55,7 +94,7 @@ def retry_arduino_connection():
     i=0
     while not arduino:
         try:
-            arduino = serial.Serial('COM7', 9600, timeout=1)
+            arduino = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
             send_to_arduino("START")
         except:
             i+=1
@@ -64,6 +103,7 @@ def retry_arduino_connection():
     print("Reconnected to Arduino successfully.")
     return arduino
     
+@timed("serial_write")
 def send_to_arduino(command):
     """Sends data to Arduino, appending a newline for proper termination."""
     full_command = command + "\n"
@@ -80,16 +120,17 @@ def send_to_arduino(command):
         except Exception as e:
             print(f"Error reinitializing Arduino: {e}")
 
+@timed("capture")
 def capture_image():
     """Captures an image and saves it."""
     print("Capturing image from phone...")
     # Uncomment below to use an actual video feed
-    cap = cv2.VideoCapture('http://192.168.1.11:8080/video', cv2.CAP_FFMPEG)
+    cap = cv2.VideoCapture(CAMERA_URL, cv2.CAP_FFMPEG)
     ret, frame = cap.read()
     if ret:
         logging.info("Image captured successfully.")
         image_path = "bean_image.jpg"
-        cropped_frame = frame[918:1228, 1220:1692]
+        cropped_frame = crop(frame, CROP_BOX)
         # Save the cropped image
         cv2.imwrite(image_path, cropped_frame)
         return image_path
@@ -99,16 +140,20 @@ def capture_image():
         image_path = ""
         return image_path
 
+@timed("classify")
 def classify_bean(image_path):
     """Runs YOLO on the captured image and returns the detected class."""
     img = cv2.imread(image_path)
     # Convert image to grayscale to evaluate brightness
-    darkest, _, _ = detect_and_annotate_darkest_box(img)
+    with registry.timer("gate"):
+        darkest, _, _ = detect_and_annotate_darkest_box(img, box_size=DARKEST_BOX_SIZE)
     print(f"darkest value : {darkest}")
-    if darkest > 120:
+    if darkest > DARKNESS_THRESHOLD:
         print("lowest dark value , skipping")
-        return None, 0
-    results = model(img, conf=0.6)
+        registry.inc("gate_skipped")
+        return None, 0, None
+    with registry.timer("inference"):
+        results = model(img, conf=CONFIDENCE_THRESHOLD)
     detected_classes = [result.boxes.cls.tolist() for result in results]
     if detected_classes and len(detected_classes[0]) > 0:
         bean_class = int(detected_classes[0][0])  # Use first detected class
@@ -163,20 +208,15 @@ def classify_bean(image_path):
         cv2.imwrite(annotated_image_path, img)
         logging.info(f"Annotated image saved successfully for class : {bean_class}")
 
-        return bean_class, angle
+        return bean_class, angle, confidence_score
     else:
-        return None, 0  # No detection
-
-def log_bean_to_csv(bean_id, detected_class, confidence, time_taken):
-    with open(CSV_FILE, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            bean_id,
-            detected_class if detected_class is not None else "Not Detected",
-            f"{confidence:.2f}" if confidence is not None else "N/A",
-            f"{time_taken:.2f}"
-        ])
+        return None, 0, None  # No detection
+
+def log_bean(bean_id, detected_class, confidence, time_taken):
+    """Buffers one bean record; the result store writes it in the background."""
+    bean_store.add(bean_id, detected_class,
+                   class_name=coffee_beans_class.get(detected_class) if detected_class is not None else None,
+                   confidence=confidence, time_taken=time_taken, config_version=config_version)
 
 def read_from_arduino():
     """Reads data from Arduino."""
@@ -233,12 +273,17 @@ def intialize_arduino():
     return True
     
 def main():
+    global arduino, bean_store
+    load_config()
+    bean_store = ResultStore(RESULT_DB).start()
+    load_model()
     # Initialize serial communication with a higher baud rate (if desired)
-    global arduino
+    if METRICS_PORT:
+        registry.start_http_server(METRICS_PORT)
     logging.info("Initializing serial communication with Arduino...")
     arduino = None
     try:
-        arduino = serial.Serial('COM7', 9600, timeout=1)
+        arduino = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         send_to_arduino("START")
     except:
         retry_arduino_connection()  # Retry connection if error occurs
@@ -251,10 +296,11 @@ def main():
         print("Arduino is ready. Starting sorting process...")
 
     try:
-        current_bean, attempts, sorted_count, confidence_score = 1, 0, 0, 0
+        current_bean, attempts, sorted_count, confidence_score = 1, 0, 0, None
         total_count = 0
         logging.info("\n"*2 + "#"*60 + "#" + " "*15 + "Starting sorting process..." + " "*15 + "#" + "#" * 60)
         while True:
+            apply_pending_config()
             total_count += 1 #remove if unnecessesery
             start_time = time.time()
             try:
@@ -271,18 +317,19 @@ def main():
                 print("Error capturing image, skipping. <continue>")
                 continue
             try:
-                bean_class, angle = classify_bean(image_path)  # YOLO classification
+                bean_class, angle, confidence_score = classify_bean(image_path)  # YOLO classification
             except Exception as e:
                 print(f"Error during classification: {e}")
                 logging.error(f"Error during classification: {e}")
-                bean_class = None
+                bean_class, confidence_score = None, None
 
             if bean_class is None:
                 print(f"Attempt {attempts + 1} failed, retrying...")
+                registry.inc("classify_retries")
             attempts += 1
 
+            angle = sendable_angle(angle)  # whole degrees, never 0/1/2/-1 (servo commands, parse error)
             if angle != 0:
-                # angle = int(angle)  # Convert to integer for Arduino
                 print(f"Angle for stepper motor: {angle}")
                 send_to_arduino(str(angle))
                 logging.info(f"Angle sent to Arduino: {angle}")
@@ -293,9 +340,10 @@ def main():
 
             if bean_class is None and attempts >= 2:
                 print("Failed to detect bean class after 2 attempts, skipping.")
+                registry.inc("beans_skipped")
                 send_to_arduino("STEP")
                 print("Arduino is ready for the next step.")
-                time.sleep(0.9)
+                time.sleep(STEP_SETTLE_TIME)
                 attempts = 0
                 current_bean = 1
                 logging.info("Failed to detect bean class after 2 attempts, skipping.")
@@ -309,17 +357,20 @@ def main():
             # In both cases, command the Arduino to rotate the stepper
             logging.info("Rotating stepper motor...") 
             send_to_arduino("STEP")
-            time.sleep(0.9)
+            time.sleep(STEP_SETTLE_TIME)
             print("-"*60 + "\n"*1)
             end_time = time.time()
             time_taken = end_time - start_time
+            registry.inc("beans_total")
+            registry.observe("cycle", time_taken)
 
             # Log every bean whether detected or not
-            if bean_class is not None:
-                log_bean_to_csv(
-                    bean_id=sorted_count,
-                    detected_class=bean_class
-                )
+            log_bean(
+                bean_id=total_count,
+                detected_class=bean_class,
+                confidence=confidence_score,
+                time_taken=time_taken
+            )
 
     except KeyboardInterrupt:
         print("Terminating...")
@@ -327,7 +378,10 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
     finally:
+        if config_watcher is not None:
+            config_watcher.stop()
         arduino.close()
+        bean_store.close()  # flushes the last buffered beans
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,30 +1,193 @@
-import serial
 import time
+_IMPORT_START = time.perf_counter()
+import threading
+import serial
 import cv2
-from ultralytics import YOLO
-from utils.logger import logging
+from inference import create_engine, Detections, vote_detections
+from utils.logger import logging, log_event, set_console_level, set_log_level
+import utils.logger
 import os
 from preprocess import detect_and_annotate_darkest_box
-import csv
-from datetime import datetime
+from camera import create_camera
+from archive import ArchiveWriter
+from pipeline import SortPipeline
+from serial_client import ArduinoError, ArduinoLinkError, sendable_angle
+from supervisor import Backoff, CameraSupervisor, SerialSupervisor
+from sort_queue import BeanDetection, SortQueue
+from metrics import registry, timed
+from result_store import ResultStore
+from presence import PresenceDetector
+from colour_classifier import ColourClassifier, bean_crop, locate_beans
+from angle_calibration import AngleCalibration
+from frame_cache import FrameCache
+from config import DEFAULT_VERSION, Config, ConfigError, ConfigWatcher, ReloadGate, apply_config
+import argparse
+
+# Runtime configuration: fields set in this file override the constants below (see config.py).
+# Hot fields are re-applied between beans when the file changes; the rest on restart.
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sorter.yaml")
+CONFIG_CHECK_INTERVAL = 1.0  # seconds between checks for a changed config file
+
+# Per-bean results (SQLite, written in batches); export with: python result_store.py bean_log.db --csv out.csv
+RESULT_DB = "bean_log.db"
+RESULT_FLUSH_INTERVAL = 2.0  # seconds; at most this much is lost if the process dies
+SERIAL_PORT = 'COM7'
+BAUD_RATE = 9600
+# Wait for the Arduino's acknowledgements (needs hardware/enhanced_arduino.ino) instead of fixed sleeps
+USE_SERIAL_ACKS = True
+# A lost serial link or camera is reopened in the background with exponential backoff (supervisor.py).
+# Commands and captures wait up to CONNECTION_HOLD_TIMEOUT seconds for it to come back; the start
+# waits up to SERIAL_CONNECT_TIMEOUT seconds for the first READY.
+CONNECTION_HOLD_TIMEOUT = 10.0
+SERIAL_CONNECT_TIMEOUT = 30.0
+# Capture backend: "stream" (keep the MJPEG stream open), "snapshot" (one JPEG per bean from the
+# still endpoint) or "file" (CAMERA_URL is a folder of images or a video, for testing)
+CAMERA_BACKEND = "stream"
+CAMERA_URL = 'http://192.168.1.11:8080/video'
+SNAPSHOT_URL = 'http://192.168.1.11:8080/shot.jpg'
+# Decode snapshots at 1/n resolution (1, 2, 4 or 8); the ROI is scaled back up to CROP_BOX size
+SNAPSHOT_DECODE_SCALE = 1
+# Region of the camera frame that shows the bean slot: (y1, y2, x1, x2)
+CROP_BOX = (918, 1228, 1220, 1692)
+# Debug only: also write every captured ROI to this file (None keeps frames in memory)
+DEBUG_IMAGE_PATH = None
+# Debug only: save the darkest-region annotation for every bean to processed_images/darkest_point
+SAVE_DARKEST_IMAGES = False
+
+# Resolved relative to this file, so the script does not depend on the working directory
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", "sahad_best.pt")
+# Detector backend: "torch" (ultralytics/PyTorch), "onnx" (ONNX Runtime) or "openvino".
+# The export-based engines are built from MODEL_PATH once and cached in models/.cache.
+INFERENCE_ENGINE = "torch"
+CONFIDENCE_THRESHOLD = 0.6
+# Colour-feature first stage (colour_classifier.py): beans it is sure about skip YOLO.
+# Fit it with: python colour_classifier.py processed_images (without the file the stage is off)
+COLOUR_MODEL_PATH = os.path.join(os.path.dirname(MODEL_PATH), "colour_classifier.json")
+FAST_CLASSIFIER = True
+# Reuse the detector result for near-duplicate frames (retries, unchanged scenes) seen within 2 seconds
+FRAME_CACHE = True
+# Burst voting: when the first frame finds no bean, or only one below BURST_BELOW_CONFIDENCE, grab
+# BURST_FRAMES - 1 more frames of the same slot, detect them as one batch and take a confidence-weighted
+# vote. The vote margin is logged as the confidence, and a bean that fails the burst is not retried.
+# 1 disables bursts (two full attempts per bean, as before).
+BURST_FRAMES = 3
+BURST_BELOW_CONFIDENCE = 0.8
+# Frames whose darkest DARKEST_BOX_SIZE region is brighter than this have no bean and skip the detector
+DARKNESS_THRESHOLD = 120
+DARKEST_BOX_SIZE = (30, 30)
+# Learned empty-slot model (presence.py): empty slots are stepped past without inference. The
+# darkness gate above is only used until the model has seen enough empty slots.
+PRESENCE_GATE = True
 
-CSV_FILE = "bean_log.csv"
+# Bean alignment: no correction while the bean centre x is inside the dead band; outside it the
+# carousel turns by (ANGLE_CENTER_X - x) / ANGLE_PIXELS_PER_DEGREE degrees, limited to +-MAX_ANGLE
+ANGLE_DEAD_BAND = (150, 270)
+ANGLE_CENTER_X = 220
+ANGLE_PIXELS_PER_DEGREE = 6
+MAX_ANGLE = 30
+# Fitted lookup table that replaces the rule above (angle_calibration.py); None or a missing file keeps the rule
+ANGLE_CALIBRATION_PATH = os.path.join(os.path.dirname(MODEL_PATH), "angle_calibration.json")
+# Files kept next to the detector weights: a model_path in sorter.yaml moves them along, unless the
+# file sets their path as well
+MODEL_FILES = {"colour_model_path": "colour_classifier.json", "angle_calibration_path": "angle_calibration.json"}
+# Calibration data: capture the slot again after every n-th angle correction (sequential mode) and
+# log where the bean ended up (x_after). 0 disables it; each check costs one capture.
+ALIGN_VERIFY_EVERY = 0
 
-# Initialize CSV file with headers (only if not already exists)
-try:
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Timestamp", "Bean ID", "Detected Class", "Confidence", "Time Taken (s)"])
-except Exception as e:
-    print(f"Error initializing CSV file: {e}")
-    logging.error(f"Error initializing CSV file: {e}")
+# "sequential": capture, classify and actuate one step at a time.
+# "pipelined": imaging of the next bean overlaps actuation of the current one (see pipeline.py).
+SORT_MODE = "sequential"
+# Fixed settle times, only used when USE_SERIAL_ACKS is off
+ANGLE_SETTLE_TIME = 1.0  # seconds for an angle correction to finish
+STEP_SETTLE_TIME = 0.9   # seconds for a carousel step to finish
 
-# Load YOLO model (replace 'best11.pt' with your trained model if needed)
-print("loading model...")
-model = YOLO("../models/best11.pt")
-print("model loaded successfully")
-logging.info("YOLO model loaded successfully.")
+# Verbosity of the text log and the console (DEBUG, INFO, WARNING, ERROR). INFO is one line per bean;
+# DEBUG adds every capture, angle and serial command. Defaults come from SORTER_LOG_LEVEL / SORTER_CONSOLE_LEVEL.
+LOG_LEVEL = utils.logger.LOG_LEVEL
+CONSOLE_LEVEL = utils.logger.CONSOLE_LEVEL
+
+# Metrics: Prometheus text on http://localhost:METRICS_PORT/metrics (None disables it),
+# and/or a JSON stats file rewritten every few seconds (None disables it)
+METRICS_PORT = 9108
+STATS_FILE = None
+
+# Image archive (processed_images): per-class sampling rates and disk quota
+ARCHIVE_SAMPLE_RATES = {}  # e.g. {1: 0.1} keeps every 10th "light" bean
+ARCHIVE_QUOTA_BYTES = 2 * 1024**3
+
+# Serial link: a raw serial.Serial (legacy) or a SerialSupervisor around an ArduinoClient (USE_SERIAL_ACKS)
+arduino = None
+arduino_client = None
+# Extra beans found in one frame, sorted on the following carousel positions
+sort_queue = SortQueue()
+# Detector results of recent frames, keyed on a perceptual hash of the ROI; created by get_frame_cache()
+# (after the config is loaded) when FRAME_CACHE is on
+frame_cache = None
+# Every frame cache in use (the shared one and lanes.py's), cleared when the confidence threshold is reloaded
+frame_caches = []
+# Capture backend (in a CameraSupervisor), opened on first capture
+camera = None
+# Background image writer, started on first use
+archive = None
+# Buffered bean result store, started by get_results()
+results = None
+# Empty-slot detector, created by get_presence() when PRESENCE_GATE is on
+presence = None
+# Colour classifier, loaded by get_colour_classifier() (False: disabled or not fitted)
+colour_classifier = None
+# Angle lookup table, loaded by load_angle_calibration() (None: the linear rule is used)
+angle_calibration = None
+alignment_moves = 0
+# Watches CONFIG_PATH for changes; config_version is stored with every bean record
+config_watcher = None
+config_version = DEFAULT_VERSION
+# Sort threads hold reload_gate.bean() per bean; apply_pending_config() waits for all of them to be between beans
+reload_gate = ReloadGate()
+# Running SortPipelines (pipelined mode, lanes.py), updated when the settle times are reloaded
+pipelines = []
+# Detector, loaded on first use by get_model()
+model = None
+_model_lock = threading.Lock()
+
+# Startup timings (seconds), see startup_report()
+startup_times = {"import": None, "weights_load": None, "warmup": None}
+
+def get_model():
+    """
+    Returns the detector, loading and warming it up on the first call.
+
+    The weights path is checked before any heavy import, so a wrong MODEL_PATH fails immediately.
+    Safe to call from several threads; only one load happens.
+    """
+    global model
+    if model is not None:
+        return model
+    with _model_lock:
+        if model is None:
+            if not os.path.exists(MODEL_PATH):
+                raise FileNotFoundError(f"Model weights not found: {os.path.abspath(MODEL_PATH)}")
+            # Load and warm up the detector (replace MODEL_PATH with your trained model if needed)
+            logging.info("Loading model...")
+            start = time.perf_counter()
+            engine = create_engine(INFERENCE_ENGINE, MODEL_PATH, conf=CONFIDENCE_THRESHOLD, warmup=False)
+            startup_times["weights_load"] = time.perf_counter() - start
+            startup_times["warmup"] = engine.warmup()
+            model = engine
+            logging.info(f"YOLO model loaded successfully ({model.name} engine).")
+    return model
+
+def preload_model():
+    """Starts loading the model in the background (e.g. while the Arduino handshake runs)."""
+    loader = threading.Thread(target=get_model, name="model-loader", daemon=True)
+    loader.start()
+    return loader
+
+def startup_report():
+    """Returns how long the machine took to become ready: module import, weights load and warm-up inference."""
+    report = dict(startup_times)
+    report["engine"] = INFERENCE_ENGINE
+    report["total"] = sum(v for v in startup_times.values() if v is not None)
+    return report
 
 
 coffee_beans_class = {
@@ -33,163 +196,485 @@ coffee_beans_class = {
     2: "medium"
 }
 
+def load_angle_calibration():
+    """
+    Loads the angle lookup table from ANGLE_CALIBRATION_PATH, or falls back to the linear rule when
+    the path is None or the file is missing. A file that cannot be read keeps the current table.
+    """
+    global angle_calibration
+    if not ANGLE_CALIBRATION_PATH or not os.path.exists(ANGLE_CALIBRATION_PATH):
+        angle_calibration = None
+        return None
+    try:
+        calibration = AngleCalibration.load(ANGLE_CALIBRATION_PATH)
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Could not load the angle calibration {ANGLE_CALIBRATION_PATH}, keeping the "
+                      f"{'current table' if angle_calibration is not None else 'linear rule'}: {e}")
+        return angle_calibration
+    angle_calibration = calibration
+    low, high = angle_calibration.dead_band
+    logging.info(f"Angle calibration loaded: {angle_calibration.gain:.2f} px/degree, dead band {low:.0f}-{high:.0f}")
+    return angle_calibration
+
 def get_adjusted_angle(x, y):
-    if 150 <= x <= 270:
+    """The angle correction for a bean centred at (x, y), already a sendable_angle() (0: none)."""
+    if angle_calibration is not None:
+        angle = angle_calibration.angle_for(x)  # precomputed, already sendable
+        if angle:
+            logging.debug(f"Calibrated angle: {angle} for x: {x}, y: {y}")
+        return angle
+    low, high = ANGLE_DEAD_BAND
+    if low <= x <= high:
         return 0
     else:
-        angle = -1 * (x - 220) / 6
-        logging.info(f"Calculated angle: {angle} for x: {x}, y: {y}")
+        angle = -1 * (x - ANGLE_CENTER_X) / ANGLE_PIXELS_PER_DEGREE
+        logging.debug(f"Calculated angle: {angle} for x: {x}, y: {y}")
         if angle < 0:
-            return max(-30, angle)  # Limit angle to a minimum of -30 degrees
+            angle = max(-MAX_ANGLE, angle)  # Limit angle to a minimum of -MAX_ANGLE degrees
         else:
-            return min(angle, 30)  # Limit angle to a maximum of 30 degrees
+            angle = min(angle, MAX_ANGLE)  # Limit angle to a maximum of MAX_ANGLE degrees
+        return sendable_angle(angle)  # whole degrees, never a servo command or the firmware's error value
 
-def retry_arduino_connection():
-    """Retries Arduino connection in case of an error."""
-    print("Retrying Arduino connection...")
-    try:
-        arduino.close()
-    except:
-        pass  # Ignore errors while closing
+def retry_arduino_connection(max_wait=None):
+    """
+    Reopens the legacy serial link (USE_SERIAL_ACKS off) with exponential backoff and redoes the
+    START/READY handshake. Gives up after max_wait seconds (default CONNECTION_HOLD_TIMEOUT), so
+    the loop is never stuck here; the next serial error tries again.
+
+    Returns:
+        True if the link is back.
+    """
+    global arduino
+    max_wait = CONNECTION_HOLD_TIMEOUT if max_wait is None else max_wait
+    logging.warning("Retrying Arduino connection...")
+    registry.inc("serial_outages")
+    if arduino is not None:
+        try:
+            arduino.close()
+        except Exception:
+            pass  # Ignore errors while closing
     arduino = None
-    i=0
-    while not arduino:
+    backoff = Backoff()
+    start = time.monotonic()
+    i = 0
+    while time.monotonic() - start < max_wait:
+        i += 1
         try:
-            arduino = serial.Serial('COM7', 9600, timeout=1)
-            send_to_arduino("START")
-        except:
-            i+=1
-            print(f"Failed to reconnect to Arduino, retrying[{i}]...")
-            time.sleep(0.5)
-    print("Reconnected to Arduino successfully.")
-    return arduino
-    
+            link = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=0.5)
+            link.write(b"START\n")
+            deadline, ready = time.monotonic() + 5, False
+            while not ready and time.monotonic() < deadline:
+                ready = link.readline().decode('utf-8', errors='replace').strip() == "READY"
+            if ready:
+                arduino = link
+                recovery = time.monotonic() - start
+                registry.observe("serial_recovery", recovery)
+                logging.info(f"Reconnected to Arduino after {recovery:.2f}s ({i} attempt(s))")
+                return True
+            link.close()
+            logging.error(f"No READY from Arduino after reconnecting, retrying[{i}]...")
+        except Exception as e:
+            logging.error(f"Failed to reconnect to Arduino, retrying[{i}]: {e}")
+        time.sleep(min(backoff.next(), max(0.0, start + max_wait - time.monotonic())))
+    logging.error(f"Arduino still unreachable after {max_wait}s")
+    return False
+
+@timed("serial_write")
 def send_to_arduino(command):
     """Sends data to Arduino, appending a newline for proper termination."""
+    if arduino_client is not None:
+        # Acknowledged link: returns a future for the ack, nobody has to wait for it
+        return arduino_client.send(command)
     full_command = command + "\n"
     try:
-        global arduino
         arduino.write(full_command.encode('utf-8'))
-        # Minimal delay to allow Arduino to process the command
     except Exception as e:
-        print(f"Error writing to Arduino: {e}")
+        registry.inc("serial_errors")
         logging.error(f"Error writing to Arduino: {e}")
+        # The write failed, so the command never went out: send it again on the new link
+        if retry_arduino_connection():
+            try:
+                arduino.write(full_command.encode('utf-8'))
+            except Exception as e:
+                logging.error(f"Error writing to Arduino after reconnecting: {e}")
+
+@timed("actuate")
+def actuate(command, settle_time=0):
+    """
+    Sends a command and returns once the Arduino has carried it out.
+
+    With USE_SERIAL_ACKS this waits exactly until the matching acknowledgement arrives;
+    otherwise it falls back to sleeping for settle_time seconds.
+    """
+    if arduino_client is not None:
         try:
-            retry_arduino_connection()  # Retry connection if error occurs
-            intialize_arduino()  # Reinitialize Arduino communication
-        except Exception as e:
-            print(f"Error reinitializing Arduino: {e}")
-
-def capture_image():
-    """Captures an image and saves it."""
-    print("Capturing image from phone...")
-    # Uncomment below to use an actual video feed
-    cap = cv2.VideoCapture('http://192.168.1.11:8080/video', cv2.CAP_FFMPEG)
-    ret, frame = cap.read()
+            arduino_client.command(command)
+        except ArduinoError as e:
+            registry.inc("serial_errors")
+            logging.error(f"Error from Arduino for command '{command}': {e}")
+        return
+    send_to_arduino(command)
+    if settle_time:
+        with registry.timer("settle_sleep"):
+            time.sleep(settle_time)
+
+def get_camera():
+    """Returns the shared capture backend (CAMERA_BACKEND), starting it on first use."""
+    global camera
+    if camera is None:
+        if CAMERA_BACKEND == "snapshot":
+            factory = lambda: create_camera("snapshot", SNAPSHOT_URL, roi=CROP_BOX, decode_scale=SNAPSHOT_DECODE_SCALE)
+        else:
+            factory = lambda: create_camera(CAMERA_BACKEND, CAMERA_URL, roi=CROP_BOX)
+        camera = CameraSupervisor(factory).start()
+    return camera
+
+def get_archive():
+    """Returns the shared image archive writer, starting it on first use."""
+    global archive
+    if archive is None:
+        archive = ArchiveWriter("processed_images", sample_rates=ARCHIVE_SAMPLE_RATES,
+                                quota_bytes=ARCHIVE_QUOTA_BYTES).start()
+    return archive
+
+def get_results():
+    """Returns the shared bean result store, creating the database on first use."""
+    global results
+    if results is None:
+        results = ResultStore(RESULT_DB, flush_interval=RESULT_FLUSH_INTERVAL).start()
+    return results
+
+def get_frame_cache():
+    """Returns the shared frame cache, or None if FRAME_CACHE is off."""
+    global frame_cache
+    if frame_cache is None and FRAME_CACHE:
+        frame_cache = FrameCache()
+        frame_caches.append(frame_cache)
+    return frame_cache
+
+def get_presence():
+    """Returns the shared presence detector, or None if PRESENCE_GATE is off."""
+    global presence
+    if presence is None and PRESENCE_GATE:
+        presence = PresenceDetector()
+    return presence
+
+def get_colour_classifier():
+    """Returns the colour classifier, or None if FAST_CLASSIFIER is off or no model has been fitted."""
+    global colour_classifier
+    if colour_classifier is None:
+        colour_classifier = False
+        if FAST_CLASSIFIER:
+            if os.path.exists(COLOUR_MODEL_PATH):
+                colour_classifier = ColourClassifier.load(COLOUR_MODEL_PATH)
+                logging.info(f"Colour classifier loaded (threshold {colour_classifier.threshold})")
+            else:
+                logging.info(f"No colour classifier at {COLOUR_MODEL_PATH}, every bean goes to YOLO")
+    return colour_classifier or None
+
+def check_presence(image, detector=None, details=None):
+    """
+    Runs the presence detector on the bean ROI.
+
+    Parameters:
+        image (numpy.ndarray): The bean ROI.
+        detector (PresenceDetector): A lane's own detector (default: the shared one).
+        details (dict): If given, receives the score and threshold of the check (for the empty_slot event).
+
+    Returns:
+        False if the slot is empty (step without inference), True if a bean is there,
+        None if the detector is off or still learning (the darkness gate decides).
+    """
+    detector = get_presence() if detector is None else detector
+    if detector is None:
+        return None
+    with registry.timer("presence"):
+        present, score = detector.check(image)
+    if details is not None and score is not None:
+        details.update(score=round(score, 5), threshold=round(detector.last_threshold, 5))
+    if present is False:
+        registry.inc("empty_slots")
+    return present
+
+def verify_queued(frame, detection, detector=None, details=None):
+    """
+    Checks the slot of a bean queued from an earlier frame before it is sorted.
+
+    The slot counts as empty if the presence detector says so or, while it is off or still
+    learning, if the darkness gate finds nothing dark enough. When the colour-stage locator sees
+    exactly one bean, its position gives the angle correction the queue could not make.
+
+    Parameters:
+        frame (numpy.ndarray): The ROI captured at the queued bean's position.
+        detection (BeanDetection): The queued bean; its angle is updated.
+        detector (PresenceDetector): A lane's own detector (default: the shared one).
+        details (dict): Receives the presence score and threshold, as in check_presence().
+
+    Returns:
+        bool: False if the slot is empty and the queued result must not be used.
+    """
+    present = check_presence(frame, detector=detector, details=details)
+    if present is None:
+        darkest, _, _ = detect_and_annotate_darkest_box(frame, box_size=DARKEST_BOX_SIZE, annotate=False, save=False)
+        present = darkest <= DARKNESS_THRESHOLD
+    if not present:
+        registry.inc("queue_rejected")
+        return False
+    beans = locate_beans(frame)
+    if len(beans) == 1:
+        x1, y1, x2, y2 = beans[0]
+        detection.angle = get_adjusted_angle((x1 + x2) // 2, (y1 + y2) // 2)
+    return True
+
+@timed("capture")
+def capture_image(newer_than=None, same_slot=False):
+    """
+    Captures a frame and returns the bean ROI.
+
+    Parameters:
+        newer_than (float): Only accept frames captured after this time.time() value (e.g. after the carousel settled).
+        same_slot (bool): Another look at the slot of the previous capture (see camera.py).
+
+    Returns:
+        numpy.ndarray: The CROP_BOX region of the frame (a view, no copy), or None on failure.
+    """
+    logging.debug("Capturing image from phone...")
+    ret, frame = get_camera().read(newer_than=newer_than, same_slot=same_slot)
     if ret:
-        logging.info("Image captured successfully.")
-        image_path = "bean_image.jpg"
-        cropped_frame = frame[918:1228, 1220:1692]
-        # Save the cropped image
-        cv2.imwrite(image_path, cropped_frame)
-        return image_path
+        logging.debug("Image captured successfully.")
+        if DEBUG_IMAGE_PATH:
+            cv2.imwrite(DEBUG_IMAGE_PATH, frame)
+        return frame
     else:
+        registry.inc("capture_failures")
         logging.error("Error capturing image.") # Log error
-        print("Error capturing image")
-        image_path = ""
-        return image_path
-
-def classify_bean(image_path):
-    """Runs YOLO on the captured image and returns the detected class."""
-    img = cv2.imread(image_path)
-    # Convert image to grayscale to evaluate brightness
-    darkest, _, _ = detect_and_annotate_darkest_box(img)
-    print(f"darkest value : {darkest}")
-    if darkest > 120:
-        print("lowest dark value , skipping")
-        return None, 0
-    results = model(img, conf=0.6)
-    detected_classes = [result.boxes.cls.tolist() for result in results]
-    if detected_classes and len(detected_classes[0]) > 0:
-        bean_class = int(detected_classes[0][0])  # Use first detected class
-        confidence_score = results[0].boxes.conf[0].item()  # Get confidence score for the first detection
-        print(f"Detected Class: {coffee_beans_class[bean_class]}, Confidence Score: {confidence_score}")
-    if detected_classes and len(detected_classes[0]) > 0:
-        bean_class = int(detected_classes[0][0])  # Use first detected class
-        # Get the YOLO result for the first detection
-        result = results[0]
-        # Get bounding box coordinates (x1, y1, x2, y2) for the first detection
-        xyxy = result.boxes.xyxy[0].cpu().numpy().astype(int)
+        return None
+
+@timed("classify")
+def classify_beans(image, model=None, detector=None, cache=None, lane=None, capture=None):
+    """
+    Runs YOLO on the captured image and returns every detected bean.
+
+    Parameters:
+        image (numpy.ndarray | str): The BGR bean ROI, or a path to an image file (debugging).
+        model (InferenceEngine): The detector (default: get_model(); lanes.py passes the shared
+            InferenceService, which has the same predict/predict_batch methods).
+        detector (PresenceDetector): The lane's presence detector (default: the shared one).
+        cache (FrameCache): The lane's frame cache (default: the shared one).
+        lane (str): Lane name, used in archive file names so lanes do not overwrite each other.
+        capture (callable): capture(newer_than, same_slot) returning the next ROI of the same slot, for bursts
+            (default: capture_image).
+
+    Returns:
+        list[BeanDetection]: All detections in YOLO order (highest confidence first), empty if none.
+    """
+    model = get_model() if model is None else model
+    if isinstance(image, str):
+        img = cv2.imread(image)
+    else:
+        img = image
+    frame_time = time.time()
+    detector = get_presence() if detector is None else detector
+    cache = get_frame_cache() if cache is None else cache
+    timings = {}
+    if detector is None or not detector.ready:
+        # Convert image to grayscale to evaluate brightness
+        with registry.timer("gate") as gate_timer:
+            darkest, darkest_frame, _ = detect_and_annotate_darkest_box(img, box_size=DARKEST_BOX_SIZE,
+                                                                        annotate=SAVE_DARKEST_IMAGES, save=False)
+        timings["gate"] = gate_timer.elapsed
+        if darkest_frame is not None:
+            get_archive().submit("darkest_point", darkest_frame, metadata={"darkest": darkest})
+        logging.debug(f"darkest value : {darkest}")
+        if darkest > DARKNESS_THRESHOLD:
+            logging.debug("lowest dark value , skipping")
+            registry.inc("gate_skipped")
+            if detector is not None:
+                detector.feedback(False)  # teaches the presence detector what an empty slot looks like
+            return []
+    fast = None
+    source = "yolo"  # who labelled the bean, recorded in the archive index
+    classifier = get_colour_classifier()
+    if classifier is not None:
+        with registry.timer("colour") as colour_timer:
+            fast = classifier.classify_roi(img)
+        timings["colour"] = colour_timer.elapsed
+    if fast is not None and not classifier.should_audit():
+        registry.inc("colour_answered")
+        bean_class, probability, box = fast
+        result = Detections([bean_class], [probability], [box])
+        source = "colour"
+    else:
+        if classifier is not None and fast is None:
+            registry.inc("colour_fallbacks")
+        cache_key = cache.key(img) if cache is not None else None
+        result = cache.get(cache_key) if cache_key is not None else None
+        if result is not None:
+            registry.inc("cache_hits")
+            logging.debug("Near-duplicate frame, reusing the previous detection")
+        else:
+            with registry.timer("inference") as inference_timer:
+                result = model.predict(img, conf=CONFIDENCE_THRESHOLD)
+            timings["inference"] = inference_timer.elapsed
+            if cache_key is not None:
+                cache.put(cache_key, result, inference_timer.elapsed)
+        if fast is not None:
+            # Every audit_every-th confident answer is checked against YOLO, which is used for the bean
+            classifier.record_audit(fast[0], result.classes[0] if len(result) else None)
+    if BURST_FRAMES > 1 and (len(result) == 0 or result.confidences[0] < BURST_BELOW_CONFIDENCE):
+        with registry.timer("burst") as burst_timer:
+            result, img = burst_vote(img, result, model, capture or capture_image)
+        source = "yolo"
+        timings["burst"] = burst_timer.elapsed
+    if detector is not None:
+        detector.feedback(len(result) > 0)
+    if len(result) == 0:
+        registry.inc("no_detection")
+        return []  # No detection
+    registry.inc("detections", len(result))
+
+    classes, confidences, coordinates = result.classes, result.confidences, result.boxes
+
+    # Create unique file names for annotated image and cropped box images using current timestamp
+    timestamp = int(time.time() * 1000)
+    prefix = f"{lane}_" if lane else ""
+    writer = get_archive()
+    # Annotate the image with the bounding boxes and class labels by copying the cropped image
+    annotated = img.copy()
+    detections = []
+    keep = [writer.keep(bean_class) for bean_class in classes]  # one sampling decision per bean
+    for i, (bean_class, confidence_score, xyxy) in enumerate(zip(classes, confidences, coordinates)):
         x1, y1, x2, y2 = xyxy
+        logging.debug(f"Detected Class: {coffee_beans_class[bean_class]}, Confidence Score: {confidence_score}")
+        # The detected bounding box goes to processed_images/boxes. The crop is a view of the
+        # unannotated frame, which is never modified, so the writer thread can encode it later.
+        writer.submit("boxes", img[y1:y2, x1:x2], filename=f"box_{prefix}{timestamp}_{i}.jpg",
+                      bean_class=bean_class, metadata={"confidence": confidence_score, "source": source}, keep=keep[i])
 
-        # Annotate the image with the bounding box and class label by copying the cropped image
-        img = img.copy()
-        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        # cv2.putText(img, str(bean_class), (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-
-        # Save the annotated image (it will be saved with a new filename)
-        # annotated_folder = "../processed_images/newly_annotated"
-        annotated_folder = "processed_images/newly_annotated"
-
-        annotated_folder = os.path.abspath(annotated_folder)  # Resolve to absolute path
-        if not os.path.exists(annotated_folder):
-            os.makedirs(annotated_folder)
-        # Create unique file names for annotated image and cropped box image using current timestamp
-        timestamp = int(time.time() * 1000)
-        annotated_image_path = os.path.join(annotated_folder, f"annotated_{timestamp}.jpg")
-        
-        # Save detected bounding box as a separate cropped image in a different folder
-        # boxes_folder = "../processed_images/boxes"
-        boxes_folder = "processed_images/boxes"
-        if not os.path.exists(boxes_folder):
-            os.makedirs(boxes_folder)
-        cropped_image = img[y1:y2, x1:x2]
-        cropped_image_path = os.path.join(boxes_folder, f"box_{timestamp}.jpg")
-        cv2.imwrite(cropped_image_path, cropped_image)
         # Calculate the middle point of the rectangle
         mid_x, mid_y = (x1 + x2) // 2, (y1 + y2) // 2
-        # Use a larger font scale and thicker line for bold text
-        cv2.putText(img, str(bean_class), (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 255, 0), 4)
-        cv2.putText(img, f"X:{mid_x} Y:{mid_y}", (x1, y1 - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
-
         try:
             angle = get_adjusted_angle(mid_x, mid_y)
         except Exception as e:
-            print(f"Error calculating angle: {e}")
+            logging.error(f"Error calculating angle: {e}")
             angle = 0
-        
+        detections.append(BeanDetection(bean_class, confidence_score, xyxy, angle, frame_time, timings))
+
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        # Use a larger font scale and thicker line for bold text
+        cv2.putText(annotated, str(bean_class), (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 255, 0), 4)
+        cv2.putText(annotated, f"X:{mid_x} Y:{mid_y}", (x1, y1 - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
         # Annotate the middle point coordinates on the image
-        cv2.putText(img, f"x", (mid_x + 10, mid_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
-        cv2.imwrite(annotated_image_path, img)
-        logging.info(f"Annotated image saved successfully for class : {bean_class}")
+        cv2.putText(annotated, f"x", (mid_x + 10, mid_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
 
-        return bean_class, angle
-    else:
-        return None, 0  # No detection
-
-def log_bean_to_csv(bean_id, detected_class, confidence, time_taken):
-    with open(CSV_FILE, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            bean_id,
-            detected_class if detected_class is not None else "Not Detected",
-            f"{confidence:.2f}" if confidence is not None else "N/A",
-            f"{time_taken:.2f}"
-        ])
+    # Queue the annotated image for processed_images/newly_annotated
+    first = detections[0]
+    writer.submit("newly_annotated", annotated, filename=f"annotated_{prefix}{timestamp}.jpg", bean_class=first.bean_class,
+                  metadata={"beans": [[d.bean_class, d.x, d.y] for d in detections], "angle": first.angle,
+                            "source": source},
+                  keep=keep[0])
+    if FAST_CLASSIFIER and source == "yolo" and len(detections) == 1 and keep[0]:
+        # Training data for the colour stage: the crop it would classify, labelled by YOLO
+        crop, _ = bean_crop(img)
+        if crop is not None:
+            writer.submit("colour_crops", crop, filename=f"colour_{prefix}{timestamp}.jpg", bean_class=first.bean_class,
+                          metadata={"confidence": first.confidence, "source": source}, keep=True)
+    logging.debug(f"Annotated image queued with {len(detections)} bean(s), first class : {first.bean_class}")
+    return detections
+
+def verify_alignment(frame, x):
+    """
+    Captures the slot again after an angle correction and returns where the bean is now (x_after).
+
+    The shift is measured between the colour-stage blob centres of both frames, so the detector box
+    and the blob locator need not agree on where the centre of a bean is. Returns None unless both
+    frames show exactly one bean.
+    """
+    before = locate_beans(frame)
+    after_frame = capture_image(newer_than=time.time(), same_slot=True)
+    if len(before) != 1 or after_frame is None:
+        return None
+    after = locate_beans(after_frame)
+    if len(after) != 1:
+        return None
+    shift = (after[0][0] + after[0][2]) // 2 - (before[0][0] + before[0][2]) // 2
+    return int(x + shift)
+
+def burst_vote(img, result, model, capture):
+    """
+    Resolves an uncertain bean from BURST_FRAMES frames of the same slot.
+
+    The first frame's result is kept; the other frames are captured back to back (the carousel is
+    at rest) and run through the detector as one batch.
+
+    Returns:
+        (Detections, frame): The voted detections (top confidence = vote margin) and the frame they
+        came from, for the archive and annotation.
+    """
+    registry.inc("bursts")
+    frames = []
+    for _ in range(BURST_FRAMES - 1):
+        frame = capture(newer_than=time.time(), same_slot=True)
+        if frame is None:
+            break
+        frames.append(frame)
+    results = [result] + (model.predict_batch(frames, conf=CONFIDENCE_THRESHOLD) if frames else [])
+    voted, margin, index = vote_detections(results)
+    votes = [r.classes[0] if len(r) else None for r in results]
+    if index is None:
+        logging.info(f"Burst of {len(results)} frames found no bean")
+        return voted, img
+    if len(result) == 0:
+        registry.inc("burst_resolved")
+    elif voted.classes[0] != result.classes[0]:
+        registry.inc("burst_changed")
+    logging.info(f"Burst vote {votes} -> {voted.classes[0]} (margin {margin:.2f})")
+    return voted, (img if index == 0 else frames[index - 1])
+
+def classify_bean(image):
+    """
+    Runs YOLO on the captured image and returns the detected class.
+
+    Only the first (most confident) detection is used; see classify_beans() for all of them.
+
+    Returns:
+        (bean_class, angle): bean_class is None if nothing was detected.
+    """
+    detections = classify_beans(image)
+    if not detections:
+        return None, 0
+    return detections[0].bean_class, detections[0].angle
+
+def log_bean(bean_id, detected_class, confidence, time_taken, box=None, angle=0, attempts=1, from_queue=False,
+             timings=None, lane=None, x_after=None):
+    """
+    Records one bean in the result store and as a "bean" event in the event log. Both only append to
+    an in-memory buffer or queue; background threads write them out.
+    """
+    class_name = coffee_beans_class.get(detected_class) if detected_class is not None else None
+    confidence = float(confidence) if confidence is not None else None
+    get_results().add(
+        bean_id, detected_class,
+        class_name=class_name,
+        confidence=confidence,
+        box=box, angle=angle, attempts=attempts, from_queue=from_queue,
+        time_taken=time_taken, timings=timings, lane=lane, config_version=config_version,
+        x_after=x_after,
+    )
+    log_event("bean", bean_id=bean_id, bean_class=detected_class, class_name=class_name, confidence=confidence,
+              box=box, angle=angle, attempts=attempts, from_queue=from_queue, time_taken=time_taken,
+              timings=timings, lane=lane, config_version=config_version, x_after=x_after)
 
 def read_from_arduino():
     """Reads data from Arduino."""
     try:
         response = arduino.readline().decode('utf-8').strip()
         if response:
-            print(f"Arduino response: {response}")
+            logging.debug(f"Arduino response: {response}")
             return response
     except Exception as e:
-        print(f"Error reading from Arduino: {e}")
         logging.error(f"Error reading from Arduino: {e}")
-        retry_arduino_connection()  # Retry connection if error occurs
-        intialize_arduino()  # Reinitialize Arduino communication
+        retry_arduino_connection()  # Reconnects and redoes the handshake
     return None
 
 def wait_for_response(expected_response, timeout=5):
@@ -208,17 +693,17 @@ def wait_for_response(expected_response, timeout=5):
         try:
             response = arduino.readline().decode('utf-8').strip()
         except Exception as e:
-            print(f"Error reading from Arduino: {e}")
+            logging.error(f"Error reading from Arduino: {e}")
             response = ""
         if response:
-            print(f"Arduino response recieved : {response}")
+            logging.debug(f"Arduino response recieved : {response}")
             if response == expected_response:
                 return True
     return False
 
 def intialize_arduino():
     """Initializes Arduino communication."""
-    print("Waiting for Arduino to signal readiness...")
+    logging.info("Waiting for Arduino to signal readiness...")
     start_time = time.time()
     while time.time() - start_time < 10:  # Timeout after 10 seconds
         if read_from_arduino() == "READY":
@@ -227,34 +712,196 @@ def intialize_arduino():
             send_to_arduino("START")
             time.sleep(0.5)
     else:
-        print("Timeout waiting for Arduino to signal readiness.")
         logging.error("Timeout waiting for Arduino to signal readiness.")
         return False
     return True
     
-def main():
+def finish_bean(record, lane=None):
+    """Counts and logs a bean the pipeline has finished (SortPipeline on_bean_done)."""
+    tag = f"[{lane}] " if lane else ""
+    if record.empty:
+        logging.debug(f"{tag}Slot {record.bean_id} was empty, stepped past without inference")
+        log_event("empty_slot", bean_id=record.bean_id, lane=lane, **record.presence)
+        return
+    registry.inc("beans_total")
+    registry.inc("beans_sorted" if record.bean_class is not None else "beans_failed")
+    registry.inc("classify_retries", max(0, record.attempts - 1))
+    if record.from_queue:
+        registry.inc("queue_dispatched")
+    registry.observe("cycle", record.time_taken)
+    logging.info(f"{tag}Bean {record.bean_id} sorted as {record.bean_class} in {record.time_taken:.2f}s "
+                 f"({record.attempts} attempt(s))")
+    log_bean(
+        bean_id=record.bean_id,
+        detected_class=record.bean_class,
+        confidence=record.confidence,
+        time_taken=record.time_taken,
+        box=record.box,
+        angle=record.angle,
+        attempts=record.attempts,
+        from_queue=record.from_queue,
+        timings=record.stage_times(),
+        lane=lane,
+    )
+
+def load_config(path=None, watch=True):
+    """
+    Applies the config file (all fields) at startup and starts watching it for changes.
+    Without a file the built-in constants are used; an invalid file stops the start.
+    """
+    global config_watcher, config_version
+    path = path or CONFIG_PATH
+    if not os.path.exists(path):
+        logging.info(f"No config file at {os.path.abspath(path)}, using the built-in settings")
+        return None
+    config = Config.load(path)
+    changed = apply_config(config, globals())
+    changed += _model_relative_paths(config)
+    apply_log_levels()
+    config_version = config.version
+    logging.info(f"Config {config.version} loaded from {path}" + (f", set {', '.join(changed)}" if changed else ""))
+    if watch:
+        config_watcher = ConfigWatcher(path, config, interval=CONFIG_CHECK_INTERVAL).start()
+    return config
+
+def _model_relative_paths(config):
+    """
+    Moves the files that live next to the detector weights (MODEL_FILES) to the folder of
+    MODEL_PATH, unless the config file gives their path itself. Returns the field names that changed.
+    """
+    changed = []
+    for name, file_name in MODEL_FILES.items():
+        path = os.path.join(os.path.dirname(MODEL_PATH), file_name)
+        if name not in config.values and globals()[name.upper()] != path:
+            globals()[name.upper()] = path
+            changed.append(name)
+    return changed
+
+def apply_pending_config():
+    """
+    Applies the hot fields of a changed config file. Called by a sort thread between its beans;
+    with several sort threads (lanes) it waits until none of them is in the middle of a bean.
+    """
+    config = config_watcher.take() if config_watcher is not None else None
+    if config is None:
+        return False
+    with reload_gate.exclusive():
+        _apply_hot_config(config)
+    return True
+
+def _apply_hot_config(config):
+    global config_version
+    changed = apply_config(config, globals(), hot_only=True)
+    if "confidence_threshold" in changed:
+        for cache in frame_caches:
+            cache.clear()  # cached detections were filtered with the old threshold
+    for pipeline in pipelines:
+        pipeline.step_time, pipeline.angle_time = STEP_SETTLE_TIME, ANGLE_SETTLE_TIME
+        pipeline.max_attempts = max_attempts()
+    if "angle_calibration_path" in changed:
+        load_angle_calibration()
+    if "log_level" in changed or "console_level" in changed:
+        apply_log_levels()
+    if archive is not None:
+        archive.sample_rates = dict(ARCHIVE_SAMPLE_RATES)
+        archive.quota_bytes = ARCHIVE_QUOTA_BYTES
+    logging.info(f"Config {config_version} -> {config.version} applied" +
+                 (f": {', '.join(f'{name}={globals()[name.upper()]!r}' for name in changed)}" if changed else ""))
+    config_version = config.version
+
+def apply_log_levels():
+    """Applies LOG_LEVEL and CONSOLE_LEVEL to the log handlers (see utils/logger.py)."""
+    set_log_level(LOG_LEVEL)
+    set_console_level(CONSOLE_LEVEL)
+
+def max_attempts():
+    """Detection attempts per bean: a burst already looked at several frames, so it is not repeated."""
+    return 1 if BURST_FRAMES > 1 else 2
+
+def run_pipelined():
+    """Runs the sort loop with imaging and actuation overlapped (SORT_MODE = "pipelined")."""
+    pipeline = SortPipeline(
+        capture=capture_image,
+        classify=classify_beans,
+        actuate=actuate,
+        sort_queue=sort_queue,
+        is_present=lambda frame, details: check_presence(frame, details=details),
+        verify_queued=lambda frame, detection, details: verify_queued(frame, detection, details=details),
+        on_bean_done=finish_bean,
+        between_beans=apply_pending_config,  # on the vision thread, before it starts on the next bean
+        reload_gate=reload_gate,
+        step_time=STEP_SETTLE_TIME,
+        angle_time=ANGLE_SETTLE_TIME,
+        max_attempts=max_attempts(),
+    )
+    pipelines.append(pipeline)
+    pipeline.run()
+
+def start_metrics():
+    """Starts the metrics endpoint / stats file and registers the component counters."""
+    registry.register_collector("camera", lambda: camera.stats() if camera is not None else {})
+    registry.register_collector("archive", lambda: archive.stats() if archive is not None else {})
+    registry.register_collector("serial", lambda: arduino_client.stats() if arduino_client is not None else {})
+    registry.register_collector("sort_queue", sort_queue.stats)
+    registry.register_collector("results", lambda: results.stats() if results is not None else {})
+    registry.register_collector("presence", lambda: presence.stats() if presence is not None else {})
+    registry.register_collector("frame_cache", lambda: frame_cache.stats() if frame_cache is not None else {})
+    registry.register_collector("colour", lambda: colour_classifier.stats() if colour_classifier else {})
+    registry.register_collector("config", lambda: config_watcher.stats() if config_watcher is not None else {})
+    if METRICS_PORT:
+        try:
+            registry.start_http_server(METRICS_PORT)
+        except OSError as e:
+            logging.error(f"Could not start metrics endpoint on port {METRICS_PORT}: {e}")
+    if STATS_FILE:
+        registry.start_stats_file(STATS_FILE)
+
+def main(mode=SORT_MODE):
+    get_results()
+    load_angle_calibration()
+    start_metrics()
+    # The model loads while the Arduino handshake runs
+    loader = preload_model()
+
     # Initialize serial communication with a higher baud rate (if desired)
-    global arduino
+    global arduino, arduino_client, alignment_moves
     logging.info("Initializing serial communication with Arduino...")
     arduino = None
-    try:
-        arduino = serial.Serial('COM7', 9600, timeout=1)
-        send_to_arduino("START")
-    except:
-        retry_arduino_connection()  # Retry connection if error occurs
-    time.sleep(1)  # Allow Arduino to initialize
-    print("arduino opened successfully")
-    logging.info("Serial communication with Arduino initialized successfully.")
-
-    if intialize_arduino():
+    if USE_SERIAL_ACKS:
+        arduino_client = SerialSupervisor(SERIAL_PORT, BAUD_RATE, hold_timeout=CONNECTION_HOLD_TIMEOUT).start()
+        if arduino_client.connection(SERIAL_CONNECT_TIMEOUT) is None:
+            arduino_client.stop()
+            raise ArduinoLinkError(f"No READY from the Arduino on {SERIAL_PORT} within {SERIAL_CONNECT_TIMEOUT}s "
+                                   f"({arduino_client.last_error})")
         logging.info("Received READY signal from Arduino. Starting sorting process...")
-        print("Arduino is ready. Starting sorting process...")
+    else:
+        try:
+            arduino = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+            send_to_arduino("START")
+        except Exception:
+            retry_arduino_connection(SERIAL_CONNECT_TIMEOUT)
+        time.sleep(1)  # Allow Arduino to initialize
+        logging.info("Serial communication with Arduino initialized successfully.")
+
+        if intialize_arduino():
+            logging.info("Received READY signal from Arduino. Starting sorting process...")
+
+    loader.join()
+    get_model()  # raises here if the background load failed
+    ready_after = time.perf_counter() - _IMPORT_START
+    logging.info(f"Startup report: {startup_report()}, ready to sort after {ready_after:.2f}s")
 
     try:
-        current_bean, attempts, sorted_count, confidence_score = 1, 0, 0, 0
+        if mode == "pipelined":
+            logging.info("Starting pipelined sorting process...")
+            run_pipelined()
+            return
+
+        current_bean, attempts, sorted_count = 1, 0, 0
         total_count = 0
-        logging.info("\n"*2 + "#"*60 + "#" + " "*15 + "Starting sorting process..." + " "*15 + "#" + "#" * 60)
+        logging.info("Starting sorting process...")
         while True:
+            apply_pending_config()  # between beans: a changed config never splits one bean
             total_count += 1 #remove if unnecessesery
             start_time = time.time()
             try:
@@ -262,73 +909,188 @@ def main():
             except NameError:
                 sorted_count = 0
 
-            logging.info("-"*60 + f"\nTotal beans sorted so far: {sorted_count}")
-            print("-" * 60 + "\nStepper motor stopped, capturing image...")
-            bean_class, angle = None, 0
-            image_path = capture_image()
+            logging.debug(f"Bean {total_count}: capturing image ({sorted_count} sorted so far)")
+            bean_class, angle, x_after = None, 0, None
+            timings = {}
+            detection = sort_queue.next()
+            if detection is not None:
+                # Seen in an earlier frame: only check that the bean is really at this position
+                logging.debug(f"Sorting bean queued from an earlier frame: {detection}")
+                frame = capture_image()
+                presence_details = {}
+                if frame is not None and not verify_queued(frame, detection, details=presence_details):
+                    logging.info(f"Slot {total_count} is empty, dropping {len(sort_queue) + 1} queued bean(s)")
+                    sort_queue.reject()
+                    log_event("empty_slot", bean_id=total_count, from_queue=True, **presence_details)
+                    send_to_arduino(str(current_bean))
+                    current_bean = 1
+                    attempts = 0
+                    actuate("STEP", STEP_SETTLE_TIME)
+                    continue
+                registry.inc("queue_dispatched")
+            else:
+                capture_start = time.perf_counter()
+                frame = capture_image()
+                timings["capture"] = time.perf_counter() - capture_start
 
-            if not image_path:
-                print("Error capturing image, skipping. <continue>")
-                continue
-            try:
-                bean_class, angle = classify_bean(image_path)  # YOLO classification
-            except Exception as e:
-                print(f"Error during classification: {e}")
-                logging.error(f"Error during classification: {e}")
-                bean_class = None
+                if frame is None:
+                    logging.warning("Error capturing image, skipping.")
+                    continue
+                presence_details = {}
+                if check_presence(frame, details=presence_details) is False:
+                    # Empty slot: drop the previous bean and move on without running the detector
+                    logging.debug(f"Slot {total_count} was empty, stepping without inference")
+                    log_event("empty_slot", bean_id=total_count, **presence_details)
+                    send_to_arduino(str(current_bean))
+                    current_bean = 1
+                    attempts = 0
+                    actuate("STEP", STEP_SETTLE_TIME)
+                    continue
+                try:
+                    detection = sort_queue.add_frame(classify_beans(frame))  # YOLO classification
+                except Exception as e:
+                    logging.error(f"Error during classification: {e}")
+                    detection = None
+            if detection is not None:
+                bean_class, angle = detection.bean_class, detection.angle
+                timings.update(detection.timings)
 
             if bean_class is None:
-                print(f"Attempt {attempts + 1} failed, retrying...")
+                logging.debug(f"Attempt {attempts + 1} found no bean")
+                registry.inc("classify_retries")
             attempts += 1
 
+            angle = sendable_angle(angle)  # whole degrees, never 0/1/2/-1 (servo commands, parse error)
             if angle != 0:
-                # angle = int(angle)  # Convert to integer for Arduino
-                print(f"Angle for stepper motor: {angle}")
-                send_to_arduino(str(angle))
-                logging.info(f"Angle sent to Arduino: {angle}")
-                time.sleep(1)  # Allow time for Arduino to process the angle
+                align_start = time.perf_counter()
+                actuate(str(angle), ANGLE_SETTLE_TIME)  # Wait for the Arduino to finish the correction
+                timings["aligned"] = time.perf_counter() - align_start
+                logging.debug(f"Angle sent to Arduino: {angle}")
+                alignment_moves += 1
+                if ALIGN_VERIFY_EVERY and alignment_moves % ALIGN_VERIFY_EVERY == 0 and not detection.from_queue:
+                    x_after = verify_alignment(frame, detection.x)
+                    logging.info(f"Alignment check: bean moved from x={detection.x} to x={x_after}")
         
             send_to_arduino(str(current_bean))
-            logging.info(f"sented to arduino : {bean_class}")
+            logging.debug(f"Servo set for the previous bean: {current_bean}")
 
-            if bean_class is None and attempts >= 2:
-                print("Failed to detect bean class after 2 attempts, skipping.")
-                send_to_arduino("STEP")
-                print("Arduino is ready for the next step.")
-                time.sleep(0.9)
-                attempts = 0
+            if bean_class is None and attempts >= max_attempts():
+                registry.inc("beans_skipped")
+                actuate("STEP", STEP_SETTLE_TIME)
                 current_bean = 1
-                logging.info("Failed to detect bean class after 2 attempts, skipping.")
+                logging.warning(f"Failed to detect bean class after {attempts} attempt(s), skipping.")
+                registry.inc("beans_total")
+                registry.inc("beans_failed")
+                registry.observe("cycle", time.time() - start_time)
+                log_bean(bean_id=total_count, detected_class=None, confidence=None,
+                         time_taken=time.time() - start_time, attempts=attempts, timings=timings)
+                attempts = 0
                 continue
             elif bean_class is not None:
                 sorted_count += 1
-                print(f"Detected Class: {bean_class}")
-                logging.info(f"current bean = {bean_class} && previous bean = {current_bean}")
+                logging.debug(f"current bean = {bean_class} && previous bean = {current_bean}")
                 current_bean = bean_class
 
             # In both cases, command the Arduino to rotate the stepper
-            logging.info("Rotating stepper motor...") 
-            send_to_arduino("STEP")
-            time.sleep(0.9)
-            print("-"*60 + "\n"*1)
+            logging.debug("Rotating stepper motor...")
+            step_start = time.perf_counter()
+            actuate("STEP", STEP_SETTLE_TIME)
+            timings["stepped"] = time.perf_counter() - step_start
             end_time = time.time()
             time_taken = end_time - start_time
+            registry.inc("beans_total")
+            registry.inc("beans_sorted" if bean_class is not None else "beans_failed")
+            registry.observe("cycle", time_taken)
+            logging.info(f"Bean {total_count} sorted as {bean_class} in {time_taken:.2f}s ({attempts} attempt(s))")
 
             # Log every bean whether detected or not
-            log_bean_to_csv(
+            log_bean(
                 bean_id=total_count,
                 detected_class=bean_class,
-                confidence=confidence_score,
-                time_taken=time_taken
+                confidence=detection.confidence if detection is not None else None,
+                time_taken=time_taken,
+                box=detection.box if detection is not None else None,
+                angle=angle,
+                attempts=attempts,
+                from_queue=detection.from_queue if detection is not None else False,
+                timings=timings,
+                x_after=x_after,
             )
 
     except KeyboardInterrupt:
-        print("Terminating...")
+        logging.info("Terminating...")
         send_to_arduino("STOP")  # Send stop signal to Arduino
+        if arduino_client is not None:
+            time.sleep(0.2)  # let the STOP go out before the port is closed
     except Exception as e:
-        print(f"Error: {e}")
+        logging.exception(f"Error: {e}")
     finally:
-        arduino.close()
+        if config_watcher is not None:
+            config_watcher.stop()
+        if arduino_client is not None:
+            logging.info(f"Serial stats: {arduino_client.stats()}")
+            arduino_client.stop()
+        if arduino is not None:
+            arduino.close()
+        if camera is not None:
+            logging.info(f"Camera stats: {camera.stats()}")
+            camera.stop()
+        logging.info(f"Sort queue stats: {sort_queue.stats()}")
+        if presence is not None:
+            logging.info(f"Presence gate stats: {presence.stats()}")
+        if frame_cache is not None:
+            logging.info(f"Frame cache stats: {frame_cache.stats()}")
+        if colour_classifier:
+            logging.info(f"Colour classifier stats: {colour_classifier.stats()}")
+        if archive is not None:
+            logging.info(f"Archive stats: {archive.stats()}")
+            archive.stop()
+        if results is not None:
+            results.close()  # flushes the last buffered beans
+            logging.info(f"Result store stats: {results.stats()}")
+
+startup_times["import"] = time.perf_counter() - _IMPORT_START
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # The config file comes first so the command line defaults below show (and can override) its values
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument("--config", default=CONFIG_PATH,
+                            help="runtime config file; missing means built-in settings (default: %(default)s)")
+    known, _ = pre_parser.parse_known_args()
+    try:
+        load_config(known.config)
+    except (OSError, ConfigError) as e:
+        raise SystemExit(f"Invalid config {known.config}: {e}")
+
+    parser = argparse.ArgumentParser(description="Coffee bean sorting machine", parents=[pre_parser])
+    parser.add_argument("--mode", choices=["sequential", "pipelined"], default=SORT_MODE,
+                        help="sort loop mode (default: %(default)s)")
+    parser.add_argument("--port", default=SERIAL_PORT,
+                        help="Arduino serial port, e.g. the pty printed by arduino_emulator.py (default: %(default)s)")
+    parser.add_argument("--camera-backend", default=CAMERA_BACKEND, choices=["stream", "snapshot", "file"],
+                        help="capture backend (default: %(default)s)")
+    parser.add_argument("--camera", default=None,
+                        help="stream URL, snapshot URL, or image folder / video file, depending on the backend")
+    parser.add_argument("--engine", default=INFERENCE_ENGINE, choices=["torch", "onnx", "openvino"],
+                        help="inference backend (default: %(default)s)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="load and warm up the model, print the startup timings and exit")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_true",
+                           help="print every capture, angle and serial command on the console (DEBUG)")
+    verbosity.add_argument("-q", "--quiet", action="store_true", help="only print warnings and errors")
+    args = parser.parse_args()
+    if args.verbose or args.quiet:
+        CONSOLE_LEVEL = "DEBUG" if args.verbose else "WARNING"
+        apply_log_levels()
+    SERIAL_PORT, CAMERA_BACKEND, INFERENCE_ENGINE = args.port, args.camera_backend, args.engine
+    if args.camera and CAMERA_BACKEND == "snapshot":
+        SNAPSHOT_URL = args.camera
+    elif args.camera:
+        CAMERA_URL = args.camera
+    if args.startup_report:
+        get_model()
+        for stage, seconds in startup_report().items():
+            print(f"{stage:>13}: {seconds:.3f}s" if isinstance(seconds, float) else f"{stage:>13}: {seconds}")
+    else:
+        main(mode=args.mode)
\ No newline at end of file
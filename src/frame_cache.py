@@ -0,0 +1,114 @@
+import collections
+import threading
+import time
+import cv2
+import numpy as np
+
+
+def thumbnail(image, size=16):
+    """size x size BGR thumbnail (two 2x area halvings first: much faster than one large INTER_AREA resize)."""
+    small = image
+    for _ in range(2):
+        if small.shape[0] >= 4 * size and small.shape[1] >= 4 * size:
+            small = cv2.resize(small, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    return cv2.resize(small, (size + 1, size), interpolation=cv2.INTER_AREA)
+
+
+def dhash(thumb, margin=3):
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of the grayscale thumbnail, set when
+    the right pixel is brighter by more than margin (so flat background hashes to stable zeros, not noise).
+    """
+    gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY).astype(np.int16) if thumb.ndim == 3 else thumb.astype(np.int16)
+    bits = (gray[:, 1:] - gray[:, :-1] > margin).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class FrameCache:
+    """
+    Small LRU cache of detector results keyed on a perceptual hash of the ROI.
+
+    A frame matches a cached entry when the difference hashes are within `tolerance` bits of each other
+    and no cell of the 16x16 colour thumbnails differs by more than `colour_tolerance` gray levels. The
+    thumbnail check keeps a bean of another roast grade at the same spot from reusing the old class.
+    Entries expire after `max_age` seconds, so a result is only reused for the same carousel position
+    (retries after a failed detection, or the same empty scene shown again). get(), put() and clear()
+    are thread-safe (a config reload clears the cache from another thread).
+
+    Parameters:
+        max_entries (int): LRU capacity.
+        max_age (float): Seconds an entry may be reused.
+        tolerance (int): Maximum Hamming distance between hashes (of 256 bits).
+        colour_tolerance (float): Maximum per-cell thumbnail difference.
+    """
+
+    def __init__(self, max_entries=16, max_age=2.0, tolerance=8, colour_tolerance=12.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.tolerance = tolerance
+        self.colour_tolerance = colour_tolerance
+        self._entries = collections.OrderedDict()  # hash -> (time, thumbnail, value, cost)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.saved_time = 0.0
+        self.last_key_time = 0.0
+
+    def key(self, image):
+        """Returns the cache key (hash, thumbnail) for a BGR ROI."""
+        start = time.perf_counter()
+        thumb = thumbnail(image)
+        key = (dhash(thumb), thumb[:, :-1].astype(np.int16))
+        self.last_key_time = time.perf_counter() - start
+        return key
+
+    def get(self, key):
+        """Returns the cached value for a near-duplicate frame, or None."""
+        h, thumb = key
+        now = time.time()
+        with self._lock:
+            for stored in list(self._entries):
+                created, stored_thumb, value, cost = self._entries[stored]
+                if now - created > self.max_age:
+                    del self._entries[stored]
+                    self.expired += 1
+                    continue
+                if bin(h ^ stored).count("1") <= self.tolerance \
+                        and np.abs(thumb - stored_thumb).max() <= self.colour_tolerance:
+                    self._entries.move_to_end(stored)
+                    self.hits += 1
+                    self.saved_time += cost
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value, cost=0.0):
+        """Stores a result; cost is the time it took to compute (reported as saved_time on hits)."""
+        h, thumb = key
+        with self._lock:
+            self._entries[h] = (time.time(), thumb, value, cost)
+            self._entries.move_to_end(h)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "saved_time": self.saved_time,
+            "last_key_time": self.last_key_time,
+        }
@@ -0,0 +1,297 @@
+import hashlib
+import os
+import shutil
+import time
+import cv2
+import numpy as np
+from utils.logger import logging
+
+# Exported models are cached here, one folder per weights hash
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", ".cache")
+
+
+class Detections:
+    """Backend-independent detections for one image."""
+
+    def __init__(self, classes, confidences, boxes):
+        self.classes = [int(c) for c in classes]
+        self.confidences = [float(c) for c in confidences]
+        self.boxes = np.asarray(boxes, dtype=int).reshape(-1, 4)  # (x1, y1, x2, y2) per detection
+
+    def __len__(self):
+        return len(self.classes)
+
+    @classmethod
+    def from_result(cls, result):
+        """Converts an ultralytics Results object."""
+        boxes = result.boxes
+        return cls(boxes.cls.tolist(), boxes.conf.tolist(), boxes.xyxy.cpu().numpy())
+
+    def above(self, conf):
+        """The detections with a confidence of at least conf (same order)."""
+        keep = [i for i, c in enumerate(self.confidences) if c >= conf]
+        if len(keep) == len(self.classes):
+            return self
+        return Detections([self.classes[i] for i in keep], [self.confidences[i] for i in keep], self.boxes[keep])
+
+
+def vote_detections(results):
+    """
+    Confidence-weighted vote over several frames of the same bean.
+
+    Every frame votes for the class of its top detection with that detection's confidence; frames
+    without a detection vote for nothing. The winner's margin, (winning weight - runner-up weight)
+    divided by the number of frames, is 1.0 for a unanimous burst of certain detections and drops
+    with disagreement, low confidence and missed frames.
+
+    Parameters:
+        results (list[Detections]): One per frame.
+
+    Returns:
+        (Detections, margin, index): The detections of the frame with the strongest vote for the
+        winning class, with the top confidence replaced by the margin; index is that frame's position
+        in results (None and an empty Detections if no frame found a bean).
+    """
+    weights, best = {}, {}
+    for i, result in enumerate(results):
+        if len(result) == 0:
+            continue
+        bean_class, confidence = result.classes[0], result.confidences[0]
+        weights[bean_class] = weights.get(bean_class, 0.0) + confidence
+        if bean_class not in best or confidence > results[best[bean_class]].confidences[0]:
+            best[bean_class] = i
+    if not weights:
+        return Detections([], [], []), 0.0, None
+    ranked = sorted(weights.values(), reverse=True)
+    winner = max(weights, key=weights.get)
+    margin = (ranked[0] - (ranked[1] if len(ranked) > 1 else 0.0)) / len(results)
+    index = best[winner]
+    result = results[index]
+    return Detections(result.classes, [margin] + result.confidences[1:], result.boxes), margin, index
+
+
+def weights_hash(path, chunk_size=1 << 20):
+    """SHA-256 of the weights file (first 16 hex digits), used as the export cache key."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def export_cached(weights, export_format, imgsz=640, cache_dir=CACHE_DIR, **export_args):
+    """
+    Exports the PyTorch weights to another runtime format, reusing an earlier export of the same weights.
+
+    Returns:
+        str: Path of the exported model (file or folder, as ultralytics produces it).
+    """
+    key_dir = os.path.join(os.path.abspath(cache_dir), weights_hash(weights), f"{export_format}_{imgsz}")
+    marker = os.path.join(key_dir, "exported_path.txt")
+    if os.path.exists(marker):
+        with open(marker) as f:
+            exported = os.path.join(key_dir, f.read().strip())
+        if os.path.exists(exported):
+            return exported
+
+    from ultralytics import YOLO  # only needed once per weights file, the runtime engines do not use it
+
+    os.makedirs(key_dir, exist_ok=True)
+    local_weights = os.path.join(key_dir, "model.pt")
+    shutil.copyfile(weights, local_weights)
+    logging.info(f"Exporting {weights} to {export_format} (imgsz={imgsz}), this only happens once per weights file")
+    start = time.perf_counter()
+    exported = YOLO(local_weights).export(format=export_format, imgsz=imgsz, **export_args)
+    logging.info(f"Export finished in {time.perf_counter() - start:.1f}s: {exported}")
+    with open(marker, "w") as f:
+        f.write(os.path.relpath(exported, key_dir))
+    return exported
+
+
+class InferenceEngine:
+    """
+    Common interface for the detector backends.
+
+    Parameters:
+        weights (str): Path to the PyTorch weights (.pt) the engine is built from.
+        conf (float): Default confidence threshold.
+        imgsz (int): Inference image size.
+    """
+
+    name = "base"
+
+    def __init__(self, weights, conf=0.6, imgsz=640):
+        if not os.path.exists(weights):
+            raise FileNotFoundError(f"Model weights not found: {os.path.abspath(weights)}")
+        self.weights = weights
+        self.conf = conf
+        self.imgsz = imgsz
+        self.model = self._load()
+
+    def _load(self):
+        raise NotImplementedError
+
+    def predict_batch(self, images, conf=None):
+        """Runs the detector on a list of BGR images and returns one Detections per image."""
+        conf = self.conf if conf is None else conf
+        results = self.model(list(images), conf=conf, imgsz=self.imgsz, verbose=False)
+        return [Detections.from_result(r) for r in results]
+
+    def predict(self, image, conf=None):
+        """Runs the detector on one BGR image."""
+        return self.predict_batch([image], conf)[0]
+
+    def warmup(self, shape=(310, 472, 3), runs=2):
+        """Runs a few dummy inferences so the first real bean does not pay for lazy initialisation."""
+        dummy = np.full(shape, 114, dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(runs):
+            self.predict(dummy)
+        elapsed = time.perf_counter() - start
+        logging.info(f"{self.name} engine warmed up in {elapsed:.2f}s")
+        return elapsed
+
+
+class TorchEngine(InferenceEngine):
+    """ultralytics / PyTorch, the reference implementation."""
+
+    name = "torch"
+
+    def _load(self):
+        from ultralytics import YOLO
+        return YOLO(self.weights)
+
+    def predict_batch(self, images, conf=None):
+        # The PyTorch model handles rectangular letterboxing itself, keep its default image size
+        conf = self.conf if conf is None else conf
+        results = self.model(list(images), conf=conf, verbose=False)
+        return [Detections.from_result(r) for r in results]
+
+
+def letterbox(image, size):
+    """
+    Scales a BGR image to fit size x size without changing its aspect ratio and pads it with grey
+    (114), like the ultralytics preprocessing.
+
+    Returns:
+        (padded, scale, (pad_x, pad_y)): padded is the size x size image.
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = int(round(h * scale)), int(round(w * scale))
+    resized = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR) if (nh, nw) != (h, w) else image
+    top, left = int(round((size - nh) / 2 - 0.1)), int(round((size - nw) / 2 - 0.1))
+    padded = np.full((size, size, 3), 114, dtype=np.uint8)
+    padded[top:top + nh, left:left + nw] = resized
+    return padded, scale, (left, top)
+
+
+def to_blob(padded_images):
+    """Stacks letterboxed BGR images into the float32 NCHW RGB tensor (0..1) the exported models expect."""
+    batch = np.stack(padded_images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+def decode_output(output, conf, scale, pad, shape, iou=0.7, max_det=300):
+    """
+    Turns the raw output of an exported YOLOv8 detector for one image into Detections.
+
+    Parameters:
+        output (numpy.ndarray): (4 + classes, candidates): centre x, centre y, width, height in
+            letterboxed pixels, then one score per class.
+        conf (float): Confidence threshold.
+        scale, pad: From letterbox(), to map the boxes back to the original image.
+        shape (tuple): Original image shape, boxes are clipped to it.
+        iou (float): Per-class non-maximum suppression threshold (the ultralytics default).
+
+    Returns:
+        Detections: Highest confidence first.
+    """
+    scores = output[4:]
+    classes = scores.argmax(axis=0)
+    confidences = scores[classes, np.arange(scores.shape[1])]
+    keep = confidences >= conf
+    if not keep.any():
+        return Detections([], [], [])
+    cx, cy, w, h = output[:4, keep]
+    classes, confidences = classes[keep], confidences[keep]
+    x1 = (cx - w / 2 - pad[0]) / scale
+    y1 = (cy - h / 2 - pad[1]) / scale
+    x2 = (cx + w / 2 - pad[0]) / scale
+    y2 = (cy + h / 2 - pad[1]) / scale
+    height, width = shape[:2]
+    boxes = np.stack([x1.clip(0, width), y1.clip(0, height), x2.clip(0, width), y2.clip(0, height)], axis=1)
+    rects = [[float(a), float(b), float(c - a), float(d - b)] for a, b, c, d in boxes]
+    picked = cv2.dnn.NMSBoxesBatched(rects, confidences.astype(float).tolist(), classes.tolist(), conf, iou)
+    picked = sorted(np.asarray(picked, dtype=int).ravel().tolist(), key=lambda i: -confidences[i])[:max_det]
+    return Detections(classes[picked], confidences[picked], boxes[picked])
+
+
+class ExportedEngine(InferenceEngine):
+    """
+    Base of the engines that run an exported model on its own runtime. Pre- and post-processing
+    (letterbox, box decoding, NMS) are done here with numpy and OpenCV, so neither ultralytics nor
+    torch is imported at runtime; ultralytics is only needed once, to export the weights.
+    """
+
+    def _run(self, blob):
+        raise NotImplementedError
+
+    def predict_batch(self, images, conf=None):
+        conf = self.conf if conf is None else conf
+        prepared = [letterbox(image, self.imgsz) for image in images]
+        output = self._run(to_blob([padded for padded, _, _ in prepared]))
+        return [decode_output(out, conf, scale, pad, image.shape)
+                for out, image, (_, scale, pad) in zip(output, images, prepared)]
+
+
+class OnnxEngine(ExportedEngine):
+    """ONNX Runtime on the CPU (needs onnxruntime)."""
+
+    name = "onnx"
+
+    def _load(self):
+        import onnxruntime
+        path = export_cached(self.weights, "onnx", imgsz=self.imgsz, dynamic=True, simplify=True)
+        session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self._input = session.get_inputs()[0].name
+        return session
+
+    def _run(self, blob):
+        return self.model.run(None, {self._input: blob})[0]
+
+
+class OpenVinoEngine(ExportedEngine):
+    """OpenVINO on the CPU (needs openvino)."""
+
+    name = "openvino"
+
+    def _load(self):
+        import glob
+        import openvino
+        folder = export_cached(self.weights, "openvino", imgsz=self.imgsz)
+        xml = glob.glob(os.path.join(folder, "*.xml"))[0]
+        core = openvino.Core()
+        return core.compile_model(core.read_model(xml), "CPU")
+
+    def _run(self, blob):
+        # The OpenVINO export has a static batch size of 1
+        output = self.model.output(0)
+        return np.concatenate([self.model([image[None]])[output] for image in blob])
+
+
+ENGINES = {
+    TorchEngine.name: TorchEngine,
+    OnnxEngine.name: OnnxEngine,
+    OpenVinoEngine.name: OpenVinoEngine,
+}
+
+
+def create_engine(name, weights, conf=0.6, imgsz=640, warmup=True):
+    """Builds the engine selected by name ("torch", "onnx" or "openvino") and warms it up."""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown inference engine '{name}', choose one of {sorted(ENGINES)}")
+    engine = ENGINES[name](weights, conf=conf, imgsz=imgsz)
+    if warmup:
+        engine.warmup()
+    return engine
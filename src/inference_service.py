@@ -0,0 +1,160 @@
+"""
+Shared detector for several sorting lanes.
+
+Every lane submits its ROI to one InferenceService, which owns the only copy of the model. A worker
+thread collects the requests into micro-batches: the first request of a batch waits at most
+max_wait seconds for requests from other lanes (or until max_batch are queued), then the whole batch
+goes through engine.predict_batch() in one call. With N lanes the detector runs roughly once per
+round of beans instead of N times, and a lone request costs at most max_wait extra latency.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from metrics import registry
+from utils.logger import logging
+
+
+class _Request:
+    __slots__ = ("image", "conf", "future", "queued")
+
+    def __init__(self, image, conf):
+        self.image = image
+        self.conf = conf
+        self.future = Future()
+        self.queued = time.perf_counter()
+
+
+class InferenceService:
+    """
+    Parameters:
+        engine (InferenceEngine): The detector; only the service thread calls it.
+        max_batch (int): Largest batch sent to the engine (usually the number of lanes).
+        max_wait (float): Latency budget: seconds the oldest request may wait for others to join its batch.
+        conf (float): Default confidence threshold for requests that do not set one.
+    """
+
+    def __init__(self, engine, max_batch=4, max_wait=0.010, conf=None):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.conf = conf
+        self._queue = queue.Queue()
+        self._running = False
+        self._thread = None
+
+        # Counters
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.batch_sizes = {}  # batch size -> number of batches
+        self.total_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.total_batch_time = 0.0
+        self.last_batch_time = 0.0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="inference-service", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def submit(self, image, conf=None):
+        """Queues one BGR image; returns a Future that resolves to its Detections."""
+        if not self._running:
+            raise RuntimeError("Inference service is not running")
+        request = _Request(image, self.conf if conf is None else conf)
+        self.requests += 1
+        self._queue.put(request)
+        return request.future
+
+    def predict(self, image, conf=None, timeout=None):
+        """Blocking call with the same shape as InferenceEngine.predict(), so it can stand in for it."""
+        return self.submit(image, conf).result(timeout)
+
+    def predict_batch(self, images, conf=None, timeout=None):
+        """Submits several images at once (they can share a batch) and waits for all of them."""
+        futures = [self.submit(image, conf) for image in images]
+        return [future.result(timeout) for future in futures]
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first.queued + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:  # stop(): finish this batch first
+                self._running = False
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while self._running:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            self._run_batch(batch)
+        # Anything submitted after stop() gets an error instead of hanging its lane
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError("Inference service stopped"))
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        for request in batch:
+            wait = start - request.queued
+            self.total_wait += wait
+            self.max_queue_wait = max(self.max_queue_wait, wait)
+            registry.observe("batch_wait", wait)
+        # Requests may carry different thresholds (e.g. during a config reload): run the batch at the
+        # lowest one and drop the weaker detections per request
+        confs = [r.conf for r in batch]
+        conf = None if None in confs else min(confs)
+        try:
+            results = self.engine.predict_batch([r.image for r in batch], conf)
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Batched inference of {len(batch)} image(s) failed: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        self.last_batch_time = time.perf_counter() - start
+        self.total_batch_time += self.last_batch_time
+        registry.observe("batch_inference", self.last_batch_time)
+        self.batches += 1
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+        for request, result in zip(batch, results):
+            request.future.set_result(result if conf is None else result.above(request.conf))
+
+    def stats(self):
+        served = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "errors": self.errors,
+            "avg_batch_size": served / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(self.batch_sizes),
+            "avg_queue_wait": self.total_wait / served if served else 0.0,
+            "max_queue_wait": self.max_queue_wait,
+            "avg_batch_time": self.total_batch_time / self.batches if self.batches else 0.0,
+            "last_batch_time": self.last_batch_time,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,278 @@
+"""
+Runs several sorting lanes from one process with one copy of the detector.
+
+Each lane is a complete sorter unit: its own Arduino (SerialSupervisor), camera backend, sort queue,
+presence detector, frame cache and SortPipeline state machine, running in its own threads. The lanes
+share the result store, the image archive, the colour classifier and an InferenceService that
+micro-batches the detector calls of all lanes (inference_service.py). A lane's serial link and
+camera reconnect on their own (supervisor.py); a lane that fails anyway stops, and the others keep
+sorting.
+
+Lanes are listed in LANES below or in a JSON file with the same fields:
+    [{"name": "A", "port": "COM7", "camera": "http://192.168.1.11:8080/video"},
+     {"name": "B", "port": "COM8", "camera": "http://192.168.1.12:8080/shot.jpg", "backend": "snapshot"}]
+
+Optional per-lane fields: "backend" (default final.CAMERA_BACKEND), "roi" (default final.CROP_BOX),
+"decode_scale" (snapshot backend), "baudrate".
+
+Run from the src folder:
+    python lanes.py
+    python lanes.py --lanes lanes.json --max-wait 0.015
+    python lanes.py -q                  # console: warnings and errors only
+
+The runtime config (sorter.yaml, see config.py) applies to every lane. The first lane to reach a
+bean boundary after the file changed applies the hot fields; final.reload_gate holds it until the
+other lanes have finished their current bean, and holds them until the reload is done.
+"""
+import argparse
+import json
+import threading
+import time
+import final
+from camera import create_camera
+from config import ConfigError
+from frame_cache import FrameCache
+from inference_service import InferenceService
+from metrics import registry
+from pipeline import SortPipeline
+from presence import PresenceDetector
+from serial_client import ArduinoError, ArduinoLinkError
+from sort_queue import SortQueue
+from supervisor import CameraSupervisor, SerialSupervisor
+from utils.logger import logging
+
+LANES = [
+    {"name": "A", "port": "COM7", "camera": "http://192.168.1.11:8080/video"},
+    {"name": "B", "port": "COM8", "camera": "http://192.168.1.12:8080/video"},
+    {"name": "C", "port": "COM9", "camera": "http://192.168.1.13:8080/video"},
+]
+# Latency budget of the shared detector: how long a lane's frame may wait for the other lanes' frames
+BATCH_MAX_WAIT = 0.010
+# Largest detector batch (None: the number of lanes)
+BATCH_MAX_SIZE = None
+
+
+class Lane:
+    """
+    One sorter unit. classify/capture/actuate are the callbacks its SortPipeline runs.
+
+    Parameters:
+        name (str): Lane name, stored with every bean record and used in archive file names.
+        port (str): Arduino serial port.
+        camera (str): Stream URL, snapshot URL or file/folder, depending on backend.
+        service (InferenceService): The shared detector.
+        backend (str): Capture backend (see camera.py).
+        roi (tuple): (y1, y2, x1, x2) bean region of this lane's camera.
+        decode_scale (int): Snapshot decode scale.
+        baudrate (int): Serial baud rate.
+    """
+
+    def __init__(self, name, port, camera, service, backend=None, roi=None, decode_scale=1, baudrate=None):
+        self.name = name
+        self.port = port
+        self.source = camera
+        self.service = service
+        self.backend = backend or final.CAMERA_BACKEND
+        self.roi = tuple(roi) if roi is not None else final.CROP_BOX
+        self.decode_scale = decode_scale
+        self.client = SerialSupervisor(port, baudrate or final.BAUD_RATE, hold_timeout=final.CONNECTION_HOLD_TIMEOUT)
+        self.camera = None
+        self.sort_queue = SortQueue()
+        self.presence = PresenceDetector() if final.PRESENCE_GATE else None
+        self.cache = FrameCache() if final.FRAME_CACHE else None
+        if self.cache is not None:
+            final.frame_caches.append(self.cache)
+        self.pipeline = None
+        self.error = None
+        self._thread = None
+
+        # Counters
+        self.capture_failures = 0
+        self.serial_errors = 0
+
+    def start(self):
+        """Opens the serial port and camera, waits for READY, and starts the lane's pipeline thread."""
+        self.client.start()
+        if self.client.connection(final.SERIAL_CONNECT_TIMEOUT) is None:
+            raise ArduinoLinkError(f"No READY on {self.port} within {final.SERIAL_CONNECT_TIMEOUT}s "
+                                   f"({self.client.last_error})")
+        options = {"decode_scale": self.decode_scale} if self.backend == "snapshot" else {}
+        self.camera = CameraSupervisor(
+            lambda: create_camera(self.backend, self.source, roi=self.roi, **options)).start()
+        self.pipeline = SortPipeline(
+            capture=self.capture,
+            classify=self.classify,
+            actuate=self.actuate,
+            sort_queue=self.sort_queue,
+            is_present=self.is_present,
+            verify_queued=self.verify_queued,
+            on_bean_done=lambda record: final.finish_bean(record, lane=self.name),
+            between_beans=final.apply_pending_config,
+            reload_gate=final.reload_gate,
+            step_time=final.STEP_SETTLE_TIME,
+            angle_time=final.ANGLE_SETTLE_TIME,
+            max_attempts=final.max_attempts(),
+        )
+        final.pipelines.append(self.pipeline)
+        self._thread = threading.Thread(target=self._run, name=f"lane-{self.name}", daemon=True)
+        self._thread.start()
+        logging.info(f"Lane {self.name} started (port {self.port}, {self.backend} camera {self.source})")
+        return self
+
+    def _run(self):
+        try:
+            self.pipeline.run()
+        except Exception as e:
+            self.error = e
+            registry.inc("lane_failures")
+            logging.error(f"Lane {self.name} stopped: {e}")
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.client.connected:
+            try:
+                self.client.send("STOP")
+                time.sleep(0.2)  # let the STOP go out before the port is closed
+            except ArduinoError:
+                pass
+        self.client.stop()
+        if self.camera is not None:
+            self.camera.stop()
+
+    def capture(self, newer_than=None, same_slot=False):
+        ret, frame = self.camera.read(newer_than=newer_than, same_slot=same_slot)
+        if not ret:
+            self.capture_failures += 1
+            registry.inc("capture_failures")
+            logging.error(f"Lane {self.name}: error capturing image.")
+            return None
+        return frame
+
+    def is_present(self, image, details=None):
+        if self.presence is None:
+            return None
+        return final.check_presence(image, detector=self.presence, details=details)
+
+    def verify_queued(self, image, detection, details=None):
+        return final.verify_queued(image, detection, detector=self.presence, details=details)
+
+    def classify(self, image):
+        return final.classify_beans(image, model=self.service, detector=self.presence, cache=self.cache,
+                                    lane=self.name, capture=self.capture)
+
+    def actuate(self, command, settle_time=0):
+        try:
+            self.client.command(command)
+        except ArduinoError as e:
+            self.serial_errors += 1
+            registry.inc("serial_errors")
+            logging.error(f"Lane {self.name}: error from Arduino for command '{command}': {e}")
+
+    def stats(self):
+        stats = {
+            "running": self.running,
+            "capture_failures": self.capture_failures,
+            "serial_errors": self.serial_errors,
+            "serial": self.client.stats(),
+            "sort_queue": self.sort_queue.stats(),
+        }
+        if self.camera is not None:
+            stats["camera"] = self.camera.stats()
+        if self.presence is not None:
+            stats["presence"] = self.presence.stats()
+        if self.cache is not None:
+            stats["frame_cache"] = self.cache.stats()
+        return stats
+
+
+def load_lanes(path):
+    with open(path) as f:
+        lanes = json.load(f)
+    names = [lane["name"] for lane in lanes]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Lane names must be unique: {names}")
+    return lanes
+
+
+def run(lane_configs, max_wait=BATCH_MAX_WAIT, max_batch=BATCH_MAX_SIZE):
+    """Starts the shared services and every lane, then blocks until all lanes stopped or Ctrl+C."""
+    # The lanes share these; create them before any lane thread can race to build its own
+    final.get_results()
+    final.get_archive()
+    final.get_colour_classifier()
+    final.load_angle_calibration()
+    engine = final.get_model()
+    service = InferenceService(engine, max_batch=max_batch or len(lane_configs), max_wait=max_wait,
+                               conf=final.CONFIDENCE_THRESHOLD).start()
+    lanes = [Lane(service=service, **config) for config in lane_configs]
+
+    final.start_metrics()
+    registry.register_collector("inference_service", service.stats)
+    for lane in lanes:
+        registry.register_collector(f"lane_{lane.name}", lambda lane=lane: {
+            k: v for k, v in lane.stats().items() if not isinstance(v, dict)})
+
+    try:
+        for lane in lanes:
+            try:
+                lane.start()
+            except Exception as e:
+                lane.error = e
+                logging.error(f"Lane {lane.name} could not start: {e}")
+        logging.info(f"Sorting on {sum(lane.running for lane in lanes)} of {len(lanes)} lane(s)")
+        while any(lane.running for lane in lanes):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        logging.info("Terminating...")
+    finally:
+        for lane in lanes:
+            lane.stop()
+            logging.info(f"Lane {lane.name} stats: {lane.stats()}")
+        service.stop()
+        logging.info(f"Inference service stats: {service.stats()}")
+        if final.config_watcher is not None:
+            final.config_watcher.stop()
+        if final.colour_classifier:
+            logging.info(f"Colour classifier stats: {final.colour_classifier.stats()}")
+        if final.archive is not None:
+            logging.info(f"Archive stats: {final.archive.stats()}")
+            final.archive.stop()
+        if final.results is not None:
+            final.results.close()
+            logging.info(f"Result store stats: {final.results.stats()}")
+    return lanes
+
+
+if __name__ == "__main__":
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument("--config", default=final.CONFIG_PATH,
+                            help="runtime config file; missing means built-in settings (default: %(default)s)")
+    known, _ = pre_parser.parse_known_args()
+    try:
+        final.load_config(known.config)
+    except (OSError, ConfigError) as e:
+        raise SystemExit(f"Invalid config {known.config}: {e}")
+
+    parser = argparse.ArgumentParser(description="Run several sorting lanes with one shared detector",
+                                     parents=[pre_parser])
+    parser.add_argument("--lanes", help="JSON file with the lane list (default: LANES in lanes.py)")
+    parser.add_argument("--engine", default=final.INFERENCE_ENGINE, choices=["torch", "onnx", "openvino"],
+                        help="inference backend (default: %(default)s)")
+    parser.add_argument("--max-wait", type=float, default=BATCH_MAX_WAIT,
+                        help="seconds a frame may wait for other lanes to join its batch (default: %(default)s)")
+    parser.add_argument("--max-batch", type=int, default=BATCH_MAX_SIZE,
+                        help="largest detector batch (default: the number of lanes)")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_true", help="debug output on the console")
+    verbosity.add_argument("-q", "--quiet", action="store_true", help="only print warnings and errors")
+    args = parser.parse_args()
+    if args.verbose or args.quiet:
+        final.CONSOLE_LEVEL = "DEBUG" if args.verbose else "WARNING"
+        final.apply_log_levels()
+    final.INFERENCE_ENGINE = args.engine
+    run(load_lanes(args.lanes) if args.lanes else LANES, max_wait=args.max_wait, max_batch=args.max_batch)
@@ -0,0 +1,243 @@
+"""
+Lightweight, always-on metrics for the sorting loop.
+
+Timers and counters cost about a microsecond per call: recording is a bucket increment plus an append
+to a fixed-size ring of recent samples. Percentiles are only computed when the metrics are read,
+either over HTTP in Prometheus text format or from a periodically rewritten JSON stats file.
+
+    from metrics import registry, timed
+
+    @timed("capture_image")
+    def capture_image(): ...
+
+    registry.inc("beans_skipped")
+    registry.start_http_server(9108)         # http://localhost:9108/metrics
+    registry.start_stats_file("stats.json")
+"""
+import bisect
+import collections
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.logger import logging
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Cumulative Prometheus-style buckets plus a rolling window of recent samples for percentiles."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1024):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[i] += 1
+            self.count += 1
+            self.sum += value
+            self.recent.append(value)
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """Percentiles (same unit as the samples) over the rolling window."""
+        with self._lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return {q: None for q in qs}
+        return {q: samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))] for q in qs}
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="sorter"):
+        self.prefix = prefix
+        self.counters = collections.defaultdict(int)
+        self.histograms = {}
+        self.collectors = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._server = None
+        self._stats_thread = None
+
+    def inc(self, name, value=1):
+        with self._lock:  # += on a dict entry is not atomic across threads (lanes, pipeline workers)
+            self.counters[name] += value
+
+    def _counters(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def histogram(self, name):
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(name, Histogram())
+        return hist
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def timer(self, name):
+        """Context manager that records the duration of its block in the named histogram (also kept as .elapsed)."""
+        return _Timer(self.histogram(name))
+
+    def timed(self, name):
+        """Decorator version of timer()."""
+        def decorator(fn):
+            hist = self.histogram(name)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    hist.observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def register_collector(self, name, fn):
+        """Adds gauges read at scrape time from fn() -> dict (e.g. camera.stats); non-numeric values are skipped."""
+        self.collectors[name] = fn
+
+    def _gauges(self):
+        gauges = {}
+        for name, fn in list(self.collectors.items()):
+            try:
+                values = fn() or {}
+            except Exception as e:
+                logging.error(f"Metrics collector {name} failed: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    gauges[f"{name}_{key}"] = value
+        return gauges
+
+    def snapshot(self):
+        """All metrics as a plain dict (used for the stats file)."""
+        stages = {}
+        for name, hist in list(self.histograms.items()):
+            p = hist.percentiles()
+            stages[name] = {
+                "count": hist.count,
+                "mean_ms": hist.sum / hist.count * 1e3 if hist.count else None,
+                "p50_ms": p[50] * 1e3 if p[50] is not None else None,
+                "p95_ms": p[95] * 1e3 if p[95] is not None else None,
+                "p99_ms": p[99] * 1e3 if p[99] is not None else None,
+            }
+        uptime = time.time() - self.started
+        counters = self._counters()
+        return {
+            "timestamp": time.time(),
+            "uptime_s": uptime,
+            "beans_per_min": counters.get("beans_total", 0) / uptime * 60 if uptime else 0.0,
+            "counters": counters,
+            "latency": stages,
+            "gauges": self._gauges(),
+        }
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        p = self.prefix
+        lines = []
+        for name, value in sorted(self._counters().items()):
+            metric = f"{p}_{name}" if name.endswith("_total") else f"{p}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, hist in sorted(self.histograms.items()):
+            metric = f"{p}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.bucket_counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {hist.count}')
+            lines.append(f"{metric}_sum {hist.sum}")
+            lines.append(f"{metric}_count {hist.count}")
+            for q, value in hist.percentiles().items():
+                if value is not None:
+                    lines.append(f'{p}_{name}_recent_seconds{{quantile="{q / 100}"}} {value}')
+        for name, value in sorted(self._gauges().items()):
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port=9108, host="127.0.0.1"):
+        """Serves /metrics (Prometheus text) and /stats (JSON) on a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    body, content_type = registry.render_prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path.startswith("/stats"):
+                    body, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # keep scrapes out of the log
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f"Metrics served on http://{host}:{port}/metrics")
+        return self._server
+
+    def start_stats_file(self, path, interval=5.0):
+        """Rewrites path with snapshot() every interval seconds (atomically, via a temporary file)."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    tmp = path + ".tmp"
+                    with open(tmp, "w") as f:
+                        json.dump(self.snapshot(), f, indent=1)
+                    os.replace(tmp, path)
+                except Exception as e:
+                    logging.error(f"Could not write stats file {path}: {e}")
+
+        self._stats_thread = threading.Thread(target=loop, name="metrics-file", daemon=True)
+        self._stats_thread.start()
+        return self._stats_thread
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+class _Timer:
+    __slots__ = ("hist", "start", "elapsed")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.hist.observe(self.elapsed)
+        return False
+
+
+# Process-wide registry
+registry = MetricsRegistry()
+timed = registry.timed
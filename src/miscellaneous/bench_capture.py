@@ -0,0 +1,74 @@
+"""
+Compares the capture backends (camera.py) on the same frames.
+
+Starts miscellaneous/fake_ipcam.py in-process (or uses --url for a real phone), then times
+read() on the stream backend and on the snapshot backend at each decode scale. The ROI is the
+one final.py uses. For the reduced decodes, the mean absolute pixel difference of the ROI against
+a full decode of the same JPEG shows how much detail is lost.
+
+Run from the src folder:
+    python -m miscellaneous.bench_capture
+    python -m miscellaneous.bench_capture --url http://192.168.1.11:8080 --reads 50
+"""
+import argparse
+import time
+import urllib.request
+import numpy as np
+from camera import SnapshotCamera, create_camera
+from miscellaneous import fake_ipcam
+
+CROP_BOX = fake_ipcam.CROP_BOX
+
+
+def bench(camera, reads):
+    latencies = []
+    for _ in range(reads):
+        start = time.perf_counter()
+        ret, _ = camera.read(newer_than=time.time())
+        if ret:
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare camera capture backends")
+    parser.add_argument("--url", help="camera base URL (default: a local fake_ipcam)")
+    parser.add_argument("--port", type=int, default=8090, help="port for the local fake_ipcam")
+    parser.add_argument("--reads", type=int, default=30)
+    args = parser.parse_args()
+
+    base = args.url
+    if base is None:
+        fake_ipcam.start(port=args.port)
+        base = f"http://127.0.0.1:{args.port}"
+
+    cases = [("stream", f"{base}/video", {})] + \
+            [("snapshot", f"{base}/shot.jpg", {"decode_scale": s}) for s in (1, 2, 4)]
+    print(f"{'backend':>12} {'reads':>5} {'read p50 ms':>11} {'read p95 ms':>11} {'decode ms':>9}")
+    for backend, url, options in cases:
+        camera = create_camera(backend, url, roi=CROP_BOX, **options)
+        try:
+            camera.read(timeout=5.0)  # connect / first frame
+            latencies = bench(camera, args.reads)
+            stats = camera.stats()
+        finally:
+            camera.stop()
+        name = backend + (f"/{options['decode_scale']}" if options else "")
+        if not latencies:
+            print(f"{name:>12} no frames")
+            continue
+        ms = np.asarray(latencies) * 1e3
+        print(f"{name:>12} {len(latencies):>5} {np.percentile(ms, 50):>11.2f} {np.percentile(ms, 95):>11.2f} "
+              f"{stats['avg_decode_time'] * 1e3:>9.2f}")
+
+    with urllib.request.urlopen(f"{base}/shot.jpg", timeout=5) as response:
+        data = response.read()
+    full = SnapshotCamera("", roi=CROP_BOX).decode(data).astype(np.int16)
+    for scale in (2, 4):
+        reduced = SnapshotCamera("", roi=CROP_BOX, decode_scale=scale).decode(data).astype(np.int16)
+        print(f"decode_scale {scale}: ROI {reduced.shape[1]}x{reduced.shape[0]}, "
+              f"mean abs difference to full decode {np.abs(reduced - full).mean():.2f}")
+
+
+if __name__ == "__main__":
+    main()
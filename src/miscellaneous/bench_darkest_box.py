@@ -0,0 +1,49 @@
+"""
+Microbenchmark: integral-image darkest-box search vs. the original nested-loop search.
+
+Run from the src folder:
+    python -m miscellaneous.bench_darkest_box
+"""
+import time
+import numpy as np
+from preprocess import find_darkest_box
+
+ROI_SIZES = [(310, 472), (620, 944), (1080, 1920)]  # (height, width); the first is the live crop
+REPEATS = 20
+
+def darkest_box_loop(gray, box_size=(30, 30)):
+    """The original sliding-window search, kept as the reference implementation."""
+    h, w = gray.shape
+    box_h, box_w = box_size
+    min_avg_intensity = float('inf')
+    darkest_top_left = (0, 0)
+    for y in range(0, h - box_h + 1, box_h // 2):
+        for x in range(0, w - box_w + 1, box_w // 2):
+            avg_intensity = np.mean(gray[y:y+box_h, x:x+box_w])
+            if avg_intensity < min_avg_intensity:
+                min_avg_intensity = avg_intensity
+                darkest_top_left = (x, y)
+    return min_avg_intensity, darkest_top_left
+
+def time_it(fn, *args, repeats=REPEATS):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'ROI (h x w)':>14} {'loop (ms)':>10} {'integral (ms)':>14} {'speed-up':>9}  match")
+    for h, w in ROI_SIZES:
+        gray = rng.integers(0, 256, size=(h, w), dtype=np.uint8)
+        expected = darkest_box_loop(gray)
+        got = find_darkest_box(gray)
+        match = expected[1] == got[1] and abs(expected[0] - got[0]) < 1e-9
+        loop_t = time_it(darkest_box_loop, gray, repeats=max(1, REPEATS // 4))
+        fast_t = time_it(find_darkest_box, gray)
+        print(f"{h:>6} x {w:<6} {loop_t * 1e3:>10.2f} {fast_t * 1e3:>14.3f} {loop_t / fast_t:>8.1f}x  {match}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Actuation cycle-time benchmark against the Arduino emulator (no hardware needed).
+
+Runs the per-bean command sequence of the sort loop (servo class, an occasional angle correction,
+STEP) with the old fixed sleeps and with acknowledgement-driven waits, and reports the cycle time.
+
+Run from the src folder:
+    python -m miscellaneous.bench_serial_cycle --beans 20
+"""
+import argparse
+import time
+from arduino_emulator import ArduinoEmulator
+from serial_client import ArduinoClient
+
+ANGLE_SETTLE_TIME = 1.0
+STEP_SETTLE_TIME = 0.9
+
+def bean_commands(i):
+    """Servo class, then an angle correction for every third bean, then STEP."""
+    commands = [(str(i % 3), 0)]
+    if i % 3 == 0:
+        commands.append(("-12", ANGLE_SETTLE_TIME))
+    commands.append(("STEP", STEP_SETTLE_TIME))
+    return commands
+
+def run(client, beans, use_acks):
+    cycle_times = []
+    for i in range(beans):
+        start = time.perf_counter()
+        for command, settle_time in bean_commands(i):
+            if use_acks:
+                client.command(command)
+            else:
+                client.send(command)
+                time.sleep(settle_time)
+        cycle_times.append(time.perf_counter() - start)
+    return cycle_times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--beans", type=int, default=20)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    emulator = ArduinoEmulator(time_scale=args.time_scale)
+    port = emulator.start()
+    client = ArduinoClient(port, ack_timeout=10).open()
+    try:
+        client.handshake()
+        for label, use_acks in (("fixed sleeps", False), ("acknowledged", True)):
+            times = run(client, args.beans, use_acks)
+            if not use_acks:
+                time.sleep(1.0)  # let the emulator work off queued commands before the next run
+            mean = sum(times) / len(times)
+            print(f"{label:>13}: mean cycle {mean * 1e3:7.1f} ms, max {max(times) * 1e3:7.1f} ms, "
+                  f"{60 / mean:6.1f} beans/min (actuation only)")
+        print(f"serial: {client.stats()}")
+        print(f"emulator: {emulator.stats()}")
+    finally:
+        client.close()
+        emulator.stop()
+
+if __name__ == "__main__":
+    main()
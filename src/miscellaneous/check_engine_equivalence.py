@@ -0,0 +1,93 @@
+"""
+Checks that an export-based inference engine gives the same answers as the PyTorch model.
+
+For every image the detections of both engines are matched by IoU; the check fails if the number of
+beans, a class, or a box (IoU below --min-iou) differs.
+
+Run from the src folder:
+    python -m miscellaneous.check_engine_equivalence --engine onnx processed_images/boxes bean_image.jpg
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from inference import create_engine
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def compare(reference, candidate, min_iou):
+    """Returns a list of mismatch descriptions (empty if the detections agree)."""
+    if len(reference) != len(candidate):
+        return [f"{len(reference)} vs {len(candidate)} detections"]
+    problems = []
+    unmatched = list(range(len(candidate)))
+    for cls, box in zip(reference.classes, reference.boxes):
+        if not unmatched:
+            break
+        best = max(unmatched, key=lambda j: iou(box, candidate.boxes[j]))
+        overlap = iou(box, candidate.boxes[best])
+        unmatched.remove(best)
+        if candidate.classes[best] != cls:
+            problems.append(f"class {cls} vs {candidate.classes[best]}")
+        if overlap < min_iou:
+            problems.append(f"box IoU {overlap:.2f}")
+    return problems
+
+def list_images(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(glob.glob(os.path.join(path, "**", "*"), recursive=True)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield name
+        else:
+            yield path
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an inference engine against the PyTorch reference")
+    parser.add_argument("images", nargs="+", help="image files or folders")
+    parser.add_argument("--engine", default="onnx")
+    parser.add_argument("--weights", default="../models/sahad_best.pt")
+    parser.add_argument("--conf", type=float, default=0.6)
+    parser.add_argument("--min-iou", type=float, default=0.9)
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+
+    reference = create_engine("torch", args.weights, conf=args.conf)
+    candidate = create_engine(args.engine, args.weights, conf=args.conf)
+
+    checked, failures = 0, 0
+    timings = {"torch": [], args.engine: []}
+    for path in list(list_images(args.images))[:args.limit]:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        start = time.perf_counter()
+        expected = reference.predict(image)
+        timings["torch"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        got = candidate.predict(image)
+        timings[args.engine].append(time.perf_counter() - start)
+        checked += 1
+        problems = compare(expected, got, args.min_iou)
+        if problems:
+            failures += 1
+            print(f"MISMATCH {path}: {'; '.join(problems)}")
+
+    for name, values in timings.items():
+        if values:
+            print(f"{name:>9}: median {np.median(values) * 1e3:.1f} ms over {len(values)} image(s)")
+    print(f"{checked - failures}/{checked} images match")
+    sys.exit(1 if failures or not checked else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Local stand-in for the IP Webcam phone app.
+
+Serves the two endpoints the capture backends use:
+    /video     MJPEG stream (multipart/x-mixed-replace), like the app's video endpoint
+    /shot.jpg  a single JPEG of the current frame, like the app's still endpoint
+
+Frames come from a folder of full camera frames, a video file, or (by default) synthetic frames
+with a dark bean drawn inside CROP_BOX. All frames are JPEG-encoded once at startup, so the server
+itself costs next to nothing while a backend is being measured.
+
+Run from the src folder:
+    python -m miscellaneous.fake_ipcam                       # synthetic 1920x1440 frames on :8080
+    python -m miscellaneous.fake_ipcam recordings/ --port 8081 --fps 30
+"""
+import argparse
+import glob
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+
+# Same region final.py cuts out: (y1, y2, x1, x2)
+CROP_BOX = (918, 1228, 1220, 1692)
+BOUNDARY = "frameboundary"
+
+
+def synthetic_frames(count=30, size=(1920, 1440), roi=CROP_BOX, seed=0):
+    """Light background with one dark, bean-sized ellipse at a random spot inside the ROI per frame."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    y1, y2, x1, x2 = roi
+    frames = []
+    for _ in range(count):
+        frame = np.full((height, width, 3), 200, dtype=np.uint8)
+        frame += rng.integers(0, 20, size=frame.shape, dtype=np.uint8)  # sensor noise keeps the JPEG realistic
+        cx, cy = int(rng.integers(x1 + 60, x2 - 60)), int(rng.integers(y1 + 50, y2 - 50))
+        cv2.ellipse(frame, (cx, cy), (45, 30), float(rng.integers(0, 180)), 0, 360, (40, 60, 80), -1)
+        frames.append(frame)
+    return frames
+
+
+def load_frames(source, limit=200):
+    if os.path.isdir(source):
+        paths = sorted(p for p in glob.glob(os.path.join(source, "**", "*"), recursive=True)
+                       if p.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))[:limit]
+        frames = [cv2.imread(p) for p in paths]
+        return [f for f in frames if f is not None]
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+class FakeIpCam:
+    """
+    Parameters:
+        jpegs (list[bytes]): Encoded frames, played in a loop.
+        fps (float): Frame rate of the timeline shared by /video and /shot.jpg.
+    """
+
+    def __init__(self, jpegs, fps=30.0):
+        self.jpegs = jpegs
+        self.fps = fps
+        self.started = time.time()
+        self.snapshots_served = 0
+        self.stream_frames_served = 0
+
+    def current(self):
+        """The JPEG "on screen" right now."""
+        return self.jpegs[int((time.time() - self.started) * self.fps) % len(self.jpegs)]
+
+    def serve(self, port=8080, host="127.0.0.1"):
+        cam = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the app
+
+            def do_GET(self):
+                if self.path.startswith("/shot.jpg"):
+                    body = cam.current()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/jpeg")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    cam.snapshots_served += 1
+                elif self.path.startswith("/video"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    try:
+                        while True:
+                            body = cam.current()
+                            self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                             f"Content-Length: {len(body)}\r\n\r\n".encode() + body + b"\r\n")
+                            cam.stream_frames_served += 1
+                            time.sleep(1.0 / cam.fps)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    self.close_connection = True
+                else:
+                    self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="fake-ipcam", daemon=True).start()
+        return server
+
+
+def start(source=None, port=8080, fps=30.0, quality=90, size=(1920, 1440)):
+    """Encodes the frames and starts serving them; returns (FakeIpCam, server)."""
+    frames = load_frames(source) if source else synthetic_frames(size=size)
+    if not frames:
+        raise FileNotFoundError(f"No frames in {source}")
+    jpegs = [cv2.imencode(".jpg", f, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes() for f in frames]
+    cam = FakeIpCam(jpegs, fps)
+    return cam, cam.serve(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded or synthetic frames like the IP Webcam app")
+    parser.add_argument("source", nargs="?", help="folder of full camera frames or a video (default: synthetic)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality")
+    args = parser.parse_args()
+    cam, server = start(args.source, args.port, args.fps, args.quality)
+    frame_bytes = sum(len(j) for j in cam.jpegs) / len(cam.jpegs)
+    print(f"Serving {len(cam.jpegs)} frames ({frame_bytes / 1024:.0f} KiB each) at {args.fps:g} fps:")
+    print(f"  stream:   http://127.0.0.1:{args.port}/video")
+    print(f"  snapshot: http://127.0.0.1:{args.port}/shot.jpg")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
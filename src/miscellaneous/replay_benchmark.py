@@ -0,0 +1,177 @@
+"""
+Replay benchmark for the capture -> gate -> detect -> angle pipeline.
+
+Recorded ROI frames (a folder of images or a video) are pushed through the functions the live loop
+uses: detect_and_annotate_darkest_box (gate), the inference engine (detect) and get_adjusted_angle
+(angle). Per-stage latency percentiles, beans/s and the decision distribution are printed and saved
+as JSON; --compare shows the difference to an earlier run. Needs no camera and no Arduino.
+
+Run from the src folder:
+    python -m miscellaneous.replay_benchmark recordings/ -o bench.json
+    python -m miscellaneous.replay_benchmark recordings/run.mp4 --crop -o new.json --compare bench.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import time
+from collections import Counter
+import cv2
+import numpy as np
+import final
+from preprocess import detect_and_annotate_darkest_box
+from inference import weights_hash
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+STAGES = ["capture", "gate", "detect", "angle", "total"]
+
+def replay_frames(source, crop=False, loop=1):
+    """Yields (decode seconds, frame) from a folder of images or a video file."""
+    y1, y2, x1, x2 = final.CROP_BOX
+    for _ in range(loop):
+        if os.path.isdir(source):
+            paths = sorted(p for p in glob.glob(os.path.join(source, "**", "*"), recursive=True)
+                           if p.lower().endswith(IMAGE_EXTENSIONS))
+            for path in paths:
+                start = time.perf_counter()
+                frame = cv2.imread(path)
+                elapsed = time.perf_counter() - start
+                if frame is not None:
+                    yield elapsed, frame[y1:y2, x1:x2] if crop else frame
+        else:
+            cap = cv2.VideoCapture(source)
+            while True:
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                elapsed = time.perf_counter() - start
+                if not ret:
+                    break
+                yield elapsed, frame[y1:y2, x1:x2] if crop else frame
+            cap.release()
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values) * 1e3
+    return {
+        "count": len(values),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+def run(source, crop=False, loop=1, limit=None):
+    engine = final.get_model()
+    timings = {stage: [] for stage in STAGES}
+    decisions = Counter()
+    frames = beans = multi_bean_frames = 0
+    wall_start = time.perf_counter()
+    for decode_time, frame in replay_frames(source, crop, loop):
+        if limit and frames >= limit:
+            break
+        frames += 1
+        timings["capture"].append(decode_time)
+
+        start = time.perf_counter()
+        darkest, _, _ = detect_and_annotate_darkest_box(frame, annotate=False, save=False)
+        gate_time = time.perf_counter() - start
+        timings["gate"].append(gate_time)
+        if darkest > final.DARKNESS_THRESHOLD:
+            decisions["skipped (gate)"] += 1
+            timings["total"].append(decode_time + gate_time)
+            continue
+
+        start = time.perf_counter()
+        detections = engine.predict(frame, conf=final.CONFIDENCE_THRESHOLD)
+        detect_time = time.perf_counter() - start
+        timings["detect"].append(detect_time)
+
+        start = time.perf_counter()
+        for (x1, y1, x2, y2) in detections.boxes:
+            final.get_adjusted_angle((x1 + x2) // 2, (y1 + y2) // 2)
+        angle_time = time.perf_counter() - start
+        timings["angle"].append(angle_time)
+        timings["total"].append(decode_time + gate_time + detect_time + angle_time)
+
+        if len(detections) == 0:
+            decisions["no detection"] += 1
+        for cls in detections.classes:
+            decisions[final.coffee_beans_class.get(cls, str(cls))] += 1
+            beans += 1
+        if len(detections) > 1:
+            multi_bean_frames += 1
+    wall = time.perf_counter() - wall_start
+
+    return {
+        "source": source,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "host": platform.node(),
+        "engine": engine.name,
+        "model": os.path.basename(final.MODEL_PATH),
+        "model_hash": weights_hash(final.MODEL_PATH),
+        "darkness_threshold": final.DARKNESS_THRESHOLD,
+        "confidence_threshold": final.CONFIDENCE_THRESHOLD,
+        "frames": frames,
+        "beans": beans,
+        "multi_bean_frames": multi_bean_frames,
+        "wall_s": wall,
+        "frames_per_s": frames / wall if wall else 0.0,
+        "beans_per_s": beans / wall if wall else 0.0,
+        "stages": {stage: percentiles(values) for stage, values in timings.items()},
+        "decisions": dict(decisions),
+    }
+
+def print_report(report):
+    print(f"{report['frames']} frames, {report['beans']} beans in {report['wall_s']:.1f}s "
+          f"({report['frames_per_s']:.1f} frames/s, {report['beans_per_s']:.1f} beans/s) "
+          f"[{report['engine']} / {report['model']}]")
+    print(f"{'stage':>8} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for stage in STAGES:
+        s = report["stages"][stage]
+        if s["count"]:
+            print(f"{stage:>8} {s['count']:>6} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['max_ms']:>8.2f}")
+    total = sum(report["decisions"].values()) or 1
+    for decision, count in sorted(report["decisions"].items()):
+        print(f"{decision:>20}: {count} ({100 * count / total:.1f}%)")
+
+def print_comparison(old, new):
+    print(f"\nChange vs {old.get('created')} ({old.get('engine')} / {old.get('model')}):")
+    for stage in STAGES:
+        a, b = old["stages"].get(stage, {}), new["stages"].get(stage, {})
+        if a.get("count") and b.get("count"):
+            deltas = "  ".join(f"{k[:-3]} {b[k] - a[k]:+.2f} ms ({100 * (b[k] - a[k]) / a[k]:+.0f}%)"
+                               for k in ("p50_ms", "p95_ms", "p99_ms") if a[k])
+            print(f"{stage:>8}: {deltas}")
+    print(f"beans/s: {old['beans_per_s']:.2f} -> {new['beans_per_s']:.2f}")
+    for decision in sorted(set(old["decisions"]) | set(new["decisions"])):
+        a, b = old["decisions"].get(decision, 0), new["decisions"].get(decision, 0)
+        if a != b:
+            print(f"{decision:>20}: {a} -> {b}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded frames through the sorting pipeline")
+    parser.add_argument("source", help="folder of ROI images or a video file")
+    parser.add_argument("--crop", action="store_true", help="frames are full camera frames, apply CROP_BOX")
+    parser.add_argument("--loop", type=int, default=1, help="replay the source this many times")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many frames")
+    parser.add_argument("--engine", default=final.INFERENCE_ENGINE, choices=["torch", "onnx", "openvino"])
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    final.INFERENCE_ENGINE = args.engine
+    report = run(args.source, crop=args.crop, loop=args.loop, limit=args.limit)
+    report["startup"] = final.startup_report()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
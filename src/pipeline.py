@@ -0,0 +1,267 @@
+import contextlib
+import queue
+import threading
+import time
+from enum import Enum
+from utils.logger import logging
+from serial_client import sendable_angle
+from sort_queue import SortQueue
+
+
+class BeanState(Enum):
+    WAITING = "waiting"          # slot is under the camera, waiting for the carousel to settle
+    CAPTURED = "captured"        # frame taken
+    CLASSIFIED = "classified"    # class and angle known
+    FAILED = "failed"            # no frame / no detection after all attempts
+    EMPTY = "empty"              # presence check found no bean, stepped past without inference
+    ALIGNED = "aligned"          # angle correction sent to the stepper
+    STEPPED = "stepped"          # carousel moved the bean towards the servo
+    SORTED = "sorted"            # servo was set for the bean and the next step dropped it
+
+
+# Allowed state transitions for a bean record
+TRANSITIONS = {
+    BeanState.WAITING: {BeanState.CAPTURED, BeanState.CLASSIFIED, BeanState.FAILED},  # CLASSIFIED: queued bean
+    BeanState.CAPTURED: {BeanState.CAPTURED, BeanState.CLASSIFIED, BeanState.FAILED, BeanState.EMPTY},
+    BeanState.CLASSIFIED: {BeanState.ALIGNED, BeanState.STEPPED},
+    BeanState.FAILED: {BeanState.STEPPED},
+    BeanState.EMPTY: {BeanState.STEPPED},
+    BeanState.ALIGNED: {BeanState.STEPPED},
+    BeanState.STEPPED: {BeanState.SORTED},
+    BeanState.SORTED: set(),
+}
+
+
+class BeanRecord:
+    """State of one carousel slot as it moves from the camera to the servo."""
+
+    def __init__(self, bean_id):
+        self.bean_id = bean_id
+        self.state = BeanState.WAITING
+        self.bean_class = None
+        self.confidence = None
+        self.box = None
+        self.angle = 0
+        self.from_queue = False
+        self.empty = False
+        self.presence = {}  # score and threshold of the presence check, if one ran
+        self.attempts = 0
+        self.start_time = time.time()
+        self.timestamps = {BeanState.WAITING: self.start_time}
+        self.timings = {}
+
+    def advance(self, state):
+        """Moves the record to a new state, rejecting transitions the state machine does not allow."""
+        if state not in TRANSITIONS[self.state]:
+            raise ValueError(f"Bean {self.bean_id}: invalid transition {self.state.value} -> {state.value}")
+        self.state = state
+        self.timestamps[state] = time.time()
+
+    def stage_times(self):
+        """Seconds spent reaching each state from the previous one, plus the detector's own timings."""
+        times = dict(self.timings)
+        previous = self.start_time
+        for state in BeanState:
+            if state is not BeanState.WAITING and state in self.timestamps:
+                times[state.value] = self.timestamps[state] - previous
+                previous = self.timestamps[state]
+        return times
+
+    @property
+    def time_taken(self):
+        """Seconds from the slot arriving under the camera to the carousel moving on."""
+        return self.timestamps.get(BeanState.STEPPED, time.time()) - self.start_time
+
+
+class SortPipeline:
+    """
+    Runs imaging and actuation as two workers joined by a queue.
+
+    The vision worker captures and classifies the bean under the camera as soon as the carousel
+    has settled (or takes the next bean queued from an earlier multi-bean frame). Meanwhile the actuation worker positions the servo for the previous bean, then
+    takes the new decision from the queue, sends the angle correction and STEP, and signals the
+    vision worker once the carousel has settled again.
+
+    Parameters:
+        capture (callable): capture(newer_than) -> frame or None.
+        classify (callable): classify(frame) -> list of BeanDetection.
+        actuate (callable): actuate(command, settle_time) sends one command and returns once it has been carried out.
+        on_bean_done (callable): Called with each BeanRecord once it is SORTED (empty slots included, see record.empty).
+        step_time (float): Fallback settle time for a carousel step (seconds).
+        angle_time (float): Fallback settle time for an angle correction (seconds).
+        max_attempts (int): Capture/classify attempts per slot before it is stepped past.
+        default_class (int): Servo class used for beans that could not be classified.
+        sort_queue (SortQueue): Holds the extra beans of multi-bean frames.
+        is_present (callable): Optional is_present(frame, details) -> False for an empty slot, which is then
+                               stepped past without classification or retries. details is the record's
+                               presence dict, for the check's score and threshold.
+        verify_queued (callable): Optional verify_queued(frame, detection, details) -> False if the slot of a
+                                  bean from the sort queue is empty; it may also set the detection's angle.
+                                  Without it queued beans are sorted without a capture.
+        between_beans (callable): Called by the vision worker before it starts on the next bean (config reloads).
+        reload_gate (ReloadGate): Held by the vision worker for every bean, so a reload from another
+                                  thread waits for the bean boundary.
+    """
+
+    def __init__(self, capture, classify, actuate, on_bean_done=None, step_time=0.9, angle_time=1.0,
+                 max_attempts=2, default_class=1, sort_queue=None, is_present=None, verify_queued=None,
+                 between_beans=None, reload_gate=None):
+        self.capture = capture
+        self.classify = classify
+        self.actuate = actuate
+        self.on_bean_done = on_bean_done
+        self.step_time = step_time
+        self.angle_time = angle_time
+        self.max_attempts = max_attempts
+        self.default_class = default_class
+        self.sort_queue = sort_queue if sort_queue is not None else SortQueue()
+        self.is_present = is_present
+        self.verify_queued = verify_queued
+        self.between_beans = between_beans
+        self.reload_gate = reload_gate
+
+        self._decisions = queue.Queue(maxsize=1)
+        self._settled = threading.Event()
+        self._settled_at = 0.0
+        self._running = False
+        self._threads = []
+        self._error = None
+        self._next_id = 1
+
+    def start(self):
+        self._running = True
+        self._settled_at = time.time()
+        self._settled.set()  # the carousel is at rest when the run starts
+        self._threads = [
+            threading.Thread(target=self._guard, args=(self._vision_worker,), name="vision", daemon=True),
+            threading.Thread(target=self._guard, args=(self._actuation_worker,), name="actuation", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._settled.set()
+        for t in self._threads:
+            t.join(timeout=5)
+
+    def run(self):
+        """Starts the workers and blocks until one fails or the run is interrupted."""
+        self.start()
+        try:
+            while self._running:
+                time.sleep(0.2)
+        finally:
+            self.stop()
+        if self._error is not None:
+            raise self._error
+
+    def _guard(self, worker):
+        try:
+            worker()
+        except Exception as e:
+            logging.error(f"Pipeline worker {threading.current_thread().name} failed: {e}")
+            self._error = e
+            self._running = False
+
+    def _vision_worker(self):
+        while self._running:
+            self._settled.wait()
+            if not self._running:
+                break
+            self._settled.clear()
+            if self.between_beans is not None:
+                self.between_beans()
+            with self.reload_gate.bean() if self.reload_gate is not None else contextlib.nullcontext():
+                record = self._next_record()
+            while self._running:
+                try:
+                    self._decisions.put(record, timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+
+    def _next_record(self):
+        """Captures and classifies the slot under the camera (or takes a queued bean) and returns its record."""
+        record = BeanRecord(self._next_id)
+        self._next_id += 1
+        queued = self.sort_queue.next()
+        if queued is not None and self.verify_queued is not None:
+            frame = self.capture(self._settled_at)
+            if frame is not None and not self.verify_queued(frame, queued, record.presence):
+                logging.info(f"Bean {record.bean_id}: slot of a queued bean is empty, "
+                             f"dropping {len(self.sort_queue) + 1} queued bean(s)")
+                self.sort_queue.reject()
+                queued = None
+                record.attempts = 1
+                record.empty = True
+                record.advance(BeanState.CAPTURED)
+                record.advance(BeanState.EMPTY)
+        if queued is not None:
+            record.bean_class, record.confidence, record.angle = queued.bean_class, queued.confidence, queued.angle
+            record.box = queued.box
+            record.from_queue = True
+            record.advance(BeanState.CLASSIFIED)
+
+        while record.state not in (BeanState.CLASSIFIED, BeanState.EMPTY) and record.attempts < self.max_attempts and self._running:
+            record.attempts += 1
+            frame = self.capture(self._settled_at)
+            if frame is None:
+                continue
+            record.advance(BeanState.CAPTURED)
+            if self.is_present is not None and self.is_present(frame, record.presence) is False:
+                record.empty = True
+                record.advance(BeanState.EMPTY)
+                break
+            try:
+                detection = self.sort_queue.add_frame(self.classify(frame))
+            except Exception as e:
+                logging.error(f"Error during classification: {e}")
+                detection = None
+            if detection is not None:
+                record.bean_class, record.confidence = detection.bean_class, detection.confidence
+                record.box, record.angle = detection.box, detection.angle
+                record.timings.update(detection.timings)
+                record.advance(BeanState.CLASSIFIED)
+                break
+            logging.debug(f"Bean {record.bean_id}: attempt {record.attempts} failed")
+
+        if record.state not in (BeanState.CLASSIFIED, BeanState.EMPTY):
+            record.advance(BeanState.FAILED)
+        return record
+
+    def _actuation_worker(self):
+        previous = None
+        servo_set = False
+        while self._running:
+            if not servo_set:
+                # Position the servo for the bean that drops on the next step while the camera works
+                servo_class = previous.bean_class if previous is not None and previous.bean_class is not None \
+                    else self.default_class
+                self.actuate(str(servo_class), 0)
+                servo_set = True
+
+            try:
+                record = self._decisions.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            record.angle = sendable_angle(record.angle)  # whole degrees, never 0/1/2/-1 (servo commands, parse error)
+            if record.angle != 0:
+                angle = record.angle
+                self.actuate(str(angle), self.angle_time)
+                logging.debug(f"Angle sent to Arduino: {angle}")
+                record.advance(BeanState.ALIGNED)
+
+            self.actuate("STEP", self.step_time)
+            servo_set = False
+            self._settled_at = time.time()
+            record.advance(BeanState.STEPPED)
+            self._settled.set()
+
+            if previous is not None:
+                previous.advance(BeanState.SORTED)
+                if self.on_bean_done is not None:
+                    self.on_bean_done(previous)
+            previous = record
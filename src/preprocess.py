@@ -3,52 +3,82 @@ import numpy as np
 import os
 import datetime
 
-def detect_and_annotate_darkest_box(frame, save_folder="processed_images/darkest_point", box_size=(30, 30)):
+def find_darkest_box(gray, box_size=(30, 30)):
+    """
+    Finds the darkest window of a grayscale image.
+
+    Every window mean is computed at once from the integral image. The windows are the same as
+    the original sliding-window search: they step by half a box in each direction, and ties are
+    resolved in row-major order, so the result matches the loop exactly.
+
+    Parameters:
+        gray (numpy.ndarray): Single-channel image.
+        box_size (tuple): The dimensions (width, height) of the window.
+
+    Returns:
+        min_avg_intensity (float): Mean intensity of the darkest window (inf if the image is smaller than the window).
+        darkest_top_left (tuple): (x, y) of the darkest window.
+    """
+    h, w = gray.shape[:2]
+    box_h, box_w = box_size
+    ys = np.arange(0, h - box_h + 1, max(1, box_h // 2))
+    xs = np.arange(0, w - box_w + 1, max(1, box_w // 2))
+    if len(ys) == 0 or len(xs) == 0:
+        return float('inf'), (0, 0)
+
+    integral = cv2.integral(gray, sdepth=cv2.CV_64F)
+    sums = (integral[np.ix_(ys + box_h, xs + box_w)]
+            - integral[np.ix_(ys, xs + box_w)]
+            - integral[np.ix_(ys + box_h, xs)]
+            + integral[np.ix_(ys, xs)])
+    idx = int(np.argmin(sums))
+    row, col = divmod(idx, len(xs))
+    min_avg_intensity = float(sums[row, col]) / (box_h * box_w)
+    return min_avg_intensity, (int(xs[col]), int(ys[row]))
+
+def detect_and_annotate_darkest_box(frame, save_folder="processed_images/darkest_point", box_size=(30, 30),
+                                    annotate=True, save=True):
     """
     Detects the darkest region in an image using a sliding window approach with a larger box size.
-    
+
     Parameters:
-        frame (numpy.ndarray): The input image in BGR format.
+        frame (numpy.ndarray): The input image in BGR format (or already grayscale).
         save_folder (str): The folder path to save the annotated image.
         box_size (tuple): The dimensions (width, height) of the window.
-    
+        annotate (bool): Draw the darkest region on a copy of the frame.
+        save (bool): Write the annotated image to save_folder (implies annotate).
+
     Returns:
-        annotated_frame (numpy.ndarray): The annotated image with the darkest region marked.
-        save_path (str): The path where the annotated image is saved.
+        min_avg_intensity (float): Mean intensity of the darkest region.
+        annotated_frame (numpy.ndarray): The annotated image with the darkest region marked (None if not annotated).
+        save_path (str): The path where the annotated image is saved (None if not saved).
     """
-    # Ensure the save folder exists
-    if not os.path.exists(save_folder):
-        os.makedirs(save_folder)
-    
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h, w = gray.shape
-    box_h, box_w = box_size
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    min_avg_intensity, darkest_top_left = find_darkest_box(gray, box_size)
+
+    if not (annotate or save):
+        return min_avg_intensity, None, None
 
-    min_avg_intensity = float('inf')
-    darkest_top_left = (0, 0)
-    
-    # Slide a window over the image to compute the average intensity for each patch
-    for y in range(0, h - box_h + 1, box_h // 2):  # Step half box size for better accuracy
-        for x in range(0, w - box_w + 1, box_w // 2):
-            patch = gray[y:y+box_h, x:x+box_w]
-            avg_intensity = np.mean(patch)
-            if avg_intensity < min_avg_intensity:
-                min_avg_intensity = avg_intensity
-                darkest_top_left = (x, y)
-    
     # Draw annotation
     annotated_frame = frame.copy()
-    cv2.rectangle(annotated_frame, 
-                  darkest_top_left, 
-                  (darkest_top_left[0] + box_size[0], darkest_top_left[1] + box_size[1]), 
+    cv2.rectangle(annotated_frame,
+                  darkest_top_left,
+                  (darkest_top_left[0] + box_size[0], darkest_top_left[1] + box_size[1]),
                   (0, 255, 0), 2)
-    cv2.putText(annotated_frame, f"{min_avg_intensity:.1f}", 
+    cv2.putText(annotated_frame, f"{min_avg_intensity:.1f}",
                 (darkest_top_left[0], darkest_top_left[1] - 5),
                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
-    
+
+    if not save:
+        return min_avg_intensity, annotated_frame, None
+
+    # Ensure the save folder exists
+    if not os.path.exists(save_folder):
+        os.makedirs(save_folder)
+
     # Generate a unique filename using the current timestamp
     filename = datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + ".jpg"
     save_path = os.path.join(save_folder, filename)
     cv2.imwrite(save_path, annotated_frame)
-    
+
     return min_avg_intensity, annotated_frame, save_path
@@ -0,0 +1,190 @@
+import time
+import cv2
+import numpy as np
+from utils.logger import logging
+
+
+class PresenceDetector:
+    """
+    Decides whether a carousel slot holds a bean by comparing the ROI with a learned image of the empty slot.
+
+    The ROI is downscaled and converted to grayscale (about 120x80 pixels for the default ROI), then
+    compared with a per-pixel running mean/variance of confirmed empty frames. Global brightness changes
+    are removed by subtracting the median difference, so slow lighting drift does not look like a bean.
+    The score is the fraction of foreground pixels; the slot is "present" when it exceeds a threshold
+    that adapts to the scores of recent empty frames. A check takes well under a millisecond.
+
+    The background is only learned from frames known to be empty: slots the detector skipped, and slots
+    where the detector model found nothing (reported through feedback()). Until warmup empty frames
+    have been seen, check() returns None and the caller falls back to the darkness gate.
+
+    Every audit_every-th skip is reported as present anyway, so the detector runs and false skips
+    are counted (false_skips) and logged. Skips are logged at INFO with their score and threshold,
+    at most once every log_interval seconds (with the number of skips since the last line).
+
+    Parameters:
+        scale (float): Downscale factor applied to the ROI.
+        warmup (int): Empty frames needed before the detector makes decisions.
+        learning_rate (float): Weight of a new empty frame in the background model.
+        pixel_sigma (float): A pixel is foreground when it differs by more than this many standard deviations...
+        min_pixel_diff (float): ...and by at least this many gray levels.
+        ratio_sigma (float): Threshold = mean + ratio_sigma * deviation of the empty-slot scores...
+        min_ratio (float): ...but never below this foreground fraction (a bean covers 1-4% of the ROI).
+        audit_every (int): Run the detector on every n-th skipped slot (0 disables audits).
+        log_interval (float): Minimum seconds between INFO lines about skipped slots.
+    """
+
+    def __init__(self, scale=0.25, warmup=10, learning_rate=0.05, pixel_sigma=4.0, min_pixel_diff=18.0,
+                 ratio_sigma=6.0, min_ratio=0.004, audit_every=20, log_interval=10.0):
+        self.scale = scale
+        self.warmup = warmup
+        self.learning_rate = learning_rate
+        self.pixel_sigma = pixel_sigma
+        self.min_pixel_diff = min_pixel_diff
+        self.ratio_sigma = ratio_sigma
+        self.min_ratio = min_ratio
+        self.audit_every = audit_every
+        self.log_interval = log_interval
+
+        self._mean = None     # background, float32
+        self._var = None      # per-pixel variance of the background
+        self._ratio_mean = 0.0
+        self._ratio_dev = 0.0
+        self._last = None     # (small gray frame, score, decision) of the last check()
+        self._last_skip_log = 0.0
+        self._skips_since_log = 0
+        self.last_score = None
+        self.last_threshold = None  # threshold the last check() compared its score with
+
+        # Counters
+        self.checks = 0
+        self.present = 0
+        self.skipped = 0
+        self.audits = 0
+        self.false_skips = 0      # audited skips where the detector model did find a bean
+        self.false_alarms = 0     # "present" slots where the detector model found nothing
+        self.learned = 0
+        self.last_check_time = 0.0
+        self.max_check_time = 0.0
+
+    @property
+    def ready(self):
+        return self.learned >= self.warmup
+
+    @property
+    def threshold(self):
+        return max(self.min_ratio, self._ratio_mean + self.ratio_sigma * self._ratio_dev)
+
+    def _prepare(self, image):
+        small = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (3, 3), 0).astype(np.float32)
+
+    def _score(self, small):
+        if self._mean is None or self._mean.shape != small.shape:
+            return None
+        diff = small - self._mean
+        diff -= np.median(diff)  # global lighting change
+        limit = np.maximum(self.pixel_sigma * np.sqrt(self._var), self.min_pixel_diff)
+        return float(np.count_nonzero(np.abs(diff) > limit)) / diff.size
+
+    def check(self, image):
+        """
+        Parameters:
+            image (numpy.ndarray): The BGR (or grayscale) bean ROI.
+
+        Returns:
+            (present, score): present is True, False (empty slot) or None (still learning the background).
+        """
+        start = time.perf_counter()
+        small = self._prepare(image)
+        score = self._score(small)
+        threshold = self.threshold
+        if score is None or not self.ready:
+            present = None
+        else:
+            present = score > threshold
+        audit = False
+        if present is False:
+            self.skipped += 1
+            if self.audit_every and self.skipped % self.audit_every == 0:
+                self.audits += 1
+                audit, present = True, True
+            else:
+                self._learn(small, score)
+        elif present:
+            self.present += 1
+        self._last = (small, score, present, audit)
+        self.last_score, self.last_threshold = score, threshold
+        self.checks += 1
+        self.last_check_time = time.perf_counter() - start
+        self.max_check_time = max(self.max_check_time, self.last_check_time)
+
+        if present is False:
+            self._log_skip(score, threshold)
+        elif score is not None:
+            decision = "learning" if present is None else "audit" if audit else "present"
+            logging.debug(f"Presence gate: {decision} (score {score:.4f}, threshold {threshold:.4f})")
+        return present, score
+
+    def _log_skip(self, score, threshold):
+        self._skips_since_log += 1
+        now = time.time()
+        if now - self._last_skip_log < self.log_interval:
+            logging.debug(f"Presence gate: empty (score {score:.4f}, threshold {threshold:.4f})")
+            return
+        logging.info(f"Presence gate: skipped an empty slot (score {score:.4f}, threshold {threshold:.4f}); "
+                     f"{self._skips_since_log} skip(s) since the last report")
+        self._last_skip_log = now
+        self._skips_since_log = 0
+
+    def feedback(self, found):
+        """
+        Reports whether the detector model found a bean in the frame of the last check().
+        Empty frames are added to the background model; audit misses are counted as false skips.
+        """
+        if self._last is None:
+            return
+        small, score, present, audit = self._last
+        self._last = None
+        if found:
+            if audit:
+                self.false_skips += 1
+                logging.warning(f"Presence gate: false skip caught by audit (score {score:.4f}, "
+                                f"threshold {self.threshold:.4f})")
+            return
+        if present and not audit:
+            self.false_alarms += 1
+        self._learn(small, score)
+
+    def _learn(self, small, score):
+        if self._mean is None or self._mean.shape != small.shape:
+            self._mean = small.copy()
+            self._var = np.full_like(small, 4.0)
+            self.learned = 1
+            return
+        a = self.learning_rate if self.ready else 1.0 / (self.learned + 1)
+        diff = small - self._mean
+        self._mean += a * diff
+        diff -= np.median(diff)  # lighting changes move the mean, not the noise estimate
+        self._var = (1 - a) * (self._var + a * diff * diff)
+        if score is not None:
+            self._ratio_mean += a * (score - self._ratio_mean)
+            self._ratio_dev += a * (abs(score - self._ratio_mean) - self._ratio_dev)
+        self.learned += 1
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "checks": self.checks,
+            "present": self.present,
+            "skipped": self.skipped,
+            "audits": self.audits,
+            "false_skips": self.false_skips,
+            "false_alarms": self.false_alarms,
+            "learned": self.learned,
+            "threshold": self.threshold,
+            "last_check_time": self.last_check_time,
+            "max_check_time": self.max_check_time,
+        }
@@ -0,0 +1,132 @@
+"""
+Headless batch re-grading of archived bean images.
+
+Image paths are streamed through a pool of decode processes (imread + darkest-region gate), the
+images that pass the gate are grouped into batches for the detector, and every image gets one row
+in a results table. No annotations are written and no stepper angles are computed.
+
+Run from the src folder:
+    python regrade.py processed_images/boxes processed_images/newly_annotated -o regrade.csv
+    python regrade.py processed_images/boxes --engine onnx --batch-size 16 --workers 4
+"""
+import argparse
+import csv
+import functools
+import glob
+import multiprocessing
+import os
+import time
+import cv2
+from preprocess import detect_and_annotate_darkest_box
+import final
+from inference import create_engine
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+COLUMNS = ["path", "darkest", "gated", "detections", "class", "class_name", "confidence", "x1", "y1", "x2", "y2"]
+
+def find_images(paths):
+    """Yields image files from the given files and folders (recursively)."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(glob.iglob(os.path.join(path, "**", "*"), recursive=True)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield name
+        else:
+            yield path
+
+def _init_worker():
+    # One OpenCV thread per process; the pool itself provides the parallelism
+    cv2.setNumThreads(1)
+
+def decode(path, box_size=None):
+    """Worker: reads one image and applies the darkest-region gate. Returns (path, image or None, darkest)."""
+    image = cv2.imread(path)
+    if image is None:
+        return path, None, None
+    darkest, _, _ = detect_and_annotate_darkest_box(image, box_size=box_size or final.DARKEST_BOX_SIZE,
+                                                    annotate=False, save=False)
+    return path, image, darkest
+
+def rows_for(path, darkest, detections):
+    """One row per detection (first = most confident), or a single row if there was none."""
+    if detections is None or len(detections) == 0:
+        return [[path, darkest, detections is None, 0, "", "", "", "", "", "", ""]]
+    rows = []
+    for cls, conf, (x1, y1, x2, y2) in zip(detections.classes, detections.confidences, detections.boxes):
+        rows.append([path, darkest, False, len(detections), cls, final.coffee_beans_class.get(cls, cls),
+                     f"{conf:.4f}", x1, y1, x2, y2])
+    return rows
+
+def regrade(paths, engine, writer, batch_size=8, workers=None, threshold=None, box_size=None, all_detections=False):
+    """
+    Runs the decode pool and batched inference; writes rows with writer.writerow. Returns counters.
+    threshold and box_size default to the darkness gate of final.py (after load_config()).
+    """
+    threshold = final.DARKNESS_THRESHOLD if threshold is None else threshold
+    box_size = tuple(box_size or final.DARKEST_BOX_SIZE)
+    counts = {"images": 0, "unreadable": 0, "gated": 0, "inferred": 0, "batches": 0}
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        results = engine.predict_batch([image for _, image, _ in batch])
+        counts["batches"] += 1
+        counts["inferred"] += len(batch)
+        for (path, _, darkest), detections in zip(batch, results):
+            rows = rows_for(path, darkest, detections)
+            for row in (rows if all_detections else rows[:1]):
+                writer.writerow(row)
+        batch.clear()
+
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        for path, image, darkest in pool.imap(functools.partial(decode, box_size=box_size), paths, chunksize=4):
+            counts["images"] += 1
+            if image is None:
+                counts["unreadable"] += 1
+                continue
+            if darkest > threshold:
+                counts["gated"] += 1
+                writer.writerow(rows_for(path, darkest, None)[0])
+                continue
+            batch.append((path, image, darkest))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    return counts
+
+def main():
+    # The sorter's settings, so the gate and the model match what runs on the machine
+    final.load_config(watch=False)
+    parser = argparse.ArgumentParser(description="Re-grade archived bean images with the current model")
+    parser.add_argument("paths", nargs="*", default=["processed_images/boxes", "processed_images/newly_annotated"],
+                        help="image files or folders (default: the processed_images archive)")
+    parser.add_argument("-o", "--output", default="regrade_results.csv")
+    parser.add_argument("--engine", default=final.INFERENCE_ENGINE, choices=["torch", "onnx", "openvino"])
+    parser.add_argument("--weights", default=final.MODEL_PATH)
+    parser.add_argument("--conf", type=float, default=final.CONFIDENCE_THRESHOLD)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None, help="decode processes (default: CPU count)")
+    parser.add_argument("--threshold", type=float, default=final.DARKNESS_THRESHOLD,
+                        help="darkest-region gate; images brighter than this are not classified")
+    parser.add_argument("--box-size", type=int, nargs=2, default=final.DARKEST_BOX_SIZE,
+                        help="size of the darkest-region window (default: DARKEST_BOX_SIZE)")
+    parser.add_argument("--all-detections", action="store_true", help="one row per detection instead of per image")
+    args = parser.parse_args()
+
+    engine = create_engine(args.engine, args.weights, conf=args.conf)
+    start = time.perf_counter()
+    with open(args.output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        counts = regrade(find_images(args.paths), engine, writer, batch_size=args.batch_size,
+                         workers=args.workers, threshold=args.threshold, box_size=args.box_size,
+                         all_detections=args.all_detections)
+    elapsed = time.perf_counter() - start
+    rate = counts["images"] / elapsed if elapsed > 0 else 0.0
+    print(f"{counts['images']} images in {elapsed:.1f}s ({rate:.1f} images/s): {counts['inferred']} classified "
+          f"in {counts['batches']} batches, {counts['gated']} skipped by the darkness gate, "
+          f"{counts['unreadable']} unreadable -> {args.output}")
+
+if __name__ == "__main__":
+    main()
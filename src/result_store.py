@@ -0,0 +1,194 @@
+"""
+Buffered store for per-bean results.
+
+Bean records are collected in memory and written to SQLite (WAL mode) in batches by a background
+thread, either when flush_size records are waiting or every flush_interval seconds. The control loop
+only appends to a list; a crash loses at most one flush window.
+
+Export to CSV from the src folder:
+    python result_store.py bean_log.db --csv bean_log.csv
+"""
+import argparse
+import csv
+import json
+import sqlite3
+import threading
+import time
+from utils.logger import logging
+
+COLUMNS = ["ts", "bean_id", "class", "class_name", "confidence", "x", "y", "x1", "y1", "x2", "y2",
+           "angle", "attempts", "from_queue", "time_taken", "timings", "lane", "config_version", "x_after"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS beans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    bean_id INTEGER,
+    class INTEGER,
+    class_name TEXT,
+    confidence REAL,
+    x INTEGER, y INTEGER,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    angle REAL,
+    attempts INTEGER,
+    from_queue INTEGER,
+    time_taken REAL,
+    timings TEXT,
+    lane TEXT,
+    config_version TEXT,
+    x_after INTEGER
+);
+CREATE INDEX IF NOT EXISTS beans_ts ON beans (ts);
+CREATE INDEX IF NOT EXISTS beans_class ON beans (class);
+"""
+
+# Columns added after the first release: databases created before them are migrated on open
+ADDED_COLUMNS = {"lane": "TEXT", "config_version": "TEXT", "x_after": "INTEGER"}
+
+
+class ResultStore:
+    """
+    Parameters:
+        path (str): SQLite database file.
+        flush_size (int): Flush as soon as this many records are buffered.
+        flush_interval (float): Flush at least this often (seconds); the crash-loss window.
+    """
+
+    def __init__(self, path="bean_log.db", flush_size=50, flush_interval=2.0):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+        # Counters
+        self.added = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_time = 0.0
+
+    def start(self):
+        # Create the schema up front so a bad path fails at startup, not on the first flush
+        conn = self._connect()
+        conn.close()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="result-store", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Writes everything still buffered and stops the flusher thread."""
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(beans)")}
+        for name, kind in ADDED_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE beans ADD COLUMN {name} {kind}")
+                logging.info(f"Added column '{name}' to {self.path}")
+        return conn
+
+    def add(self, bean_id, bean_class, class_name=None, confidence=None, box=None, angle=0, attempts=1,
+            from_queue=False, time_taken=None, timings=None, ts=None, lane=None, config_version=None,
+            x_after=None):
+        """Buffers one bean record. Cheap: no I/O and no string formatting on the caller's thread."""
+        record = (ts if ts is not None else time.time(), bean_id, bean_class, class_name, confidence, box,
+                  angle, attempts, from_queue, time_taken, timings, lane, config_version, x_after)
+        with self._lock:
+            self._buffer.append(record)
+            pending = len(self._buffer)
+        self.added += 1
+        if pending >= self.flush_size:
+            self._wake.set()
+
+    @staticmethod
+    def _row(record):
+        ts, bean_id, bean_class, class_name, confidence, box, angle, attempts, from_queue, time_taken, timings, lane, \
+            config_version, x_after = record
+        x1, y1, x2, y2 = box if box is not None else (None, None, None, None)
+        x = (x1 + x2) // 2 if box is not None else None
+        y = (y1 + y2) // 2 if box is not None else None
+        return (ts, bean_id, bean_class, class_name, confidence, x, y, x1, y1, x2, y2, angle, attempts,
+                int(bool(from_queue)), time_taken, json.dumps(timings) if timings else None, lane,
+                config_version, x_after)
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self._flush(conn)
+                if not self._running:
+                    self._flush(conn)
+                    break
+        finally:
+            conn.close()
+
+    def _flush(self, conn):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO beans ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    [self._row(r) for r in batch])
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Could not write {len(batch)} bean record(s) to {self.path}: {e}")
+            with self._lock:
+                self._buffer[:0] = batch  # keep them for the next flush
+            return
+        self.written += len(batch)
+        self.flushes += 1
+        self.last_flush_time = time.perf_counter() - start
+
+    def stats(self):
+        return {
+            "added": self.added,
+            "written": self.written,
+            "buffered": len(self._buffer),
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_time": self.last_flush_time,
+        }
+
+
+def export_csv(db_path, csv_path):
+    """Writes the whole beans table to a CSV file (timestamps formatted once, here)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(f"SELECT id, {', '.join(COLUMNS)} FROM beans ORDER BY id")
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "timestamp"] + COLUMNS[1:])
+            count = 0
+            for row in cursor:
+                writer.writerow([row[0], time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[1]))] + list(row[2:]))
+                count += 1
+    finally:
+        conn.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the bean result store")
+    parser.add_argument("db", nargs="?", default="bean_log.db")
+    parser.add_argument("--csv", required=True, help="output CSV file")
+    args = parser.parse_args()
+    print(f"Exported {export_csv(args.db, args.csv)} bean record(s) to {args.csv}")
@@ -0,0 +1,274 @@
+import collections
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import serial
+from utils.logger import logging
+
+
+class ArduinoError(Exception):
+    """The Arduino rejected a command or the link failed."""
+
+
+class ArduinoTimeout(ArduinoError):
+    """No acknowledgement arrived in time."""
+
+
+class ArduinoLinkError(ArduinoError):
+    """
+    The serial link itself failed (port gone, read or write error). sent is False when the
+    command was never written, so the board cannot have carried it out.
+    """
+
+    def __init__(self, message, sent=True):
+        super().__init__(message)
+        self.sent = sent
+
+
+# Commands that can be resent safely if their acknowledgement is lost.
+# Motion commands (STEP, angles, +/-) are never retried: a lost ack does not mean the move did not happen.
+IDEMPOTENT_COMMANDS = {"START", "STOP", "0", "1", "2"}
+
+TAG_PATTERN = re.compile(r"^#(\d+) (.*)$")
+ERROR_PREFIX = "Unrecognized command"
+
+# Angles the firmware cannot receive as a carousel correction: "1" and "2" are servo class commands
+# (checked before an angle is parsed) and -1 is safeStringToInt()'s error value. "0" is the LOW
+# servo command as well, so an angle of 0 must never be sent either.
+UNSENDABLE_ANGLES = (-1, 0, 1, 2)
+
+
+def sendable_angle(angle):
+    """
+    Rounds an angle correction to the whole degrees the firmware parses.
+
+    Returns:
+        int: The angle to send, or 0 for no correction (also for -1, 1 and 2, which the firmware
+        would take as a servo command or a parse error; a 2 degree move is below the landing error).
+    """
+    angle = int(round(angle))
+    return 0 if angle in UNSENDABLE_ANGLES else angle
+
+
+def is_ack(command, line):
+    """Returns True if line is the final acknowledgement for command (see hardware/enhanced_arduino.ino)."""
+    if command in ("START", "STEP"):
+        return line == "READY"
+    if command == "STOP":
+        return line.startswith("Stopping") or line.startswith("STOP command received")
+    if command in ("0", "1", "2"):
+        return line.startswith("Servo set to")
+    if command in ("+", "-"):
+        return line.startswith("Rotated")
+    return line.startswith("Rotating angle")
+
+
+class PendingCommand:
+    def __init__(self, seq, command):
+        self.seq = seq
+        self.command = command
+        self.future = Future()
+        self.future.seq = seq
+        self.sent_at = time.perf_counter()
+
+
+class ArduinoClient:
+    """
+    Serial client for the sorter firmware with acknowledgement-driven commands.
+
+    Every command gets a sequence number and a Future that resolves with the acknowledgement line
+    once the Arduino has carried the command out (READY after a step, "Servo set to ..." after a servo
+    move, "Rotating angle : n" after an angle correction). A background thread reads the port.
+
+    With tagged=True commands are sent as "#<seq> CMD" and matched by the tag the firmware echoes.
+    With tagged=False (older firmware) acknowledgements are matched to commands in order.
+
+    Parameters:
+        port (str): Serial port or pyserial URL (e.g. "COM7", "/dev/ttyACM0", "/dev/pts/3").
+        baudrate (int): Baud rate.
+        ack_timeout (float): Default time to wait for an acknowledgement (seconds).
+        retries (int): Default resend count for idempotent commands.
+        tagged (bool): Use sequence tags.
+    """
+
+    def __init__(self, port, baudrate=9600, ack_timeout=5.0, retries=2, tagged=True):
+        self.port = port
+        self.baudrate = baudrate
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.tagged = tagged
+
+        self._serial = None
+        self._reader = None
+        self._running = False
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self._seq = 0
+
+        # Counters
+        self.commands_sent = 0
+        self.acks = 0
+        self.timeouts = 0
+        self.retried = 0
+        self.errors = 0
+        self.unmatched_lines = 0
+        self.rtt = {}  # command kind -> [count, total seconds, max seconds]
+
+    def open(self):
+        """Opens the port and starts the reader thread."""
+        self._serial = serial.serial_for_url(self.port, baudrate=self.baudrate, timeout=0.1)
+        self._running = True
+        self._reader = threading.Thread(target=self._read_loop, name="arduino-reader", daemon=True)
+        self._reader.start()
+        return self
+
+    def close(self):
+        self._running = False
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join(timeout=1)
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except Exception:
+                pass
+        self._fail_pending(ArduinoLinkError("connection closed"))
+
+    @property
+    def is_open(self):
+        return self._serial is not None and self._serial.is_open and self._running
+
+    def _fail_pending(self, error):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for p in pending:
+            if not p.future.done():
+                p.future.set_exception(error)
+
+    def send(self, command):
+        """
+        Sends a command without waiting.
+
+        Returns:
+            Future: resolves with the acknowledgement line, or fails with ArduinoError.
+        """
+        with self._lock:
+            self._seq += 1
+            pending = PendingCommand(self._seq, command)
+            self._pending[pending.seq] = pending
+        line = f"#{pending.seq} {command}\n" if self.tagged else f"{command}\n"
+        try:
+            with self._write_lock:
+                if not self._running:
+                    raise serial.SerialException("the port is closed or the reader stopped")
+                self._serial.write(line.encode('utf-8'))
+        except Exception as e:
+            self._forget(pending.seq)
+            self.errors += 1
+            self._running = False  # the reader stops too; the link has to be reopened
+            pending.future.set_exception(ArduinoLinkError(f"Error writing to Arduino: {e}", sent=False))
+            return pending.future
+        self.commands_sent += 1
+        return pending.future
+
+    def _forget(self, seq):
+        with self._lock:
+            return self._pending.pop(seq, None)
+
+    def command(self, command, timeout=None, retries=None):
+        """
+        Sends a command and blocks until the Arduino acknowledges it.
+
+        Idempotent commands are resent up to `retries` times on timeout; motion commands are not.
+
+        Returns:
+            str: The acknowledgement line.
+        """
+        timeout = self.ack_timeout if timeout is None else timeout
+        if retries is None:
+            retries = self.retries if command in IDEMPOTENT_COMMANDS else 0
+        for attempt in range(retries + 1):
+            if attempt:
+                self.retried += 1
+                logging.info(f"Resending '{command}' (attempt {attempt + 1})")
+            future = self.send(command)
+            try:
+                return future.result(timeout)
+            except FutureTimeout:
+                self._forget(future.seq)
+                self.timeouts += 1
+                logging.error(f"No acknowledgement for '{command}' within {timeout}s")
+        raise ArduinoTimeout(f"No acknowledgement for '{command}' after {retries + 1} attempt(s)")
+
+    def handshake(self, timeout=10.0):
+        """Sends START until the Arduino answers READY (the board may still be booting after the port opened)."""
+        attempts = max(1, int(timeout / 0.5))
+        return self.command("START", timeout=0.5, retries=attempts - 1)
+
+    def _read_loop(self):
+        while self._running:
+            try:
+                raw = self._serial.readline()
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Error reading from Arduino: {e}")
+                self._running = False
+                self._fail_pending(ArduinoLinkError(f"Error reading from Arduino: {e}"))
+                break
+            if not raw:
+                continue
+            line = raw.decode('utf-8', errors='replace').strip()
+            if line:
+                self._handle_line(line)
+
+    def _handle_line(self, line):
+        match = TAG_PATTERN.match(line)
+        with self._lock:
+            if match:
+                pending = self._pending.get(int(match.group(1)))
+                text = match.group(2)
+            elif not self.tagged and self._pending:
+                pending = next(iter(self._pending.values()))
+                text = line
+            else:
+                pending, text = None, line
+            if pending is None:
+                self.unmatched_lines += 1
+                logging.debug(f"Arduino: {line}")
+                return
+            if text.startswith(ERROR_PREFIX):
+                outcome = ArduinoError(text)
+            elif is_ack(pending.command, text):
+                outcome = text
+            else:
+                logging.debug(f"Arduino [{pending.command}]: {text}")
+                return
+            del self._pending[pending.seq]
+
+        if isinstance(outcome, ArduinoError):
+            self.errors += 1
+            pending.future.set_exception(outcome)
+            return
+        elapsed = time.perf_counter() - pending.sent_at
+        kind = pending.command if pending.command in IDEMPOTENT_COMMANDS or pending.command == "STEP" else "angle"
+        stats = self.rtt.setdefault(kind, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+        self.acks += 1
+        pending.future.set_result(outcome)
+
+    def stats(self):
+        """Returns a snapshot of the client counters and per-command acknowledgement times."""
+        return {
+            "commands_sent": self.commands_sent,
+            "acks": self.acks,
+            "timeouts": self.timeouts,
+            "retried": self.retried,
+            "errors": self.errors,
+            "unmatched_lines": self.unmatched_lines,
+            "pending": len(self._pending),
+            "ack_time": {k: {"count": c, "avg": t / c, "max": m} for k, (c, t, m) in self.rtt.items()},
+        }
@@ -0,0 +1,117 @@
+import collections
+import time
+from utils.logger import logging
+
+
+class BeanDetection:
+    """One detected bean: class, confidence and position in the ROI."""
+
+    def __init__(self, bean_class, confidence, box, angle=0, frame_time=None, timings=None):
+        self.bean_class = bean_class
+        self.confidence = confidence
+        self.box = tuple(int(v) for v in box)  # (x1, y1, x2, y2)
+        x1, y1, x2, y2 = self.box
+        self.x, self.y = (x1 + x2) // 2, (y1 + y2) // 2
+        self.angle = angle
+        self.frame_time = frame_time if frame_time is not None else time.time()
+        self.from_queue = False
+        self.timings = timings or {}  # seconds per stage for the frame it came from (gate, inference)
+
+    def __repr__(self):
+        return (f"BeanDetection(class={self.bean_class}, conf={self.confidence:.2f}, "
+                f"x={self.x}, y={self.y}, angle={self.angle})")
+
+
+class SortQueue:
+    """
+    Holds the beans seen in one frame until their carousel position comes up.
+
+    When one inference pass finds several beans, the first (in the direction of travel) is sorted
+    right away and the others are dispatched on the following carousel positions without running
+    the model again. The sort loops still capture each queued position to check that the bean is
+    there (final.verify_queued); if the slot is empty the frame's positions no longer match the
+    carousel and reject() drops the whole queue.
+
+    Parameters:
+        max_pending (int): Maximum number of queued beans; extra detections are dropped.
+        max_age (float): Queued beans older than this (seconds) are discarded (the frame is out of date).
+        travel_axis (str): "x" or "y", the image axis the carousel moves beans along.
+        reverse (bool): True if beans travel towards smaller coordinates on that axis.
+    """
+
+    def __init__(self, max_pending=4, max_age=10.0, travel_axis="x", reverse=False):
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.travel_axis = travel_axis
+        self.reverse = reverse
+        self._pending = collections.deque()
+
+        # Counters
+        self.frames = 0
+        self.detections = 0
+        self.dispatched_from_queue = 0
+        self.dropped = 0
+        self.expired = 0
+        self.rejected = 0  # queued beans dropped because a queued slot was empty
+
+    def __len__(self):
+        return len(self._pending)
+
+    def order(self, detections):
+        """Sorts detections in the order they will reach the servo."""
+        key = (lambda d: d.x) if self.travel_axis == "x" else (lambda d: d.y)
+        return sorted(detections, key=key, reverse=self.reverse)
+
+    def add_frame(self, detections):
+        """
+        Takes all detections of one frame.
+
+        Returns:
+            BeanDetection: The bean to sort now (None if the frame had no detections).
+        """
+        self.frames += 1
+        self.detections += len(detections)
+        if not detections:
+            return None
+        first, *rest = self.order(detections)
+        for detection in rest:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                continue
+            detection.angle = 0
+            detection.from_queue = True
+            self._pending.append(detection)
+        if rest:
+            logging.debug(f"{len(detections)} beans in one frame, {len(self._pending)} queued for later positions")
+        return first
+
+    def next(self):
+        """Returns the next queued bean for the current carousel position, or None if a new frame is needed."""
+        now = time.time()
+        while self._pending:
+            detection = self._pending.popleft()
+            if now - detection.frame_time > self.max_age:
+                self.expired += 1
+                continue
+            self.dispatched_from_queue += 1
+            return detection
+        return None
+
+    def reject(self):
+        """The slot of the bean just returned by next() was empty: drops it and everything still queued."""
+        self.rejected += 1 + len(self._pending)
+        self._pending.clear()
+
+    def clear(self):
+        self._pending.clear()
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "detections": self.detections,
+            "pending": len(self._pending),
+            "dispatched_from_queue": self.dispatched_from_queue,
+            "dropped": self.dropped,
+            "expired": self.expired,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,462 @@
+"""
+Connection supervisors for the serial link and the camera.
+
+A supervisor owns one connection. It opens it in a background thread, notices when it fails
+(the owner reports a failed command or read, or a periodic health check finds it dead), closes it
+and reconnects with exponential backoff, so a USB glitch costs a fraction of a second instead of a
+stalled sort loop. While the connection is down, callers wait for the recovery (up to a bounded
+time) instead of failing straight away.
+
+    SerialSupervisor   ArduinoClient, redoing the START/READY handshake on every reconnect.
+                       Commands issued during an outage are held and sent once the link is back.
+    CameraSupervisor   A capture backend (camera.create_camera), restarted after a few failed reads.
+
+Every outage is counted and its recovery time (from the first failure to the working connection)
+is recorded in the stats and as the serial_recovery / camera_recovery metrics.
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future
+from metrics import registry
+from serial_client import ArduinoClient, ArduinoLinkError, ArduinoTimeout, IDEMPOTENT_COMMANDS
+from utils.logger import logging
+
+# Seconds a command or capture waits for a lost connection to come back before it fails
+HOLD_TIMEOUT = 10.0
+# Most commands held while the serial link is down; more fail at once
+HOLD_LIMIT = 32
+# Seconds between health checks of a connection nobody is using
+CHECK_INTERVAL = 0.5
+# Commands in a row without an acknowledgement before a link that is still open counts as failed
+# (the board hangs, or the USB adapter stopped passing data)
+ACK_TIMEOUT_LIMIT = 3
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter: initial, initial * factor, ... up to maximum seconds.
+
+    The first retry is quick because most outages are a single glitch (a USB re-enumeration,
+    one dropped stream); the delay then grows so a board that is unplugged is not hammered.
+    """
+
+    def __init__(self, initial=0.05, maximum=5.0, factor=2.0, jitter=0.1):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempt = 0
+
+    def reset(self):
+        self.attempt = 0
+
+    def next(self):
+        """Returns the delay before the next attempt."""
+        delay = min(self.maximum, self.initial * self.factor ** self.attempt)
+        self.attempt += 1
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class Supervisor:
+    """
+    Keeps one connection up. Subclasses implement _connect() (returns a working connection or
+    raises), _disconnect(conn) and optionally _healthy(conn).
+
+    Parameters:
+        name (str): Used in log lines and metric names.
+        backoff (Backoff): Reconnect delays.
+        check_interval (float): Seconds between health checks.
+    """
+
+    def __init__(self, name, backoff=None, check_interval=CHECK_INTERVAL):
+        self.name = name
+        self.backoff = backoff or Backoff()
+        self.check_interval = check_interval
+        self._conn = None
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._down_since = None  # time.monotonic() of the first failure of the current outage
+        self._connected_once = False
+        self._retired = {}       # counters of the connections already replaced
+
+        # Counters
+        self.outages = 0
+        self.recoveries = 0
+        self.connect_attempts = 0
+        self.connect_failures = 0
+        self.last_error = None
+        self.startup_time = None
+        self.last_recovery_time = 0.0
+        self.max_recovery_time = 0.0
+        self._total_recovery_time = 0.0
+
+    def start(self):
+        """Starts connecting in the background; use connection() to wait for the first connection."""
+        self._running = True
+        self._down_since = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-supervisor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            conn, self._conn = self._conn, None
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if conn is not None:
+            self._close(conn)
+
+    @property
+    def connected(self):
+        return self._conn is not None
+
+    def connection(self, timeout=0):
+        """Returns the live connection, waiting up to timeout seconds for a reconnect; None if still down."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._conn is not None or not self._running, timeout)
+            return self._conn
+
+    def report_failure(self, conn, error, since=None):
+        """
+        Marks conn as failed and starts a reconnect. Reports about a connection that was already
+        replaced are ignored, so several callers can report the same failure.
+
+        Parameters:
+            since (float): time.monotonic() of the first failure, if it was noticed before now.
+        """
+        with self._cond:
+            if conn is None or conn is not self._conn:
+                return
+            self._conn = None
+            self._down_since = since if since is not None else time.monotonic()
+            self.outages += 1
+            self.last_error = str(error)
+            self._cond.notify_all()
+        registry.inc(f"{self.name}_outages")
+        logging.error(f"{self.name}: connection lost ({error}), reconnecting")
+        self._close(conn)
+
+    def _close(self, conn):
+        try:
+            self._disconnect(conn)
+        except Exception as e:
+            logging.debug(f"{self.name}: error closing the old connection: {e}")
+        for key, value in conn.stats().items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                self._retired[key] = self._retired.get(key, 0) + value
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._conn is None or not self._running, self.check_interval)
+                if not self._running:
+                    return
+                conn = self._conn
+            if conn is None:
+                self._reconnect()
+            elif not self._healthy(conn):
+                self.report_failure(conn, "health check failed")
+
+    def _reconnect(self):
+        self.backoff.reset()
+        while self._running:
+            self.connect_attempts += 1
+            try:
+                conn = self._connect()
+            except Exception as e:
+                self.connect_failures += 1
+                self.last_error = str(e)
+                delay = self.backoff.next()
+                logging.warning(f"{self.name}: connect attempt failed ({e}), next one in {delay:.2f}s")
+                self._while_down()
+                with self._cond:
+                    self._cond.wait_for(lambda: not self._running, delay)
+                continue
+            with self._cond:
+                stopped = not self._running
+                if not stopped:
+                    # Still under the lock: nothing reaches the new connection before _on_connected is done
+                    self._on_connected(conn)
+                    downtime = time.monotonic() - self._down_since
+                    self._conn, self._down_since = conn, None
+                    self._cond.notify_all()
+            if stopped:
+                self._disconnect(conn)
+                return
+            if self._connected_once:
+                self.recoveries += 1
+                self.last_recovery_time = downtime
+                self.max_recovery_time = max(self.max_recovery_time, downtime)
+                self._total_recovery_time += downtime
+                registry.observe(f"{self.name}_recovery", downtime)
+                logging.warning(f"{self.name}: reconnected after {downtime:.2f}s")
+            else:
+                self._connected_once = True
+                self.startup_time = downtime
+                logging.info(f"{self.name}: connected in {downtime:.2f}s")
+            return
+
+    def _healthy(self, conn):
+        return True
+
+    def _on_connected(self, conn):
+        """
+        Runs on the supervisor thread after every (re)connect, with the lock held and before any
+        caller can get the connection.
+        """
+
+    def _while_down(self):
+        """Runs on the supervisor thread between failed connect attempts."""
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _disconnect(self, conn):
+        raise NotImplementedError
+
+    def stats(self):
+        """Counters of the current connection (plus those of the connections it replaced) and the outages."""
+        conn = self._conn
+        stats = dict(self._retired)
+        if conn is not None:
+            for key, value in conn.stats().items():
+                if isinstance(value, int) and not isinstance(value, bool):
+                    stats[key] = stats.get(key, 0) + value
+                else:
+                    stats[key] = value
+        down_since = self._down_since
+        stats.update({
+            "connected": conn is not None,
+            "outages": self.outages,
+            "recoveries": self.recoveries,
+            "connect_attempts": self.connect_attempts,
+            "connect_failures": self.connect_failures,
+            "last_error": self.last_error,
+            "startup_time": self.startup_time,
+            "last_recovery_time": self.last_recovery_time,
+            "max_recovery_time": self.max_recovery_time,
+            "avg_recovery_time": self._total_recovery_time / self.recoveries if self.recoveries else 0.0,
+            "downtime": self._total_recovery_time + (time.monotonic() - down_since
+                                                     if down_since is not None and self._connected_once else 0.0),
+        })
+        return stats
+
+
+class SerialSupervisor(Supervisor):
+    """
+    Supervised ArduinoClient with the same send()/command() interface.
+
+    Commands sent while the link is down, or whose write failed, are held (at most HOLD_LIMIT, for
+    up to hold_timeout seconds) and go out in order after the reconnect and handshake, before any
+    command that was waiting in command() (held and waiting commands keep their order). A link that
+    stays open but leaves ACK_TIMEOUT_LIMIT commands in a row unacknowledged is reconnected too. A command
+    whose link failed after it was written is only repeated if it is idempotent
+    (serial_client.IDEMPOTENT_COMMANDS): a STEP or angle correction may have run before the link
+    dropped, and running it twice mis-sorts every following bean. Such a command fails with
+    ArduinoLinkError.
+
+    Parameters:
+        port (str): Serial port or pyserial URL.
+        baudrate (int): Baud rate.
+        hold_timeout (float): Seconds a command waits for the link to come back.
+        handshake_timeout (float): Seconds to wait for READY after each (re)connect.
+        backoff (Backoff): Reconnect delays.
+        client_options: Passed on to ArduinoClient (ack_timeout, retries, tagged).
+    """
+
+    def __init__(self, port, baudrate=9600, hold_timeout=HOLD_TIMEOUT, handshake_timeout=10.0, backoff=None,
+                 **client_options):
+        super().__init__("serial", backoff)
+        self.port = port
+        self.baudrate = baudrate
+        self.hold_timeout = hold_timeout
+        self.handshake_timeout = handshake_timeout
+        self.client_options = client_options
+        self._held = []  # [command, future, deadline] waiting for the link, guarded by _cond
+        self._missed_acks = 0
+
+        # Counters
+        self.held = 0
+        self.dropped = 0
+
+    def _connect(self):
+        client = ArduinoClient(self.port, self.baudrate, **self.client_options).open()
+        try:
+            client.handshake(timeout=self.handshake_timeout)
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    def _disconnect(self, client):
+        client.close()
+
+    def _healthy(self, client):
+        # is_open is False once the reader thread hit a read error
+        return client.is_open and self._missed_acks < ACK_TIMEOUT_LIMIT
+
+    def send(self, command):
+        """
+        Sends a command without waiting.
+
+        Returns:
+            Future: resolves with the acknowledgement line, or fails with ArduinoError.
+        """
+        client = self._conn
+        if client is not None:
+            future = client.send(command)
+            if not (future.done() and isinstance(future.exception(), ArduinoLinkError)):
+                future.add_done_callback(lambda f: self._check(client, f))
+                return future
+            # The write failed, so the command never went out: hold it for the new link
+            self.report_failure(client, future.exception())
+        return self._hold(command)
+
+    def _check(self, client, future):
+        if not future.cancelled() and isinstance(future.exception(), ArduinoLinkError):
+            self.report_failure(client, future.exception())
+
+    def _hold(self, command):
+        future = Future()
+        with self._cond:
+            client = self._conn
+            if client is not None:
+                # Reconnected since the caller looked: the held commands are already out
+                return self.send(command)
+            if len(self._held) >= HOLD_LIMIT:
+                self.dropped += 1
+                future.set_exception(ArduinoLinkError(f"Serial link down, {HOLD_LIMIT} commands already held"))
+                return future
+            self._held.append([command, future, time.monotonic() + self.hold_timeout])
+            self.held += 1
+        return future
+
+    def _on_connected(self, client):
+        self._missed_acks = 0
+        held, self._held = self._held, []
+        now = time.monotonic()
+        for command, future, deadline in held:
+            if now > deadline:
+                self.dropped += 1
+                future.set_exception(ArduinoLinkError(f"Serial link down for more than {self.hold_timeout}s, "
+                                                      f"'{command}' not sent"))
+                continue
+            sent = client.send(command)
+            sent.add_done_callback(lambda f, future=future: _copy_result(f, future))
+            sent.add_done_callback(lambda f: self._check(client, f))
+        if held:
+            logging.info(f"serial: sent {len(held)} held command(s) after the reconnect")
+
+    def _while_down(self):
+        now = time.monotonic()
+        with self._cond:
+            expired = [entry for entry in self._held if now > entry[2]]
+            self._held = [entry for entry in self._held if now <= entry[2]]
+        for command, future, _ in expired:
+            self.dropped += 1
+            future.set_exception(ArduinoLinkError(f"Serial link down for more than {self.hold_timeout}s, "
+                                                  f"'{command}' not sent"))
+
+    def command(self, command, timeout=None, retries=None):
+        """
+        Sends a command and blocks until the Arduino acknowledges it (see ArduinoClient.command).
+        While the link is down this waits up to hold_timeout seconds for it to come back.
+
+        Returns:
+            str: The acknowledgement line.
+        """
+        deadline = time.monotonic() + self.hold_timeout
+        while True:
+            client = self.connection(max(0.0, deadline - time.monotonic()))
+            if client is None:
+                self.dropped += 1
+                raise ArduinoLinkError(f"Serial link down for more than {self.hold_timeout}s, '{command}' not sent")
+            try:
+                ack = client.command(command, timeout=timeout, retries=retries)
+            except ArduinoLinkError as e:
+                self.report_failure(client, e)
+                if e.sent and command not in IDEMPOTENT_COMMANDS:
+                    raise
+                self.held += 1
+                continue
+            except ArduinoTimeout:
+                self._missed_acks += 1
+                if self._missed_acks >= ACK_TIMEOUT_LIMIT:
+                    self.report_failure(client, f"{self._missed_acks} commands in a row were not acknowledged")
+                raise
+            self._missed_acks = 0
+            return ack
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"held": self.held, "dropped": self.dropped, "waiting": len(self._held)})
+        return stats
+
+
+def _copy_result(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class CameraSupervisor(Supervisor):
+    """
+    Supervised capture backend with the camera read() interface.
+
+    The backends already retry on their own (the stream grabber reopens the stream, the snapshot
+    camera reconnects per request); the supervisor restarts the whole backend when that does not
+    help for fail_after reads in a row, and keeps the outage statistics.
+
+    Parameters:
+        factory (callable): Creates and starts the backend, e.g. lambda: create_camera("stream", url).
+        fail_after (int): Failed reads in a row before the backend is restarted.
+        probe_timeout (float): Seconds a new backend gets to deliver its first frame.
+        backoff (Backoff): Restart delays.
+    """
+
+    def __init__(self, factory, fail_after=3, probe_timeout=5.0, backoff=None):
+        super().__init__("camera", backoff or Backoff(initial=0.2, maximum=10.0))
+        self.factory = factory
+        self.fail_after = fail_after
+        self.probe_timeout = probe_timeout
+        self._failed_reads = 0
+        self._failing_since = None
+
+    def _connect(self):
+        camera = self.factory()
+        ret, _ = camera.read(timeout=self.probe_timeout)
+        if not ret:
+            camera.stop()
+            raise ConnectionError(f"no frame within {self.probe_timeout}s")
+        return camera
+
+    def _disconnect(self, camera):
+        camera.stop()
+
+    def read(self, timeout=2.0, newer_than=None, same_slot=False):
+        """
+        Returns (ret, frame) like the backend's read(). During a restart this waits up to timeout
+        seconds for the camera to come back.
+        """
+        deadline = time.monotonic() + timeout
+        camera = self.connection(timeout)
+        if camera is None:
+            return False, None
+        ret, frame = camera.read(timeout=max(0.1, deadline - time.monotonic()), newer_than=newer_than,
+                                 same_slot=same_slot)
+        if ret:
+            self._failed_reads, self._failing_since = 0, None
+            return ret, frame
+        self._failed_reads += 1
+        if self._failing_since is None:
+            self._failing_since = time.monotonic()
+        if self._failed_reads >= self.fail_after:
+            self.report_failure(camera, f"{self._failed_reads} reads in a row failed", since=self._failing_since)
+            self._failed_reads, self._failing_since = 0, None
+        return False, None
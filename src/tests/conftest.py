@@ -0,0 +1,22 @@
+"""
+Shared setup for the unit tests. The modules are imported script-style from the src folder, like
+the sorter itself does, so it is put on sys.path here.
+
+Run from the repository root:
+    python -m pytest -q src/tests
+"""
+import os
+import sys
+import tempfile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# utils.logger opens its log files relative to the working directory; keep them out of the tree
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="sorter-tests-"))
+try:
+    import utils.logger  # noqa: F401
+finally:
+    os.chdir(_cwd)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from angle_calibration import AngleCalibration, fit_gain, linear_rule
+from serial_client import sendable_angle
+
+
+def moves(gain, gain_slope, target_x=220, n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 472, n)
+    angle = np.round(rng.uniform(-30, 30, n))
+    x_after = x + angle * (gain + gain_slope * (x - target_x)) + rng.normal(0, 1.0, n)
+    return x, angle, x_after
+
+
+def test_fit_recovers_gain_and_slope():
+    x, angle, x_after = moves(4.5, 0.004)
+    gain, gain_slope, residual_std, used = fit_gain(x, angle, x_after, 220)
+    assert gain == pytest.approx(4.5, abs=0.05)
+    assert gain_slope == pytest.approx(0.004, abs=0.0005)
+    assert residual_std == pytest.approx(1.0, abs=0.3)
+
+
+def test_fit_rejects_outliers():
+    x, angle, x_after = moves(5.0, 0.0)
+    x_after[:10] += 150  # beans that slid or were mislocated
+    gain, _, _, used = fit_gain(x, angle, x_after, 220, fit_slope=False)
+    assert gain == pytest.approx(5.0, abs=0.05)
+    assert used <= len(x) - 10
+
+
+def test_table_dead_band_and_clamp():
+    calibration = AngleCalibration.build(472, 220, 5.0, half_band=50, max_angle=20)
+    assert len(calibration.lut) == 472
+    assert calibration.angle_for(220) == calibration.angle_for(170) == calibration.angle_for(270) == 0
+    assert calibration.angle_for(320) == -20  # (220 - 320) / 5
+    assert calibration.angle_for(0) == 20     # clamped to max_angle
+    assert calibration.angle_for(-50) == calibration.angle_for(0)
+    assert calibration.angle_for(1000) == calibration.angle_for(471)
+
+
+@pytest.mark.parametrize("angle,sent", [(0, 0), (0.4, 0), (-1, 0), (-0.6, 0), (1, 0), (1.4, 0), (2, 0), (2.2, 0),
+                                        (-2, -2), (3, 3), (2.6, 3), (-12.4, -12)])
+def test_sendable_angle(angle, sent):
+    assert sendable_angle(angle) == sent
+
+
+def test_table_never_holds_a_servo_command_or_the_parse_error():
+    # A large gain and no dead band would ask for one- and two-degree moves next to the target
+    calibration = AngleCalibration.build(472, 220, 30.0, half_band=0)
+    assert not {-1, 1, 2} & set(calibration.lut)
+    assert -2 in calibration.lut
+    assert AngleCalibration([0, -1, 1, 2, -2, 3], 1, (1, 1), 1.0).lut == [0, 0, 0, 0, -2, 3]
+
+
+def test_linear_rule_with_a_narrow_dead_band():
+    # 218..222 around the centre at 6 px/degree would round to -1..2 degrees
+    assert [linear_rule(x, dead_band=(219, 221)) for x in (200, 208, 214, 226, 232)] == [3, 0, 0, 0, -2]
+
+
+def test_sort_loop_angles_are_sendable(monkeypatch):
+    import final
+    monkeypatch.setattr(final, "angle_calibration", None)
+    monkeypatch.setattr(final, "ANGLE_DEAD_BAND", (219, 221))  # hot-reloadable, so any band can arrive
+    angles = {final.get_adjusted_angle(x, 150) for x in range(472)}
+    assert not {-1, 1, 2} & angles
+    assert all(isinstance(a, int) for a in angles)
+
+
+def test_save_and_load(tmp_path):
+    calibration = AngleCalibration.build(472, 215, 4.8, 0.002, half_band=55, info={"moves": 120})
+    path = str(tmp_path / "angle_calibration.json")
+    calibration.save(path)
+    loaded = AngleCalibration.load(path)
+    assert loaded.lut == calibration.lut
+    assert (loaded.target_x, loaded.dead_band, loaded.gain, loaded.gain_slope) == (215, (160, 270), 4.8, 0.002)
+    assert loaded.info == {"moves": 120}
@@ -0,0 +1,98 @@
+import json
+import os
+import numpy as np
+import archive
+from archive import INDEX_FILE, ArchiveWriter
+
+
+def noise(seed):
+    return np.random.default_rng(seed).integers(0, 256, size=(120, 160, 3), dtype=np.uint8)
+
+
+def index_paths(root):
+    with open(os.path.join(root, INDEX_FILE)) as f:
+        return [json.loads(line)["path"] for line in f]
+
+
+def test_sampling_keeps_every_nth_bean_of_a_class(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), sample_rates={1: 0.25, 2: 0})
+    assert [writer.keep(1) for _ in range(8)] == [False, False, False, True] * 2
+    assert not any(writer.keep(2) for _ in range(5))
+    assert all(writer.keep(0) for _ in range(5))  # default rate
+
+
+def test_a_bean_is_archived_completely_or_not_at_all(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), sample_rates={1: 0.5}).start()
+    for i in range(6):
+        keep = writer.keep(1)
+        writer.submit("boxes", noise(i), filename=f"box_{i}.jpg", bean_class=1, keep=keep)
+        writer.submit("annotated", noise(i), filename=f"annotated_{i}.jpg", bean_class=1, keep=keep)
+    writer.stop()
+    boxes = sorted(os.listdir(tmp_path / "boxes"))
+    assert boxes == ["box_1.jpg", "box_3.jpg", "box_5.jpg"]
+    assert sorted(os.listdir(tmp_path / "annotated")) == [b.replace("box", "annotated") for b in boxes]
+    assert writer.sampled_out == 6
+
+
+def test_quota_evicts_the_oldest_images_and_prunes_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "INDEX_COMPACT_AFTER", 1)
+    writer = ArchiveWriter(str(tmp_path), quota_bytes=200_000).start()
+    for i in range(20):
+        writer.submit("boxes", noise(i), filename=f"box_{i:02d}.jpg")
+    writer.stop()
+    files = sorted(os.listdir(tmp_path / "boxes"))
+    assert writer.evicted > 0 and "box_19.jpg" in files and "box_00.jpg" not in files
+    used = sum(os.path.getsize(tmp_path / "boxes" / name) for name in files)
+    assert used == writer.bytes_used
+    assert used + os.path.getsize(tmp_path / INDEX_FILE) <= 200_000
+    assert sorted(index_paths(tmp_path)) == [os.path.join("boxes", name) for name in files]
+
+
+def test_restart_drops_index_entries_of_missing_files(tmp_path):
+    writer = ArchiveWriter(str(tmp_path)).start()
+    for i in range(3):
+        writer.submit("boxes", noise(i), filename=f"box_{i}.jpg")
+    writer.stop()
+    os.remove(tmp_path / "boxes" / "box_0.jpg")
+    writer = ArchiveWriter(str(tmp_path), quota_bytes=10_000_000).start()
+    writer.stop()
+    assert index_paths(tmp_path) == [os.path.join("boxes", "box_1.jpg"), os.path.join("boxes", "box_2.jpg")]
+
+
+def test_an_image_that_cannot_be_deleted_stays_counted(tmp_path, monkeypatch):
+    writer = ArchiveWriter(str(tmp_path), quota_bytes=200_000).start()
+    writer.submit("boxes", noise(0), filename="box_00.jpg")
+    writer.stop()
+    remove = os.remove
+
+    def locked_remove(path):
+        if path.endswith("box_00.jpg"):
+            raise PermissionError("in use")
+        remove(path)
+
+    monkeypatch.setattr(archive.os, "remove", locked_remove)
+    writer.start()
+    for i in range(1, 20):
+        writer.submit("boxes", noise(i), filename=f"box_{i:02d}.jpg")
+    writer.stop()
+    files = sorted(os.listdir(tmp_path / "boxes"))
+    assert "box_00.jpg" in files and "box_01.jpg" not in files
+    assert writer.bytes_used == sum(os.path.getsize(tmp_path / "boxes" / name) for name in files)
+    assert writer.evicted == 20 - len(files)
+
+
+def test_switching_the_quota_on_counts_the_images_already_written(tmp_path):
+    writer = ArchiveWriter(str(tmp_path)).start()
+    for i in range(10):
+        writer.submit("boxes", noise(i), filename=f"box_{i:02d}.jpg")
+    writer.stop()
+    writer.start()
+    writer.quota_bytes = 200_000  # as a config reload does
+    for i in range(10, 12):
+        writer.submit("boxes", noise(i), filename=f"box_{i:02d}.jpg")
+    writer.stop()
+    files = sorted(os.listdir(tmp_path / "boxes"))
+    assert "box_00.jpg" not in files and "box_11.jpg" in files
+    used = sum(os.path.getsize(tmp_path / "boxes" / name) for name in files)
+    assert used == writer.bytes_used
+    assert used + os.path.getsize(tmp_path / INDEX_FILE) <= 200_000
@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+import pytest
+from colour_classifier import ColourClassifier, bean_crop, bean_features, locate_beans
+
+# BGR roast colours of the three grades (0: dark, 1: light, 2: medium)
+ROAST = {0: (20, 35, 50), 1: (90, 140, 170), 2: (45, 80, 110)}
+
+
+def roi(beans, seed=0):
+    """A light carousel ROI with one ellipse per (class, x) bean."""
+    rng = np.random.default_rng(seed)
+    image = np.clip(225 + rng.normal(0, 2, size=(320, 480, 3)), 0, 255).astype(np.uint8)
+    for bean_class, x in beans:
+        colour = tuple(int(c + rng.integers(-6, 7)) for c in ROAST[bean_class])
+        cv2.ellipse(image, (x, 160), (40, 26), 20, 0, 360, colour, -1)
+    return image
+
+
+@pytest.fixture(scope="module")
+def model():
+    features, labels = [], []
+    for seed in range(30):
+        bean_class = seed % 3
+        crop, _ = bean_crop(roi([(bean_class, 240)], seed))
+        features.append(bean_features(crop))
+        labels.append(bean_class)
+    return ColourClassifier.fit(features, labels, threshold=0.9)
+
+
+def test_locate_beans_finds_each_bean():
+    assert len(locate_beans(roi([(0, 240)]))) == 1
+    assert len(locate_beans(roi([(0, 120), (1, 360)]))) == 2
+    assert locate_beans(roi([])) == []  # no contrast, no bean
+
+
+def test_box_covers_the_bean():
+    x1, y1, x2, y2 = bean_crop(roi([(2, 240)]))[1]
+    assert x1 < 240 - 30 and x2 > 240 + 30 and y1 < 160 - 20 and y2 > 160 + 20
+
+
+def test_confident_beans_are_answered(model):
+    for bean_class in ROAST:
+        answer = model.classify_roi(roi([(bean_class, 240)], seed=100 + bean_class))
+        assert answer is not None and answer[0] == bean_class and answer[1] >= 0.9
+    assert model.stats()["answered"] >= 3
+
+
+def test_several_beans_go_to_yolo(model):
+    fallbacks = model.fallbacks
+    assert model.classify_roi(roi([(0, 120), (1, 360)])) is None
+    assert model.classify_roi(roi([])) is None
+    assert model.fallbacks == fallbacks + 2
+
+
+def test_save_and_load(model, tmp_path):
+    path = tmp_path / "colour_classifier.json"
+    model.save(str(path))
+    loaded = ColourClassifier.load(str(path), audit_every=5)
+    features = bean_features(bean_crop(roi([(1, 240)], seed=7))[0])
+    np.testing.assert_allclose(loaded.probabilities(features), model.probabilities(features), rtol=1e-5)
+    assert loaded.audit_every == 5 and loaded.classes == [0, 1, 2]
@@ -0,0 +1,122 @@
+import threading
+import time
+import pytest
+from config import Config, ConfigError, ReloadGate, apply_config
+
+
+def test_parse_converts_and_versions():
+    config = Config.parse("confidence_threshold: 0.7\ndarkest_box_size: [20, 40]\nmetrics_port: null\n")
+    assert config.values == {"confidence_threshold": 0.7, "darkest_box_size": (20, 40), "metrics_port": None}
+    assert config.version == Config.parse("confidence_threshold: 0.7\ndarkest_box_size: [20, 40]\n"
+                                          "metrics_port: null\n").version
+    assert config.version != Config.parse("confidence_threshold: 0.8\n").version
+
+
+def test_parse_empty_file():
+    assert Config.parse("").values == {}
+
+
+@pytest.mark.parametrize("text", [
+    "confidence_treshold: 0.7",          # unknown field
+    "confidence_threshold: 1.5",         # above the maximum
+    "burst_frames: 2.5",                 # not an int
+    "presence_gate: yes please",         # not a bool
+    "use_serial_acks: 1",                # int for a bool
+    "darkest_box_size: [30]",            # wrong length
+    "angle_dead_band: [270, 150]",       # not (low, high)
+    "crop_box: [1228, 918, 1220, 1692]",  # y1 >= y2
+    "archive_sample_rates: {1: 2}",      # rate above 1
+    "inference_engine: tensorrt",        # not a choice
+    "serial_port: null",                 # not optional
+    "- a list",                          # not a mapping
+    "confidence_threshold: [",           # invalid YAML
+])
+def test_parse_rejects(text):
+    with pytest.raises(ConfigError):
+        Config.parse(text)
+
+
+def test_apply_config_sets_only_known_constants():
+    namespace = {"CONFIDENCE_THRESHOLD": 0.6, "DARKNESS_THRESHOLD": 120.0}
+    config = Config.parse("confidence_threshold: 0.7\ndarkness_threshold: 120\nburst_frames: 5\n")
+    assert apply_config(config, namespace) == ["confidence_threshold"]
+    assert namespace == {"CONFIDENCE_THRESHOLD": 0.7, "DARKNESS_THRESHOLD": 120.0}
+
+
+def test_apply_config_hot_only_skips_restart_fields():
+    namespace = {"SERIAL_PORT": "COM7", "CONFIDENCE_THRESHOLD": 0.6}
+    config = Config.parse("serial_port: /dev/ttyACM0\nconfidence_threshold: 0.5\n")
+    assert apply_config(config, namespace, hot_only=True) == ["confidence_threshold"]
+    assert namespace["SERIAL_PORT"] == "COM7"
+
+
+def test_changed_lists_differing_fields():
+    old = Config.parse("confidence_threshold: 0.6\nburst_frames: 3\n")
+    new = Config.parse("confidence_threshold: 0.6\nmax_angle: 20\n")
+    assert new.changed(old) == ["burst_frames", "max_angle"]
+
+
+
+def _in_thread(context, events, name, release=None):
+    def run():
+        with context:
+            events.append(name)
+            if release is not None:
+                release.wait(2)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_reload_gate_waits_for_beans_in_progress():
+    gate, events, release = ReloadGate(), [], threading.Event()
+    lane = _in_thread(gate.bean(), events, "bean", release)
+    time.sleep(0.05)
+    reload = _in_thread(gate.exclusive(), events, "reload")
+    time.sleep(0.05)
+    assert events == ["bean"]  # the reload waits for the bean to finish
+    release.set()
+    lane.join(2)
+    reload.join(2)
+    assert events == ["bean", "reload"]
+
+
+def test_reload_gate_holds_new_beans_while_a_reload_waits():
+    gate, events, release = ReloadGate(), [], threading.Event()
+    lane = _in_thread(gate.bean(), events, "bean", release)
+    time.sleep(0.05)
+    reload = _in_thread(gate.exclusive(), events, "reload")
+    time.sleep(0.05)
+    late = _in_thread(gate.bean(), events, "late bean")
+    time.sleep(0.05)
+    assert events == ["bean"]  # a waiting reload goes before the next bean
+    release.set()
+    for thread in (lane, reload, late):
+        thread.join(2)
+    assert events == ["bean", "reload", "late bean"]
+
+
+def test_model_path_moves_the_files_next_to_it(tmp_path, monkeypatch):
+    import final
+    for name in ("MODEL_PATH", "COLOUR_MODEL_PATH", "ANGLE_CALIBRATION_PATH", "LOG_LEVEL", "CONSOLE_LEVEL"):
+        monkeypatch.setattr(final, name, getattr(final, name))
+    models = tmp_path / "models"
+    path = tmp_path / "sorter.yaml"
+    path.write_text(f"model_path: {models / 'best.pt'}\nangle_calibration_path: null\n")
+    final.load_config(str(path), watch=False)
+    assert final.COLOUR_MODEL_PATH == str(models / "colour_classifier.json")
+    assert final.ANGLE_CALIBRATION_PATH is None  # set by the file
+
+
+def test_unreadable_angle_calibration_keeps_the_current_table(tmp_path, monkeypatch):
+    import final
+    from angle_calibration import AngleCalibration
+    table = AngleCalibration.build(440, 220, 6.0, 0.0, 60, 30)
+    monkeypatch.setattr(final, "angle_calibration", table)
+    broken = tmp_path / "angle_calibration.json"
+    broken.write_text("{not json")
+    monkeypatch.setattr(final, "ANGLE_CALIBRATION_PATH", str(broken))
+    assert final.load_angle_calibration() is table
+    assert final.angle_calibration is table
+    monkeypatch.setattr(final, "ANGLE_CALIBRATION_PATH", str(tmp_path / "missing.json"))
+    assert final.load_angle_calibration() is None  # no file: back to the linear rule
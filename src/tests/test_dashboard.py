@@ -0,0 +1,29 @@
+from dashboard import ResultTail
+from result_store import ResultStore
+
+
+def write_beans(path, beans):
+    store = ResultStore(str(path)).start()
+    for i, (attempts, timings) in enumerate(beans):
+        store.add(i, 1, "light", 0.9, attempts=attempts, time_taken=0.5, timings=timings, ts=1000.0 + i)
+    store.close()
+
+
+def test_bursts_count_as_re_captures(tmp_path):
+    path = tmp_path / "bean_log.db"
+    write_beans(path, [(1, {"inference": 0.05}), (1, {"inference": 0.05, "burst": 0.1}),
+                       (2, {"inference": 0.05}), (1, None)])
+    tail = ResultTail(str(path))
+    assert tail.poll() == 4
+    summary = tail.summary()
+    assert summary["retry_rate"] == 0.25 and summary["burst_rate"] == 0.25
+    assert [row[0] for row in tail.latency_table()] == ["cycle", "burst", "inference"]
+
+
+def test_poll_reads_only_new_rows(tmp_path):
+    path = tmp_path / "bean_log.db"
+    tail = ResultTail(str(path))
+    assert tail.poll() == 0  # no database yet
+    write_beans(path, [(1, None)] * 3)
+    assert tail.poll() == 3 and tail.poll() == 0
+    assert tail.beans == 3 and tail.class_counts["light"] == 3
@@ -0,0 +1,61 @@
+"""
+Export-based engines against the PyTorch reference. The decoding tests always run; the
+equivalence tests skip when ultralytics, the runtime or the weights are not available.
+"""
+import os
+import cv2
+import numpy as np
+import pytest
+from inference import create_engine, decode_output, letterbox
+from miscellaneous.check_engine_equivalence import compare
+
+WEIGHTS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                       "models", "sahad_best.pt")
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bean_image.jpg")
+
+
+def candidate(box, bean_class, confidence, scale, pad, classes=3):
+    """One raw output column for a box given in original image pixels."""
+    x1, y1, x2, y2 = box
+    column = np.zeros(4 + classes, dtype=np.float32)
+    column[:4] = [(x1 + x2) / 2 * scale + pad[0], (y1 + y2) / 2 * scale + pad[1], (x2 - x1) * scale, (y2 - y1) * scale]
+    column[4 + bean_class] = confidence
+    return column
+
+
+def test_letterbox_keeps_aspect_ratio():
+    padded, scale, (pad_x, pad_y) = letterbox(np.zeros((310, 472, 3), dtype=np.uint8), 640)
+    assert padded.shape == (640, 640, 3)
+    assert pad_x == 0 and pad_y == round((640 - 310 * scale) / 2)
+    assert padded[0, 0].tolist() == [114, 114, 114]
+
+
+def test_decode_output_maps_boxes_back_and_suppresses_duplicates():
+    shape = (310, 472, 3)
+    _, scale, pad = letterbox(np.zeros(shape, dtype=np.uint8), 640)
+    output = np.stack([
+        candidate((100, 50, 200, 150), 2, 0.9, scale, pad),
+        candidate((102, 52, 201, 150), 2, 0.8, scale, pad),  # same bean, suppressed
+        candidate((300, 100, 350, 160), 0, 0.7, scale, pad),
+        candidate((0, 0, 10, 10), 1, 0.3, scale, pad),  # below the threshold
+    ], axis=1)
+    detections = decode_output(output, 0.6, scale, pad, shape)
+    assert detections.classes == [2, 0]
+    assert detections.confidences == pytest.approx([0.9, 0.7])
+    assert np.abs(detections.boxes - [[100, 50, 200, 150], [300, 100, 350, 160]]).max() <= 1
+
+
+def test_decode_output_without_detections():
+    assert len(decode_output(np.zeros((7, 10), dtype=np.float32), 0.6, 1.0, (0, 0), (640, 640, 3))) == 0
+
+
+@pytest.mark.parametrize("engine,runtime", [("onnx", "onnxruntime"), ("openvino", "openvino")])
+def test_engine_matches_torch(engine, runtime):
+    pytest.importorskip("ultralytics")
+    pytest.importorskip(runtime)
+    if not os.path.exists(WEIGHTS):
+        pytest.skip(f"{WEIGHTS} not found")
+    image = cv2.imread(IMAGE)
+    reference = create_engine("torch", WEIGHTS, warmup=False).predict(image)
+    got = create_engine(engine, WEIGHTS, warmup=False).predict(image)
+    assert compare(reference, got, min_iou=0.9) == []
@@ -0,0 +1,56 @@
+import time
+import numpy as np
+from frame_cache import FrameCache
+
+
+def scene(shift=0, grade=60):
+    image = np.full((310, 472, 3), 200, dtype=np.uint8)
+    image[120 + shift:180 + shift, 200:260] = grade
+    return image
+
+
+def test_near_duplicate_hits():
+    cache = FrameCache()
+    cache.put(cache.key(scene()), "result", cost=0.05)
+    noisy = (scene().astype(np.int16) + np.random.default_rng(0).integers(-3, 4, (310, 472, 3))).clip(0, 255)
+    assert cache.get(cache.key(noisy.astype(np.uint8))) == "result"
+    assert cache.hits == 1 and cache.saved_time == 0.05
+
+
+def test_moved_bean_misses():
+    cache = FrameCache()
+    cache.put(cache.key(scene()), "result")
+    assert cache.get(cache.key(scene(shift=60))) is None
+    assert cache.misses == 1
+
+
+def test_other_grade_at_the_same_spot_misses():
+    cache = FrameCache()
+    cache.put(cache.key(scene(grade=60)), "dark")
+    assert cache.get(cache.key(scene(grade=140))) is None
+
+
+def test_entries_expire():
+    cache = FrameCache(max_age=0.05)
+    key = cache.key(scene())
+    cache.put(key, "result")
+    time.sleep(0.1)
+    assert cache.get(key) is None
+    assert cache.expired == 1
+
+
+def test_lru_eviction():
+    cache = FrameCache(max_entries=2)
+    keys = [cache.key(scene(shift=s)) for s in (-100, 0, 100)]
+    for i, key in enumerate(keys):
+        cache.put(key, i)
+    assert cache.evicted == 1
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == 2
+
+
+def test_clear():
+    cache = FrameCache()
+    cache.put(cache.key(scene()), "result")
+    cache.clear()
+    assert cache.stats()["entries"] == 0
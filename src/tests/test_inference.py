@@ -0,0 +1,41 @@
+import pytest
+from inference import Detections, vote_detections
+
+
+def frame(bean_class=None, confidence=0.0):
+    if bean_class is None:
+        return Detections([], [], [])
+    return Detections([bean_class], [confidence], [(10 * bean_class, 0, 10 * bean_class + 40, 40)])
+
+
+def test_unanimous_burst():
+    voted, margin, index = vote_detections([frame(1, 0.9), frame(1, 0.95), frame(1, 0.7)])
+    assert voted.classes == [1]
+    assert index == 1  # the most confident frame of the winning class
+    assert margin == pytest.approx((0.9 + 0.95 + 0.7) / 3)
+    assert voted.confidences[0] == pytest.approx(margin)
+
+
+def test_disagreement_lowers_the_margin():
+    voted, margin, index = vote_detections([frame(0, 0.5), frame(2, 0.9), frame(2, 0.8)])
+    assert voted.classes == [2]
+    assert index == 1
+    assert margin == pytest.approx((1.7 - 0.5) / 3)
+
+
+def test_missed_frames_vote_for_nothing():
+    voted, margin, index = vote_detections([frame(), frame(2, 0.9), frame()])
+    assert voted.classes == [2] and index == 1
+    assert margin == pytest.approx(0.3)
+
+
+def test_no_bean_in_any_frame():
+    voted, margin, index = vote_detections([frame(), frame()])
+    assert len(voted) == 0 and margin == 0.0 and index is None
+
+
+def test_above_keeps_order():
+    detections = Detections([2, 0, 1], [0.9, 0.4, 0.7], [(0, 0, 1, 1)] * 3)
+    kept = detections.above(0.6)
+    assert kept.classes == [2, 1] and kept.confidences == [0.9, 0.7]
+    assert detections.above(0.1) is detections
@@ -0,0 +1,73 @@
+import time
+import pytest
+from inference import Detections
+from inference_service import InferenceService
+
+
+class FakeEngine:
+    """Image i gets one detection of class i with confidence i / 10; records every batch."""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def predict_batch(self, images, conf=None):
+        self.batches.append((list(images), conf))
+        if self.fail:
+            raise RuntimeError("engine failed")
+        results = [Detections([i], [i / 10], [(0, 0, 40, 40)]) for i in images]
+        return results if conf is None else [r.above(conf) for r in results]
+
+
+@pytest.fixture
+def service():
+    services = []
+
+    def make(engine, **kwargs):
+        services.append(InferenceService(engine, **kwargs).start())
+        return services[-1]
+
+    yield make
+    for s in services:
+        s.stop()
+
+
+def test_requests_share_a_batch_and_get_their_own_result(service):
+    engine = FakeEngine()
+    inference = service(engine, max_batch=3, max_wait=1.0)
+    futures = [inference.submit(i) for i in (3, 5, 7)]
+    assert [f.result(2).classes for f in futures] == [[3], [5], [7]]
+    assert engine.batches == [([3, 5, 7], None)]
+    assert inference.stats()["batch_sizes"] == {3: 1}
+
+
+def test_a_lone_request_waits_at_most_max_wait(service):
+    inference = service(FakeEngine(), max_batch=4, max_wait=0.02)
+    start = time.perf_counter()
+    assert inference.predict(5, timeout=2).classes == [5]
+    assert time.perf_counter() - start < 0.5
+    assert inference.stats()["batch_sizes"] == {1: 1}
+
+
+def test_each_request_keeps_its_own_threshold(service):
+    engine = FakeEngine()
+    inference = service(engine, max_batch=2, max_wait=1.0)
+    low, high = inference.submit(6, conf=0.5), inference.submit(6, conf=0.7)
+    assert len(low.result(2)) == 1 and len(high.result(2)) == 0
+    assert engine.batches[0][1] == 0.5  # the batch ran at the lower threshold
+
+
+def test_an_engine_error_fails_every_request_of_the_batch(service):
+    inference = service(FakeEngine(fail=True), max_batch=2, max_wait=1.0)
+    futures = [inference.submit(1), inference.submit(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="engine failed"):
+            future.result(2)
+    assert inference.stats()["errors"] == 1
+
+
+def test_submit_after_stop_fails():
+    inference = InferenceService(FakeEngine()).start()
+    inference.stop()
+    with pytest.raises(RuntimeError):
+        inference.submit(1)
@@ -0,0 +1,42 @@
+import logging
+import types
+import pytest
+import utils.logger as logger_module
+from utils.logger import RateLimitFilter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=100.0)
+    monkeypatch.setattr(logger_module, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def record(level=logging.ERROR, lineno=10, msg="Could not read the frame"):
+    return logging.LogRecord("root", level, "final.py", lineno, msg, None, None)
+
+
+def test_burst_per_call_site_then_suppressed(clock):
+    rate_limit = RateLimitFilter(interval=10, burst=3)
+    assert [rate_limit.filter(record()) for _ in range(5)] == [True, True, True, False, False]
+    assert rate_limit.filter(record(lineno=11))  # another call site has its own budget
+    assert rate_limit.suppressed == 2
+
+
+def test_next_window_reports_the_suppressed_count(clock):
+    rate_limit = RateLimitFilter(interval=10, burst=1)
+    for _ in range(4):
+        rate_limit.filter(record())
+    clock.now += 10
+    first = record()
+    assert rate_limit.filter(first)
+    assert first.msg == "Could not read the frame (3 similar message(s) suppressed)"
+    second = record()
+    clock.now += 10
+    assert rate_limit.filter(second) and second.msg == "Could not read the frame"
+
+
+def test_info_and_debug_are_never_limited(clock):
+    rate_limit = RateLimitFilter(interval=10, burst=1)
+    assert all(rate_limit.filter(record(level=logging.INFO)) for _ in range(20))
+    assert rate_limit.suppressed == 0
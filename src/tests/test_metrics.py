@@ -0,0 +1,74 @@
+import json
+import threading
+import urllib.request
+from metrics import Histogram, MetricsRegistry
+
+
+def test_counters_get_one_total_suffix():
+    registry = MetricsRegistry()
+    registry.inc("beans_total", 2)
+    registry.inc("no_detection")
+    text = registry.render_prometheus()
+    assert "# TYPE sorter_beans_total counter\nsorter_beans_total 2\n" in text
+    assert "sorter_no_detection_total 1\n" in text
+    assert "_total_total" not in text
+
+
+def test_histogram_exposition():
+    registry = MetricsRegistry()
+    for seconds in (0.003, 0.02, 0.02, 7.0):
+        registry.observe("inference", seconds)
+    lines = registry.render_prometheus().splitlines()
+    assert "# TYPE sorter_inference_seconds histogram" in lines
+    assert 'sorter_inference_seconds_bucket{le="0.0025"} 0' in lines
+    assert 'sorter_inference_seconds_bucket{le="0.005"} 1' in lines
+    assert 'sorter_inference_seconds_bucket{le="0.025"} 3' in lines
+    assert 'sorter_inference_seconds_bucket{le="5.0"} 3' in lines
+    assert 'sorter_inference_seconds_bucket{le="+Inf"} 4' in lines
+    assert "sorter_inference_seconds_count 4" in lines
+    assert 'sorter_inference_recent_seconds{quantile="0.5"} 0.02' in lines
+
+
+def test_collectors_become_gauges():
+    registry = MetricsRegistry()
+    registry.register_collector("camera", lambda: {"fps": 29.5, "connected": True, "url": "http://x"})
+    registry.register_collector("broken", lambda: 1 / 0)
+    lines = registry.render_prometheus().splitlines()
+    assert "sorter_camera_fps 29.5" in lines and "sorter_camera_connected 1" in lines
+    assert not any("url" in line or "broken" in line for line in lines)
+
+
+def test_concurrent_increments_are_not_lost():
+    registry = MetricsRegistry()
+
+    def count():
+        for _ in range(10000):
+            registry.inc("beans_total")
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert registry.snapshot()["counters"]["beans_total"] == 40000
+
+
+def test_percentiles_use_the_recent_window():
+    hist = Histogram(window=4)
+    for value in (10, 1, 2, 3, 4):
+        hist.observe(value)
+    assert hist.percentiles((50, 99)) == {50: 3, 99: 4}
+    assert hist.count == 5
+
+
+def test_http_endpoints():
+    registry = MetricsRegistry()
+    registry.inc("beans_total")
+    server = registry.start_http_server(port=0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/metrics") as response:
+            assert "sorter_beans_total 1" in response.read().decode()
+        with urllib.request.urlopen(base + "/stats") as response:
+            assert json.load(response)["counters"] == {"beans_total": 1}
+    finally:
+        registry.stop()
@@ -0,0 +1,100 @@
+import threading
+from pipeline import BeanState, SortPipeline
+from sort_queue import BeanDetection
+
+
+def bean(bean_class, x=220, angle=0):
+    return BeanDetection(bean_class, 0.9, (x - 20, 100, x + 20, 140), angle=angle)
+
+
+class FakeMachine:
+    """Fake capture/classify/actuate callables; classify answers from a script, one entry per call."""
+
+    def __init__(self, script, present=None):
+        self.script = list(script)
+        self.present = list(present or [])
+        self.commands = []
+        self.captures = 0
+        self.classified = 0
+        self.done = []
+        self._steps = 0
+        self.captures_at_step = []  # captures and classify calls made before each carousel step
+        self.classified_at_step = []
+        self._enough = threading.Event()
+        self._steps_wanted = 0
+
+    def capture(self, newer_than):
+        self.captures += 1
+        return self.captures
+
+    def classify(self, frame):
+        self.classified += 1
+        return self.script.pop(0) if self.script else []
+
+    def is_present(self, frame, details):
+        return self.present.pop(0) if self.present else True
+
+    def actuate(self, command, settle_time):
+        self.commands.append((command, settle_time))
+        if command == "STEP":
+            self._steps += 1
+            self.captures_at_step.append(self.captures)
+            self.classified_at_step.append(self.classified)
+            if self._steps >= self._steps_wanted:
+                self._enough.set()
+
+    def run(self, steps, **kwargs):
+        """Runs the pipeline until `steps` carousel steps were sent; returns the commands up to the last one."""
+        self._steps_wanted = steps
+        pipeline = SortPipeline(self.capture, self.classify, self.actuate, on_bean_done=self.done.append,
+                                step_time=0.9, angle_time=1.0, **kwargs).start()
+        assert self._enough.wait(5)
+        pipeline.stop()
+        step_indices = [i for i, (command, _) in enumerate(self.commands) if command == "STEP"]
+        return [command for command, _ in self.commands[:step_indices[steps - 1] + 1]]
+
+
+def test_servo_then_angle_then_step_for_every_bean():
+    machine = FakeMachine([[bean(0, angle=5)], [bean(2, angle=1)], [], []])
+    commands = machine.run(4)
+    # The servo is set for the bean that drops on the next step, before that step
+    assert commands == ["1", "5", "STEP",   # bean 1: default servo, its own angle, step
+                        "0", "STEP",        # bean 2: servo for bean 1; angle 1 is a servo command, not sent
+                        "2", "STEP",        # bean 3: no detection in 2 attempts
+                        "1", "STEP"]        # bean 4: servo falls back to the default class after a failure
+    first, second, third = machine.done[:3]
+    assert (first.bean_class, first.angle, first.state) == (0, 5, BeanState.SORTED)
+    assert BeanState.ALIGNED in first.timestamps and BeanState.ALIGNED not in second.timestamps
+    assert (second.bean_class, second.angle) == (2, 0)
+    assert (third.bean_class, third.attempts) == (None, 2) and BeanState.FAILED in third.timestamps
+
+
+def test_settle_times():
+    machine = FakeMachine([[bean(0, angle=-5)]])
+    machine.run(1)
+    assert machine.commands[:3] == [("1", 0), ("-5", 1.0), ("STEP", 0.9)]
+
+
+def test_queued_bean_is_sorted_without_a_capture():
+    machine = FakeMachine([[bean(2, x=300, angle=3), bean(0, x=100, angle=4)], [bean(1)]])
+    commands = machine.run(3)
+    assert commands == ["1", "4", "STEP", "0", "STEP", "2", "STEP"]
+    assert [record.from_queue for record in machine.done[:2]] == [False, True]
+    assert machine.done[1].angle == 0  # the queued bean was not aligned
+    assert machine.captures_at_step[:2] == [1, 1]
+
+
+def test_empty_slot_is_stepped_past_without_classification():
+    machine = FakeMachine([[bean(2)]], present=[False, True])
+    commands = machine.run(3, is_present=machine.is_present)
+    assert commands == ["1", "STEP", "1", "STEP", "2", "STEP"]
+    assert machine.done[0].empty and machine.done[0].bean_class is None
+    assert machine.done[1].bean_class == 2
+
+
+def test_empty_slot_of_a_queued_bean_drops_the_queue():
+    machine = FakeMachine([[bean(0, x=100), bean(2, x=200), bean(2, x=300)], [bean(1)]])
+    commands = machine.run(3, verify_queued=lambda frame, detection, details: False)
+    assert commands == ["1", "STEP", "0", "STEP", "1", "STEP"]
+    assert machine.done[1].empty and not machine.done[1].from_queue
+    assert machine.classified_at_step[:3] == [1, 1, 2]  # the second queued bean was dropped, not sorted
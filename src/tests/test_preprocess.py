@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from preprocess import detect_and_annotate_darkest_box, find_darkest_box
+from miscellaneous.bench_darkest_box import darkest_box_loop
+
+
+@pytest.mark.parametrize("shape", [(310, 472), (97, 131), (30, 30), (45, 200)])
+@pytest.mark.parametrize("box_size", [(30, 30), (20, 40), (7, 5)])
+def test_find_darkest_box_matches_sliding_window(shape, box_size):
+    gray = np.random.default_rng(sum(shape) + sum(box_size)).integers(0, 256, size=shape, dtype=np.uint8)
+    expected = darkest_box_loop(gray, box_size)
+    got = find_darkest_box(gray, box_size)
+    assert got[1] == expected[1]
+    assert got[0] == pytest.approx(expected[0], abs=1e-9)
+
+
+def test_find_darkest_box_ties_resolve_in_row_major_order():
+    gray = np.full((90, 90), 200, dtype=np.uint8)
+    gray[45:75, 0:30] = 10
+    gray[0:30, 60:90] = 10
+    assert find_darkest_box(gray) == darkest_box_loop(gray) == (10.0, (60, 0))
+
+
+def test_find_darkest_box_image_smaller_than_box():
+    assert find_darkest_box(np.zeros((10, 10), dtype=np.uint8)) == (float("inf"), (0, 0))
+
+
+def test_detect_without_annotation_returns_only_the_value():
+    frame = np.full((310, 472, 3), 180, dtype=np.uint8)
+    frame[100:140, 200:240] = 20
+    darkest, annotated, path = detect_and_annotate_darkest_box(frame, annotate=False, save=False)
+    assert darkest == pytest.approx(20.0)
+    assert annotated is None and path is None
@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+from presence import PresenceDetector
+
+
+def slot(seed, bean=False, brightness=0):
+    """A noisy light slot, optionally with a dark bean, optionally brighter overall."""
+    rng = np.random.default_rng(seed)
+    image = np.clip(180 + brightness + rng.normal(0, 3, size=(320, 480, 3)), 0, 255).astype(np.uint8)
+    if bean:
+        cv2.ellipse(image, (240, 160), (40, 25), 30, 0, 360, (40, 60, 80), -1)
+    return image
+
+
+def learned_detector(**kwargs):
+    detector = PresenceDetector(audit_every=0, **kwargs)
+    for i in range(detector.warmup):
+        assert detector.check(slot(i))[0] is None  # still learning
+        detector.feedback(False)
+    assert detector.ready
+    return detector
+
+
+def test_learns_the_empty_slot_then_skips_it():
+    detector = learned_detector()
+    present, score = detector.check(slot(100))
+    assert present is False and score < detector.threshold
+    assert detector.check(slot(101, bean=True))[0] is True
+    assert detector.stats()["skipped"] == 1 and detector.stats()["present"] == 1
+
+
+def test_a_lighting_change_is_not_a_bean():
+    detector = learned_detector()
+    assert detector.check(slot(100, brightness=25))[0] is False
+
+
+def test_audit_runs_the_detector_on_every_nth_skip():
+    detector = learned_detector()
+    detector.audit_every = 3
+    decisions = [detector.check(slot(100 + i))[0] for i in range(6)]
+    assert decisions == [False, False, True, False, False, True]
+    detector.feedback(True)  # the detector found a bean in the audited "empty" slot
+    assert detector.audits == 2 and detector.false_skips == 1
+
+
+def test_false_alarm_is_counted_and_learned():
+    detector = learned_detector()
+    detector.check(slot(100, bean=True))
+    learned = detector.learned
+    detector.feedback(False)
+    assert detector.false_alarms == 1 and detector.learned == learned + 1
@@ -0,0 +1,71 @@
+import csv
+import json
+import sqlite3
+import time
+from result_store import ResultStore, export_csv
+
+# The beans table as the first release created it, before lane, config_version and x_after
+FIRST_SCHEMA = """
+CREATE TABLE beans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, bean_id INTEGER, class INTEGER,
+    class_name TEXT, confidence REAL, x INTEGER, y INTEGER, x1 INTEGER, y1 INTEGER, x2 INTEGER,
+    y2 INTEGER, angle REAL, attempts INTEGER, from_queue INTEGER, time_taken REAL, timings TEXT
+);
+"""
+
+
+def rows(path, columns="bean_id, class, lane, config_version, x_after"):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT {columns} FROM beans ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_old_database_is_migrated(tmp_path):
+    path = str(tmp_path / "bean_log.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(FIRST_SCHEMA)
+    conn.execute("INSERT INTO beans (ts, bean_id, class) VALUES (1.0, 1, 0)")
+    conn.commit()
+    conn.close()
+    store = ResultStore(path).start()
+    store.add(2, 1, "light", 0.9, lane="B", config_version="abc123", x_after=215)
+    store.close()
+    assert rows(path) == [(1, 0, None, None, None), (2, 1, "B", "abc123", 215)]
+
+
+def test_flushes_once_flush_size_records_are_buffered(tmp_path):
+    path = str(tmp_path / "bean_log.db")
+    store = ResultStore(path, flush_size=3, flush_interval=60).start()
+    try:
+        for i in range(3):
+            store.add(i, 1)
+        deadline = time.time() + 5
+        while store.written < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(rows(path)) == 3 and store.stats()["flushes"] == 1
+    finally:
+        store.close()
+
+
+def test_close_writes_what_is_buffered(tmp_path):
+    path = str(tmp_path / "bean_log.db")
+    store = ResultStore(path, flush_size=100, flush_interval=60).start()
+    store.add(1, 2, "medium", 0.8, box=(10, 20, 50, 60), angle=-4, timings={"inference": 0.05})
+    store.close()
+    (row,) = rows(path, "bean_id, class, x, y, angle, timings")
+    assert row[:5] == (1, 2, 30, 40, -4) and json.loads(row[5]) == {"inference": 0.05}
+    assert store.stats()["buffered"] == 0
+
+
+def test_export_csv(tmp_path):
+    path = str(tmp_path / "bean_log.db")
+    store = ResultStore(path).start()
+    store.add(1, 0, "dark", 0.95, ts=0.0)
+    store.add(2, None, ts=1.0)
+    store.close()
+    assert export_csv(path, str(tmp_path / "out.csv")) == 2
+    with open(tmp_path / "out.csv", newline="") as f:
+        table = list(csv.DictReader(f))
+    assert [(r["bean_id"], r["class_name"]) for r in table] == [("1", "dark"), ("2", "")]
@@ -0,0 +1,58 @@
+import pytest
+from arduino_emulator import ArduinoEmulator
+from serial_client import ArduinoClient, ArduinoError, ArduinoTimeout
+
+
+@pytest.fixture
+def link():
+    emulator = ArduinoEmulator(time_scale=0.01, baudrate=0)
+    client = ArduinoClient(emulator.start(), ack_timeout=1.0).open()
+    client.handshake(timeout=5.0)
+    yield emulator, client
+    client.close()
+    emulator.stop()
+
+
+def drop_first(emulator, command):
+    """Makes the emulator ignore the first copy of a command, like a line lost on the wire."""
+    process = emulator.process_command
+    dropped = []
+
+    def lossy(cmd):
+        if cmd == command and not dropped:
+            dropped.append(cmd)
+            return
+        process(cmd)
+    emulator.process_command = lossy
+    return dropped
+
+
+def test_commands_are_acknowledged(link):
+    emulator, client = link
+    assert client.command("2") == "Servo set to DARK position."
+    assert client.command("STEP") == "READY"
+    assert client.command("-12") == "Rotating angle : -12"
+    assert emulator.position_steps == 2048 // 6 + int(5.75 * -12)
+
+
+def test_idempotent_command_is_resent_after_a_timeout(link):
+    emulator, client = link
+    dropped = drop_first(emulator, "0")
+    assert client.command("0", timeout=0.3) == "Servo set to LOW position."
+    assert dropped == ["0"]
+    assert client.retried == 1 and client.timeouts == 1
+
+
+def test_motion_command_is_not_resent(link):
+    emulator, client = link
+    drop_first(emulator, "STEP")
+    with pytest.raises(ArduinoTimeout):
+        client.command("STEP", timeout=0.3)
+    assert client.retried == 0
+    assert emulator.position_steps == 0  # the stepper never moved twice for one request
+
+
+def test_unrecognized_command_fails(link):
+    _, client = link
+    with pytest.raises(ArduinoError):
+        client.command("-1")
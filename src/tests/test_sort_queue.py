@@ -0,0 +1,49 @@
+import time
+from sort_queue import BeanDetection, SortQueue
+
+
+def bean(x, bean_class=1, frame_time=None):
+    return BeanDetection(bean_class, 0.9, (x - 20, 100, x + 20, 140), angle=5, frame_time=frame_time)
+
+
+def test_first_bean_in_travel_order_is_sorted_now():
+    queue = SortQueue()
+    first = queue.add_frame([bean(300, 2), bean(100, 0), bean(200, 1)])
+    assert (first.bean_class, first.angle, first.from_queue) == (0, 5, False)
+    queued = [queue.next(), queue.next()]
+    assert [d.bean_class for d in queued] == [1, 2]
+    assert all(d.from_queue and d.angle == 0 for d in queued)
+    assert queue.next() is None
+
+
+def test_reverse_travel():
+    queue = SortQueue(reverse=True)
+    assert queue.add_frame([bean(100, 0), bean(300, 2)]).bean_class == 2
+
+
+def test_max_pending_drops_extra_beans():
+    queue = SortQueue(max_pending=1)
+    queue.add_frame([bean(100), bean(200), bean(300)])
+    assert len(queue) == 1 and queue.dropped == 1
+
+
+def test_old_beans_expire():
+    queue = SortQueue(max_age=1.0)
+    queue.add_frame([bean(100, frame_time=time.time() - 5), bean(200, frame_time=time.time() - 5)])
+    assert queue.next() is None
+    assert queue.expired == 1
+
+
+def test_reject_drops_the_rest_of_the_frame():
+    queue = SortQueue()
+    queue.add_frame([bean(100), bean(200), bean(300), bean(400)])
+    assert queue.next() is not None
+    queue.reject()
+    assert len(queue) == 0 and queue.next() is None
+    assert queue.stats()["rejected"] == 3
+
+
+def test_empty_frame():
+    queue = SortQueue()
+    assert queue.add_frame([]) is None
+    assert queue.stats()["frames"] == 1
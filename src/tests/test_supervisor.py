@@ -0,0 +1,75 @@
+import pytest
+from arduino_emulator import ArduinoEmulator
+from serial_client import ArduinoLinkError
+from supervisor import Backoff, SerialSupervisor
+
+
+@pytest.fixture
+def emulator():
+    emulator = ArduinoEmulator(time_scale=0.01, baudrate=0)
+    emulator.port = emulator.start()
+    received = []
+    process = emulator.process_command
+
+    def record(cmd):
+        received.append(cmd)
+        process(cmd)
+    emulator.process_command = record
+    emulator.received = received
+    yield emulator
+    emulator.stop()
+
+
+def supervisor(emulator, failed_connects, **kwargs):
+    """
+    A SerialSupervisor whose next failed_connects connect attempts fail, as while the board is
+    unplugged (set serial.failed_connects again to start another outage).
+    """
+    serial = SerialSupervisor(emulator.port, baudrate=0, backoff=Backoff(initial=0.05, maximum=0.05),
+                              ack_timeout=1.0, **kwargs)
+    serial.failed_connects = failed_connects
+    connect = serial._connect
+
+    def flaky_connect():
+        if serial.failed_connects > 0:
+            serial.failed_connects -= 1
+            raise ArduinoLinkError("port not found")
+        return connect()
+    serial._connect = flaky_connect
+    return serial
+
+
+def test_commands_sent_while_down_are_held_and_replayed_in_order(emulator):
+    serial = supervisor(emulator, failed_connects=3).start()
+    try:
+        futures = [serial.send(command) for command in ("2", "STEP", "0")]
+        assert [f.result(5) for f in futures] == ["Servo set to DARK position.", "READY", "Servo set to LOW position."]
+        assert [cmd for cmd in emulator.received if cmd != "START"] == ["2", "STEP", "0"]
+        assert serial.stats()["held"] == 3 and serial.stats()["connect_failures"] == 3
+    finally:
+        serial.stop()
+
+
+def test_command_waits_for_the_reconnect(emulator):
+    serial = supervisor(emulator, failed_connects=0).start()
+    try:
+        assert serial.command("1") == "Servo set to MEDIUM position."
+        serial.failed_connects = 3
+        serial.report_failure(serial.connection(), "unplugged")
+        assert serial.command("STEP") == "READY"
+        stats = serial.stats()
+        assert (stats["outages"], stats["recoveries"], stats["connect_failures"]) == (1, 1, 3)
+    finally:
+        serial.stop()
+
+
+def test_held_commands_expire_after_the_hold_timeout(emulator):
+    serial = supervisor(emulator, failed_connects=1000, hold_timeout=0.1).start()
+    try:
+        future = serial.send("0")
+        with pytest.raises(ArduinoLinkError, match="not sent"):
+            future.result(5)
+        assert serial.stats()["dropped"] == 1
+        assert "0" not in emulator.received
+    finally:
+        serial.stop()
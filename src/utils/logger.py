@@ -1,19 +1,167 @@
+"""
+Logging setup shared by every module (`from utils.logger import logging`).
+
+Log calls never do I/O on the calling thread. The root logger only has a QueueHandler, which puts
+the record on an in-memory queue. A QueueListener thread formats it and writes it to:
+
+    LOG_FILE              size-rotated text log (LOG_MAX_BYTES x LOG_BACKUPS)
+    the console           at the console verbosity (INFO by default: one line per bean; see set_console_level)
+    EVENT_FILE            one JSON object per line for structured events (log_event), also rotated
+
+Repeated warnings and errors from the same line of code (a serial port that keeps failing, a
+camera that is gone) are rate limited: at most RATE_LIMIT_BURST per RATE_LIMIT_INTERVAL seconds
+get through, and the next one that does reports how many were suppressed.
+
+Environment overrides: SORTER_LOG_LEVEL (file, default INFO), SORTER_CONSOLE_LEVEL (default INFO).
+"""
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_FILE = 'coffee_beans_classification.log'
+EVENT_FILE = 'bean_events.jsonl'
+LOG_MAX_BYTES = 10 * 1024**2
+LOG_BACKUPS = 5
+LOG_LEVEL = os.environ.get("SORTER_LOG_LEVEL", "INFO").upper()
+CONSOLE_LEVEL = os.environ.get("SORTER_CONSOLE_LEVEL", "INFO").upper()
+RATE_LIMIT_INTERVAL = 60.0
+RATE_LIMIT_BURST = 5
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` WARNING-or-worse records per call site through every `interval` seconds.
+    Runs on the calling thread, so it only does a dictionary lookup under a lock.
+    """
+
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, burst=RATE_LIMIT_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._sites = {}  # (pathname, lineno) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.interval:
+                suppressed = site[2] if site is not None else 0
+                self._sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar message(s) suppressed)"
+                return True
+            if site[1] < self.burst:
+                site[1] += 1
+                return True
+            site[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class EventFormatter(logging.Formatter):
+    """Formats log_event() records as one JSON object per line."""
+
+    def format(self, record):
+        event = {"ts": round(record.created, 3), "event": record.getMessage()}
+        event.update(getattr(record, "fields", {}))
+        return json.dumps(event, default=str)
+
+
+class _OnlyEvents(logging.Filter):
+    def filter(self, record):
+        return hasattr(record, "fields")
+
+
+class _NoEvents(logging.Filter):
+    def filter(self, record):
+        return not hasattr(record, "fields")
+
 
-# Configure logging
-logging.basicConfig(
-    filename='coffee_beans_classification.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+def _rotating(path, formatter, level=logging.NOTSET):
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                                   encoding="utf-8", delay=True)
+    handler.setFormatter(formatter)
+    handler.setLevel(level)
+    return handler
+
+
+log_queue = queue.SimpleQueue()
+rate_limiter = RateLimitFilter()
+file_handler = _rotating(LOG_FILE, logging.Formatter(FORMAT), LOG_LEVEL)
+file_handler.addFilter(_NoEvents())
+event_handler = _rotating(EVENT_FILE, EventFormatter())
+event_handler.addFilter(_OnlyEvents())
+console_handler = logging.StreamHandler(sys.stdout)
+console_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', '%H:%M:%S'))
+console_handler.setLevel(CONSOLE_LEVEL)
+console_handler.addFilter(_NoEvents())
+
+_queue_handler = logging.handlers.QueueHandler(log_queue)
+_queue_handler.addFilter(rate_limiter)
+_root = logging.getLogger()
+for _handler in list(_root.handlers):
+    _root.removeHandler(_handler)
+_root.addHandler(_queue_handler)
+
+
+def _update_root_level():
+    # Records below both handler levels are dropped before they are even queued
+    _root.setLevel(min(file_handler.level, console_handler.level))
+
+
+_update_root_level()
+
+# Structured events are kept whatever the text log level is
+events_logger = logging.getLogger('coffee_beans_classification.events')
+events_logger.setLevel(logging.INFO)
+
+listener = logging.handlers.QueueListener(log_queue, file_handler, event_handler, console_handler,
+                                          respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)  # drains the queue before the process exits
 
 # Create a logger
 logger = logging.getLogger('coffee_beans_classification')
 
+
+def set_console_level(level):
+    """Sets the console verbosity, e.g. "WARNING", "INFO" (default, one line per bean) or "DEBUG"."""
+    console_handler.setLevel(level.upper() if isinstance(level, str) else level)
+    _update_root_level()
+
+
+def set_log_level(level):
+    """Sets the level of the text log file."""
+    file_handler.setLevel(level.upper() if isinstance(level, str) else level)
+    _update_root_level()
+
+
+def log_event(event, **fields):
+    """
+    Records a structured event (a line of EVENT_FILE), e.g. log_event("bean", bean_id=12, bean_class=2).
+    The JSON encoding happens on the listener thread.
+    """
+    events_logger.info(event, extra={"fields": fields})
+
+
 # Example usage
 if __name__ == "__main__":
+    set_console_level("DEBUG")
     logger.debug('This is a debug message')
     logger.info('This is an info message')
     logger.warning('This is a warning message')
     logger.error('This is an error message')
-    logger.critical('This is a critical message')
\ No newline at end of file
+    logger.critical('This is a critical message')
+    log_event("bean", bean_id=1, bean_class=2, confidence=0.93)